@@ -0,0 +1,174 @@
+import sys
+import time
+from pathlib import Path
+
+import numpy as np
+
+from CPUEmulator import (COMP, JUMP, HALT, RAM_SIZE, ROM_SIZE, decodeProgram,
+    loadROM)
+
+
+# Decodes a single instruction word for the batch emulator.
+# A-instructions are decoded into their value, a plain int. C-instructions are
+# decoded into a tuple: (comp, usesM, destA, destD, destM, jump) where comp
+# computes the ALU output from arrays of A, D, and M values, and jump tells
+# which lanes jump given the output, or is None if the instruction never
+# jumps. The int16 arrays wrap around on overflow just like the Hack ALU, so
+# the expressions from COMP are used as they are.
+def decode(word):
+    if word & 0x8000 == 0: # A-instruction
+        return word
+
+    bits = (word >> 6) & 0x7F
+    if word & 0xE000 != 0xE000 or bits not in COMP:
+        raise Exception(f'Invalid instruction: {word:016b}')
+
+    expression = COMP[bits][0]
+    condition = JUMP[word & 0x07]
+    return (
+        eval(f'lambda A, D, M: {expression}'),
+        'M' in expression,
+        bool(word & 0x20),
+        bool(word & 0x10),
+        bool(word & 0x08),
+        None if condition is None else eval(f'lambda out: {condition}'),
+    )
+
+
+# Emulates many Hack computers running the same program in lockstep, one per
+# lane. Every lane has its own registers and RAM.
+# ram: the data memories, an (N, 32768) int16 array.
+# A, D, PC: the registers of every lane, arrays of N values.
+# cycles: the number of instructions each lane has executed.
+# halted: which lanes have reached the halting loop or run past the end of
+#         the ROM.
+# On each step, the lanes that are still running are grouped by their PC, and
+# each group's instruction is executed for all of its lanes at once.
+class BatchEmulator:
+    def __init__(self, rom, lanes):
+        if isinstance(rom, (str, Path)):
+            rom = loadROM(rom)
+        if len(rom) > ROM_SIZE:
+            raise Exception('The program does not fit in the ROM!')
+
+        self.rom = list(rom)
+        self.lanes = lanes
+        self.instructions = [decode(word) for word in self.rom]
+        # Addresses where lanes halt: the halting loop and past the end.
+        self.halts = np.array([instruction is HALT
+            for instruction in decodeProgram(self.rom)])
+
+        self.ram = np.zeros((lanes, RAM_SIZE), dtype=np.int16)
+        self.reset()
+
+    # Resets every lane: the program restarts from address 0.
+    # RAM is left untouched.
+    def reset(self):
+        self.A = np.zeros(self.lanes, dtype=np.int16)
+        self.D = np.zeros(self.lanes, dtype=np.int16)
+        self.PC = np.zeros(self.lanes, dtype=np.int32)
+        self.cycles = np.zeros(self.lanes, dtype=np.int64)
+        self.halted = np.zeros(self.lanes, dtype=bool)
+
+    # Executes the instruction at the given address for the given lanes.
+    def execute(self, address, lanes):
+        instruction = self.instructions[address]
+        if instruction.__class__ is int: # A-instruction
+            self.A[lanes] = instruction
+            self.PC[lanes] = address + 1
+            return
+
+        comp, usesM, destA, destD, destM, jump = instruction
+        A = self.A[lanes]
+        D = self.D[lanes]
+        addressA = A & 0x7FFF
+        M = self.ram[lanes, addressA] if usesM else None
+        out = comp(A, D, M)
+        if not isinstance(out, np.ndarray): # A constant: 0, 1, or -1.
+            out = np.full(len(lanes), out, dtype=np.int16)
+
+        if destM:
+            self.ram[lanes, addressA] = out
+        # The jump target is the value of A before it is updated.
+        if jump is None:
+            self.PC[lanes] = address + 1
+        else:
+            self.PC[lanes] = np.where(jump(out), addressA, address + 1)
+        if destA:
+            self.A[lanes] = out
+        if destD:
+            self.D[lanes] = out
+
+    # Executes one instruction in every lane that is still running and has
+    # executed fewer than maxCycles instructions. Returns False once there are
+    # no such lanes left.
+    def step(self, maxCycles=None):
+        if maxCycles is None:
+            running = np.flatnonzero(~self.halted)
+        else:
+            running = np.flatnonzero(~self.halted & (self.cycles < maxCycles))
+        halting = self.halts[self.PC[running]]
+        if halting.any():
+            self.halted[running[halting]] = True
+            running = running[~halting]
+        if len(running) == 0:
+            return False
+
+        pcs = self.PC[running]
+        first = pcs[0]
+        if (pcs == first).all(): # Every lane agrees: one group.
+            self.execute(first, running)
+        else: # The lanes diverged: one group per PC.
+            order = np.argsort(pcs, kind='stable')
+            pcs = pcs[order]
+            running = running[order]
+            bounds = np.flatnonzero(pcs[1:] != pcs[:-1]) + 1
+            for group in np.split(np.arange(len(running)), bounds):
+                self.execute(pcs[group[0]], running[group])
+
+        self.cycles[running] += 1
+        return True
+
+    # Runs every lane until it halts, or until it has executed maxCycles
+    # instructions. Returns the final RAM of every lane and their cycle
+    # counts.
+    def run(self, maxCycles=None):
+        while self.step(maxCycles):
+            pass
+
+        return self.ram, self.cycles
+
+
+# Description: Fuzzes a Hack program that reads its inputs from R0 and R1,
+#              such as Mult or Max, by running it on the given number of
+#              random input pairs in lockstep. Reports the speed of the batch
+#              emulator and the distribution of cycle counts.
+# Input: {file}.hack lanes [cycles]
+def main():
+    # Invalid number of arguments given.
+    if len(sys.argv) not in (3, 4):
+        print('Usage: python ' + Path(__file__).name
+            + ' {file}.hack lanes [cycles]')
+        return
+
+    lanes = int(sys.argv[2])
+    maxCycles = int(sys.argv[3]) if len(sys.argv) == 4 else None
+
+    emulator = BatchEmulator(sys.argv[1], lanes)
+    generator = np.random.default_rng(0)
+    emulator.ram[:, 0] = generator.integers(0, 100, lanes)
+    emulator.ram[:, 1] = generator.integers(0, 100, lanes)
+
+    start = time.perf_counter()
+    ram, cycles = emulator.run(maxCycles)
+    elapsed = time.perf_counter() - start
+
+    total = int(cycles.sum())
+    print(f'{lanes} lanes, {total} instructions in {elapsed:.3f} s'
+        + f' ({total / elapsed / 1e6:.2f} M instructions/s)')
+    print(f'cycles per lane: min {cycles.min()}, max {cycles.max()},'
+        + f' mean {cycles.mean():.1f}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,210 @@
+import sys
+import time
+from pathlib import Path
+
+import numpy as np
+
+from HDLSimulator import PROJECTS, Simulator, compileChip
+
+# Chips with at most this many input bits are checked exhaustively.
+EXHAUSTIVE_BITS = 22
+
+
+# Reference models of the combinational chips of projects 01 and 02, for
+# arrays of test vectors. Each takes the input pins (name -> array of
+# unsigned values) and returns the output pins.
+def mux(sel, *inputs):
+    return np.choose(sel, inputs)
+
+
+def dmux(input, sel, names):
+    return {name: np.where(sel == i, input, 0) for i, name in enumerate(names)}
+
+
+def alu(p):
+    x = np.where(p['zx'] == 1, 0, p['x'])
+    x = np.where(p['nx'] == 1, ~x & 0xFFFF, x)
+    y = np.where(p['zy'] == 1, 0, p['y'])
+    y = np.where(p['ny'] == 1, ~y & 0xFFFF, y)
+    out = np.where(p['f'] == 1, (x + y) & 0xFFFF, x & y)
+    out = np.where(p['no'] == 1, ~out & 0xFFFF, out)
+    return {'out': out, 'zr': (out == 0).astype(np.int64), 'ng': out >> 15}
+
+
+REFERENCES = {
+    'Not': lambda p: {'out': 1 - p['in']},
+    'And': lambda p: {'out': p['a'] & p['b']},
+    'Or': lambda p: {'out': p['a'] | p['b']},
+    'Xor': lambda p: {'out': p['a'] ^ p['b']},
+    'Mux': lambda p: {'out': mux(p['sel'], p['a'], p['b'])},
+    'DMux': lambda p: dmux(p['in'], p['sel'], 'ab'),
+    'Not16': lambda p: {'out': ~p['in'] & 0xFFFF},
+    'And16': lambda p: {'out': p['a'] & p['b']},
+    'Or16': lambda p: {'out': p['a'] | p['b']},
+    'Mux16': lambda p: {'out': mux(p['sel'], p['a'], p['b'])},
+    'Or8Way': lambda p: {'out': (p['in'] != 0).astype(np.int64)},
+    'Mux4Way16': lambda p: {'out': mux(p['sel'], *[p[x] for x in 'abcd'])},
+    'Mux8Way16': lambda p: {'out': mux(p['sel'],
+        *[p[x] for x in 'abcdefgh'])},
+    'DMux4Way': lambda p: dmux(p['in'], p['sel'], 'abcd'),
+    'DMux8Way': lambda p: dmux(p['in'], p['sel'], 'abcdefgh'),
+    'HalfAdder': lambda p: {'sum': p['a'] ^ p['b'], 'carry': p['a'] & p['b']},
+    'FullAdder': lambda p: {'sum': (p['a'] + p['b'] + p['c']) & 1,
+        'carry': (p['a'] + p['b'] + p['c']) >> 1},
+    'Add16': lambda p: {'out': (p['a'] + p['b']) & 0xFFFF},
+    'Inc16': lambda p: {'out': (p['in'] + 1) & 0xFFFF},
+    'ALU': alu,
+}
+
+
+# Packs one bit of many test vectors into a Python int: bit k of the result
+# is the given bit of values[k].
+def packBit(values, bit):
+    bits = ((values >> bit) & 1).astype(np.uint8)
+    return int.from_bytes(np.packbits(bits, bitorder='little').tobytes(),
+        'little')
+
+
+# Unpacks the bits of a Python int into an array of n 0s and 1s.
+def unpackBit(packed, n):
+    data = np.frombuffer(packed.to_bytes((n + 7) // 8, 'little'),
+        dtype=np.uint8)
+    return np.unpackbits(data, bitorder='little')[:n].astype(np.int64)
+
+
+# Simulates a compiled chip on many test vectors at once. Every bit of the
+# chip holds one bit of each vector, packed into a Python int, so each gate
+# is a single bitwise operation on all the vectors.
+# lanes: the number of test vectors.
+class BitParallelSimulator:
+    def __init__(self, compiled, lanes):
+        if compiled.memoryKinds:
+            raise Exception(f'{compiled.name} has memories, which can only be'
+                + ' simulated one vector at a time!')
+        self.simulator = Simulator(compiled)
+        self.compiled = compiled
+        self.lanes = lanes
+        self.ones = (1 << lanes) - 1
+
+    # Sets an input pin to an array of values, one per vector.
+    def set(self, pin, values):
+        values = np.asarray(values, dtype=np.int64)
+        state = self.simulator.state
+        for bit, slot in enumerate(self.compiled.pins[pin]):
+            state[slot] = packBit(values, bit)
+
+    # Sets an input bit directly to its packed form.
+    def setPacked(self, pin, bit, packed):
+        self.simulator.state[self.compiled.pins[pin][bit]] = packed
+
+    # Returns the values of a pin, one per vector, unsigned.
+    def get(self, pin):
+        state = self.simulator.state
+        values = np.zeros(self.lanes, dtype=np.int64)
+        for bit, slot in enumerate(self.compiled.pins[pin]):
+            values = values | unpackBit(state[slot] & self.ones,
+                self.lanes) << bit
+        return values
+
+    def eval(self):
+        self.simulator.evaluate(self.simulator.state, [], self.ones)
+
+    def tick(self):
+        state = self.simulator.state
+        self.eval()
+        start, end = self.compiled.dffInputs
+        self.simulator.pending = state[start:end]
+
+    def tock(self):
+        simulator = self.simulator
+        if simulator.pending is not None:
+            start, end = self.compiled.dffOutputs
+            simulator.state[start:end] = simulator.pending
+            simulator.pending = None
+        self.eval()
+
+
+# Returns the packed form of input bit j of an exhaustive truth table with
+# 2^n rows, where row k holds the inputs whose bits are those of k: 2^j zeros,
+# then 2^j ones, repeated.
+def truthTableBit(n, j):
+    period = 2 << j
+    block = ((1 << (1 << j)) - 1) << (1 << j)
+    repeat = ((1 << (1 << n)) - 1) // ((1 << period) - 1)
+    return block * repeat
+
+
+# Checks a chip against its reference model on the given number of random
+# vectors, or on its whole truth table if it has few enough input bits and
+# vectors is None. Returns (vectors, mismatches, seconds spent simulating).
+def check(compiled, vectors=None, seed=0):
+    inputBits = sum(width for pin, width in compiled.inputs)
+    exhaustive = vectors is None and inputBits <= EXHAUSTIVE_BITS
+    if vectors is None:
+        vectors = 1 << inputBits if exhaustive else 1 << 16
+
+    simulator = BitParallelSimulator(compiled, vectors)
+    inputs = {}
+    if exhaustive:
+        rows = np.arange(vectors, dtype=np.int64)
+        j = 0
+        for pin, width in compiled.inputs:
+            inputs[pin] = (rows >> j) & ((1 << width) - 1)
+            for bit in range(width):
+                simulator.setPacked(pin, bit, truthTableBit(inputBits, j))
+                j = j + 1
+    else:
+        generator = np.random.default_rng(seed)
+        for pin, width in compiled.inputs:
+            inputs[pin] = generator.integers(0, 1 << width, vectors)
+            simulator.set(pin, inputs[pin])
+
+    start = time.perf_counter()
+    simulator.eval()
+    elapsed = time.perf_counter() - start
+
+    expected = REFERENCES[compiled.name](inputs)
+    mismatches = np.zeros(vectors, dtype=bool)
+    for pin, width in compiled.outputs:
+        mismatches |= simulator.get(pin) != (expected[pin]
+            & ((1 << width) - 1))
+    return vectors, int(mismatches.sum()), elapsed
+
+
+# Description: Checks combinational chips against reference models, all
+#              their input combinations at once when they have at most 22
+#              input bits, or else the given number of random vectors, and
+#              reports the simulation throughput in vectors per second.
+#              By default, every chip of projects 01 and 02 is checked.
+# Input: [{chip}.hdl ...] [--vectors n]
+def main():
+    args = sys.argv[1:]
+    vectors = None
+    if '--vectors' in args:
+        i = args.index('--vectors')
+        vectors = int(args[i + 1])
+        del args[i:i + 2]
+
+    chips = args or [path for project in ('01', '02')
+        for path in sorted((PROJECTS / project).glob('*.hdl'))
+        if path.stem in REFERENCES]
+    if any(Path(chip).stem not in REFERENCES for chip in chips):
+        print('Usage: python ' + Path(__file__).name
+            + ' [{chip}.hdl ...] [--vectors n]')
+        print('Chips with a reference model: ' + ', '.join(REFERENCES))
+        return
+
+    failed = 0
+    for chip in chips:
+        compiled = compileChip(chip)
+        n, mismatches, elapsed = check(compiled, vectors)
+        status = 'PASS' if mismatches == 0 else 'FAIL'
+        failed = failed + (mismatches != 0)
+        print(f'{status} {compiled.name:10} {n:9} vectors, {mismatches}'
+            + f' mismatches, {elapsed:.4f} s'
+            + f' ({n / elapsed / 1e6:.1f} M vectors/s)')
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,709 @@
+import mmap
+import struct
+import sys
+import time
+from array import array
+from pathlib import Path
+
+# Sizes of the Hack computer's memories, in 16-bit words.
+ROM_SIZE = 32768
+RAM_SIZE = 32768
+
+# Memory map.
+SCREEN = 16384
+KBD = 24576
+
+# Header of a snapshot file: magic, version, byte order of the RAM (0 for
+# little-endian, 1 for big-endian), halted, A, D, PC, cycles, ROM size.
+# It's followed by the RAM and then the ROM, both 16-bit words in the byte
+# order given. The header is padded to 64 bytes so the RAM stays aligned.
+SNAPSHOT_HEADER = struct.Struct('<8sBBBxhhIqI32x')
+SNAPSHOT_MAGIC = b'HACKSNAP'
+SNAPSHOT_VERSION = 1
+
+
+# The ALU's computations, keyed by the 7 bits a,c1..c6 of a C-instruction.
+# The tuple: (Python expression over A, D, and M, whether it can overflow).
+# Only additions and subtractions can overflow the signed 16-bit range, so
+# they are the only ones that need to be wrapped.
+COMP = {
+    0b0101010: ('0'    , False),
+    0b0111111: ('1'    , False),
+    0b0111010: ('-1'   , False),
+    0b0001100: ('D'    , False),
+    0b0110000: ('A'    , False),
+    0b0001101: ('~D'   , False),
+    0b0110001: ('~A'   , False),
+    0b0001111: ('-D'   , True),
+    0b0110011: ('-A'   , True),
+    0b0011111: ('D + 1', True),
+    0b0110111: ('A + 1', True),
+    0b0001110: ('D - 1', True),
+    0b0110010: ('A - 1', True),
+    0b0000010: ('D + A', True),
+    0b0010011: ('D - A', True),
+    0b0000111: ('A - D', True),
+    0b0000000: ('D & A', False),
+    0b0010101: ('D | A', False),
+    0b1110000: ('M'    , False),
+    0b1110001: ('~M'   , False),
+    0b1110011: ('-M'   , True),
+    0b1110111: ('M + 1', True),
+    0b1110010: ('M - 1', True),
+    0b1000010: ('D + M', True),
+    0b1010011: ('D - M', True),
+    0b1000111: ('M - D', True),
+    0b1000000: ('D & M', False),
+    0b1010101: ('D | M', False),
+}
+
+# The jump conditions, keyed by the 3 jump bits of a C-instruction.
+JUMP = {
+    0b000: None,
+    0b001: 'out > 0',
+    0b010: 'out == 0',
+    0b011: 'out >= 0',
+    0b100: 'out < 0',
+    0b101: 'out != 0',
+    0b110: 'out <= 0',
+    0b111: 'True',
+}
+
+# Marks the halting instruction in a decoded program. See decodeProgram().
+HALT = None
+
+# The idioms of the VM translators that are fused into superinstructions
+# (see fuseProgram()): (name, instruction words). None stands for any
+# A-instruction. Translators differ in how they push D, so both ways are
+# fused.
+IDIOMS = [
+    # @SP, A=M, M=D, @SP, M=M+1
+    ('push D', (0, 0b1111110000100000, 0b1110001100001000, 0,
+        0b1111110111001000)),
+    # @SP, AM=M+1, A=A-1, M=D
+    ('push D', (0, 0b1111110111101000, 0b1110110010100000,
+        0b1110001100001000)),
+    # @SP, AM=M-1, D=M
+    ('pop to D', (0, 0b1111110010101000, 0b1111110000010000)),
+    # @X, D=M
+    ('load', (None, 0b1111110000010000)),
+]
+
+
+# Returns the Python statements that execute a C-instruction, as a list of
+# lines. They read and update the local variables A, D, ram, and pc, and
+# leave the ALU output in out.
+# nextPC: the expression for the address of the next instruction, or None if
+#         the PC shouldn't be updated at all. Only valid for non-jumps.
+# knownA: the value of A, if it is known when the code is generated.
+def cSource(word, nextPC='pc + 1', knownA=None):
+    bits = (word >> 6) & 0x7F
+    if word & 0xE000 != 0xE000 or bits not in COMP:
+        raise Exception(f'Invalid instruction: {word:016b}')
+
+    address = 'A & 0x7FFF' if knownA is None else str(knownA)
+    expression, overflows = COMP[bits]
+    expression = expression.replace('M', f'ram[{address}]')
+    if overflows:
+        expression = f'(({expression} + 32768) & 0xFFFF) - 32768'
+    condition = JUMP[word & 0x07]
+
+    lines = [f'out = {expression}']
+    if word & 0x08: # dest M
+        lines.append(f'ram[{address}] = out')
+    # The jump target is the value of A before it is updated.
+    if condition == 'True':
+        lines.append(f'pc = {address}')
+    elif condition is not None:
+        lines.append(f'pc = {address} if {condition} else {nextPC}')
+    elif nextPC is not None:
+        lines.append(f'pc = {nextPC}')
+    if word & 0x20: # dest A
+        lines.append('A = out')
+    if word & 0x10: # dest D
+        lines.append('D = out')
+    return lines
+
+
+# Tells whether the instruction word is a C-instruction that can jump.
+def isJump(word):
+    return word & 0x8000 != 0 and word & 0x07 != 0
+
+
+# Decodes a single instruction word.
+# A-instructions are decoded into their value, a plain int. C-instructions are
+# decoded into a handler, a function generated for that exact instruction:
+# handler(A, D, ram, pc) executes it and returns the new (A, D, pc).
+def decode(word):
+    if word & 0x8000 == 0: # A-instruction
+        return word
+
+    source = 'def handler(A, D, ram, pc):\n'
+    for line in cSource(word):
+        source = source + f'    {line}\n'
+    source = source + '    return A, D, pc\n'
+
+    namespace = {}
+    exec(source, namespace)
+    return namespace['handler']
+
+
+# Decodes a whole ROM. Each distinct word is decoded once.
+# The idiomatic end of a Hack program, the infinite loop
+#     (END)
+#     @END
+#     0;JMP
+# is decoded as HALT so that the emulator can stop there. So is every address
+# past the end of the program, which saves the emulator from checking the PC
+# against the size of the program.
+def decodeProgram(rom):
+    cache = {}
+    program = []
+    for word in rom:
+        instruction = cache.get(word)
+        if instruction is None:
+            instruction = decode(word)
+            cache[word] = instruction
+        program.append(instruction)
+
+    for address in range(1, len(rom)):
+        if (rom[address - 1] == address - 1
+            and rom[address] == 0b1110101010000111
+        ):
+            program[address] = HALT
+
+    program.extend([HALT] * (ROM_SIZE + 1 - len(program)))
+    return program
+
+
+# Finds the addresses where basic blocks of the ROM must start: the address of
+# every instruction that follows a jump, and every static jump target, i.e.
+# the address loaded by an A-instruction right before a jump. Returns a
+# bytearray of flags, one per ROM address.
+# Computed targets, such as return addresses, aren't known in advance. A
+# block is compiled from whatever address execution enters, so those are
+# still handled, at the cost of some blocks overlapping.
+def findLeaders(rom):
+    leaders = bytearray(ROM_SIZE + 1)
+    leaders[0] = 1
+    for address, word in enumerate(rom):
+        if isJump(word):
+            leaders[address + 1] = 1
+            if address > 0 and rom[address - 1] & 0x8000 == 0:
+                leaders[rom[address - 1]] = 1
+    return leaders
+
+
+# Compiles the basic block starting at the given address into one function:
+# block(A, D, ram) executes the whole block and returns the new (A, D, pc).
+# The block ends after a jump, before the next leader or the halting loop,
+# or after maxLength instructions. Within a block, A is tracked as a constant
+# after each A-instruction, so RAM accesses through it are resolved when the
+# code is generated. Returns (block, number of instructions in it).
+def compileBlock(rom, program, leaders, start, maxLength=256):
+    lines = []
+    knownA = None
+    address = start
+    while True:
+        word = rom[address]
+        if word & 0x8000 == 0: # A-instruction
+            lines.append(f'A = {word}')
+            knownA = word
+        elif isJump(word):
+            lines.extend(cSource(word, str(address + 1), knownA))
+            address = address + 1
+            break
+        else:
+            lines.extend(cSource(word, None, knownA))
+            if word & 0x20: # dest A
+                knownA = None
+
+        address = address + 1
+        if (address >= len(rom) or leaders[address]
+            or program[address] is HALT or address - start >= maxLength
+        ):
+            lines.append(f'pc = {address}')
+            break
+
+    source = 'def block(A, D, ram):\n'
+    for line in lines:
+        source = source + f'    {line}\n'
+    source = source + '    return A, D, pc\n'
+
+    namespace = {}
+    exec(source, namespace)
+    return (namespace['block'], address - start)
+
+
+# Compiles a sequence of instructions without jumps into a
+# superinstruction: handler(A, D, ram, pc) executes them all and returns the
+# new (A, D, pc), like the handler of a single instruction (see decode()).
+# A is tracked as a constant after each A-instruction, like in
+# compileBlock().
+def fuse(words):
+    lines = []
+    knownA = None
+    for word in words:
+        if word & 0x8000 == 0: # A-instruction
+            lines.append(f'A = {word}')
+            knownA = word
+        else:
+            lines.extend(cSource(word, None, knownA))
+            if word & 0x20: # dest A
+                knownA = None
+    lines.append(f'pc = pc + {len(words)}')
+
+    source = 'def handler(A, D, ram, pc):\n'
+    for line in lines:
+        source = source + f'    {line}\n'
+    source = source + '    return A, D, pc\n'
+
+    namespace = {}
+    exec(source, namespace)
+    return namespace['handler']
+
+
+# Finds the idioms of a ROM (see IDIOMS) and fuses each into a
+# superinstruction. Returns a copy of the decoded program where the first
+# instruction of each idiom is replaced by (handler, length), and the list
+# of the idioms fused, as (address, name).
+# An idiom is only fused if no jump target known in advance (see
+# findLeaders()) falls inside it, and idioms don't overlap. The instructions
+# inside an idiom are left decoded one by one, so that execution entering
+# one through a computed jump still runs them.
+def fuseProgram(rom, program, leaders):
+    fused = list(program)
+    fusions = []
+    cache = {}
+    address = 0
+    while address < len(rom):
+        for name, pattern in IDIOMS:
+            end = address + len(pattern)
+            words = tuple(rom[address:end])
+            if (len(words) == len(pattern)
+                and all(word == expected
+                    or (expected is None and word & 0x8000 == 0)
+                    for word, expected in zip(words, pattern))
+                and not any(leaders[address + 1:end])
+                and HALT not in program[address:end]
+            ):
+                handler = cache.get(words)
+                if handler is None:
+                    handler = fuse(words)
+                    cache[words] = handler
+                fused[address] = (handler, len(words))
+                fusions.append((address, name))
+                address = end
+                break
+        else:
+            address = address + 1
+    return fused, fusions
+
+
+# Reads a program into a list of instruction words.
+# .hack files are text, one 16-bit binary number per line. Any other file is
+# taken to be a packed binary: 2 bytes per word, big-endian.
+def loadROM(path):
+    path = Path(path)
+    if path.suffix == '.hack':
+        with path.open() as f:
+            return [int(line, 2) for line in f if line.strip() != '']
+
+    words = array('H', path.read_bytes())
+    if sys.byteorder == 'little':
+        words.byteswap()
+    return list(words)
+
+
+# Writes a program as a packed binary, readable by loadROM().
+def savePacked(rom, path):
+    words = array('H', rom)
+    if sys.byteorder == 'little':
+        words.byteswap()
+    Path(path).write_bytes(words.tobytes())
+
+
+# Emulates the Hack CPU running a program from ROM.
+# rom: the program, as a list of instruction words.
+# ram: the data memory, signed 16-bit words.
+# A, D, PC: the registers.
+# cycles: the number of instructions executed since the last reset.
+# halted: True once the program has reached its halting loop or run past the
+#         end of the ROM.
+# compiled: if True, the default, run() executes whole basic blocks
+#           compiled into Python functions. This is what reaches several
+#           million instructions per second: on Pong, about 6-8 M/s here.
+#           If False, it interprets one instruction at a time, at about
+#           2-3 M/s. The interpreter is the reference that the blocks are
+#           checked against (see selfCheck()), and what runs single steps.
+# fused: if True, run() interprets the program with the idioms of the VM
+#        translators fused into superinstructions (see fuseProgram()),
+#        whether compiled or not. Off by default: it saves about a quarter
+#        of the interpreter's dispatches, but compiled blocks save more.
+#        fusions: the idioms fused, as (address, name).
+class CPUEmulator:
+    def __init__(self, rom=(), compiled=True, fused=False):
+        self.ram = array('h', bytes(2 * RAM_SIZE))
+        self.compiled = compiled
+        self.fused = fused
+        self.load(rom)
+
+    # Loads a program, given as a list of words or as a file path, and resets
+    # the CPU. RAM is left untouched.
+    def load(self, rom):
+        if isinstance(rom, (str, Path)):
+            rom = loadROM(rom)
+        if len(rom) > ROM_SIZE:
+            raise Exception('The program does not fit in the ROM!')
+
+        self.rom = list(rom)
+        self.program = decodeProgram(self.rom)
+        self.leaders = findLeaders(self.rom)
+        if self.fused:
+            self.fusedProgram, self.fusions = fuseProgram(self.rom,
+                self.program, self.leaders)
+        self.reset()
+
+    # Saves the complete state of the machine into a snapshot file: the
+    # registers, the cycle count, the RAM, and the ROM.
+    def save(self, path):
+        byteorder = 0 if sys.byteorder == 'little' else 1
+        with open(path, 'wb') as f:
+            f.write(SNAPSHOT_HEADER.pack(SNAPSHOT_MAGIC, SNAPSHOT_VERSION,
+                byteorder, self.halted, self.A, self.D, self.PC, self.cycles,
+                len(self.rom)))
+            f.write(self.ram.tobytes())
+            f.write(array('H', self.rom).tobytes())
+
+    # Restores the state of the machine from a snapshot file.
+    # The file is memory-mapped copy-on-write, and the RAM is used straight
+    # from the mapping: nothing is copied until the program writes to it, and
+    # then only the pages written to, which are never written back to the
+    # file. Many runs can thus be forked cheaply from the same snapshot.
+    # The program is only decoded again if it differs from the current one.
+    def restore(self, path):
+        with open(path, 'rb') as f:
+            snapshot = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_COPY)
+
+        (magic, version, byteorder, halted, A, D, PC, cycles, romSize
+            ) = SNAPSHOT_HEADER.unpack_from(snapshot)
+        if magic != SNAPSHOT_MAGIC or version != SNAPSHOT_VERSION:
+            raise Exception('The file is not a snapshot!')
+
+        ramStart = SNAPSHOT_HEADER.size
+        romStart = ramStart + 2 * RAM_SIZE
+        rom = array('H', snapshot[romStart:romStart + 2 * romSize])
+        if byteorder == (0 if sys.byteorder == 'little' else 1):
+            ram = memoryview(snapshot)[ramStart:romStart].cast('h')
+        else: # Saved on a machine with another byte order: copied.
+            ram = array('h', snapshot[ramStart:romStart])
+            ram.byteswap()
+            rom.byteswap()
+
+        if list(rom) != self.rom:
+            self.load(rom)
+        self.ram = ram
+        self.A = A
+        self.D = D
+        self.PC = PC
+        self.cycles = cycles
+        self.halted = bool(halted)
+
+    # Creates an emulator from a snapshot file. See restore().
+    @staticmethod
+    def fromSnapshot(path, compiled=True, fused=False):
+        cpu = CPUEmulator(compiled=compiled, fused=fused)
+        cpu.restore(path)
+        return cpu
+
+    # Resets the CPU: the program restarts from address 0.
+    # The compiled blocks are discarded.
+    def reset(self):
+        self.A = 0
+        self.D = 0
+        self.PC = 0
+        self.cycles = 0
+        self.halted = False
+        # The compiled block starting at each address, or None if there's
+        # none yet. Blocks are compiled the first time they're entered.
+        self.blocks = [None] * (ROM_SIZE + 1)
+
+    # Executes at most maxCycles instructions, or runs until the program
+    # halts if maxCycles is None. Returns the number of instructions executed.
+    def run(self, maxCycles=None):
+        if self.fused:
+            return self.interpretFused(maxCycles)
+        if self.compiled:
+            return self.runBlocks(maxCycles)
+        return self.interpret(maxCycles)
+
+    # Executes instructions one at a time. See run(). It's the reference
+    # for the other ways of running, not the fast one: see compiled.
+    def interpret(self, maxCycles=None):
+        program = self.program
+        ram = self.ram
+        A = self.A
+        D = self.D
+        pc = self.PC
+
+        # A negative budget never reaches 0, so it runs until halted.
+        n = -1 if maxCycles is None else maxCycles
+        start = n
+        halted = False
+        while n:
+            instruction = program[pc]
+            if instruction.__class__ is int: # A-instruction
+                A = instruction
+                pc = pc + 1
+            elif instruction is HALT:
+                halted = True
+                break
+            else: # C-instruction
+                A, D, pc = instruction(A, D, ram, pc)
+
+            n = n - 1
+
+        self.A = A
+        self.D = D
+        self.PC = pc
+        self.halted = halted
+        executed = start - n
+        self.cycles = self.cycles + executed
+        return executed
+
+    # Executes instructions one at a time, and fused idioms all at once.
+    # See run(). A superinstruction is only executed if the remaining budget
+    # covers all of it. The last few instructions of a budget are
+    # interpreted instead.
+    def interpretFused(self, maxCycles=None):
+        program = self.fusedProgram
+        ram = self.ram
+        A = self.A
+        D = self.D
+        pc = self.PC
+
+        n = -1 if maxCycles is None else maxCycles
+        start = n
+        halted = False
+        while n:
+            instruction = program[pc]
+            if instruction.__class__ is int: # A-instruction
+                A = instruction
+                pc = pc + 1
+                n = n - 1
+            elif instruction.__class__ is tuple: # Superinstruction
+                handler, length = instruction
+                if 0 < n < length:
+                    break
+                A, D, pc = handler(A, D, ram, pc)
+                n = n - length
+            elif instruction is HALT:
+                halted = True
+                break
+            else: # C-instruction
+                A, D, pc = instruction(A, D, ram, pc)
+                n = n - 1
+
+        self.A = A
+        self.D = D
+        self.PC = pc
+        self.halted = halted
+        executed = start - n
+        self.cycles = self.cycles + executed
+        if n > 0 and not halted:
+            executed = executed + self.interpret(n)
+        return executed
+
+    # Executes compiled basic blocks. See run().
+    # A block is only entered if the remaining budget covers all of it. The
+    # last few instructions of a budget are interpreted instead.
+    def runBlocks(self, maxCycles=None):
+        blocks = self.blocks
+        program = self.program
+        ram = self.ram
+        A = self.A
+        D = self.D
+        pc = self.PC
+
+        n = -1 if maxCycles is None else maxCycles
+        start = n
+        halted = False
+        while n:
+            block = blocks[pc]
+            if block is None:
+                if program[pc] is HALT:
+                    halted = True
+                    break
+                block = compileBlock(self.rom, program, self.leaders, pc)
+                blocks[pc] = block
+
+            function, length = block
+            if 0 < n < length:
+                break
+            A, D, pc = function(A, D, ram)
+            n = n - length
+
+        self.A = A
+        self.D = D
+        self.PC = pc
+        self.halted = halted
+        executed = start - n
+        self.cycles = self.cycles + executed
+        if n > 0 and not halted:
+            executed = executed + self.interpret(n)
+        return executed
+
+    # Executes a single instruction.
+    def step(self):
+        return self.interpret(1)
+
+
+# Runs each program for the given number of cycles, or until it halts, in
+# the interpreter, with compiled blocks, and with fused idioms, and compares
+# the final states. Returns the list of programs whose states differ.
+def selfCheck(paths, maxCycles=1000000):
+    mismatches = []
+    for path in paths:
+        states = []
+        for compiled, fused in ((False, False), (True, False), (False, True)):
+            cpu = CPUEmulator(path, compiled, fused)
+            cpu.run(maxCycles)
+            states.append((cpu.A, cpu.D, cpu.PC, cpu.cycles, cpu.halted,
+                cpu.ram))
+        if any(state != states[0] for state in states[1:]):
+            mismatches.append(path)
+
+    return mismatches
+
+
+# Reports how much of a program the fused idioms cover (see fuseProgram()):
+# the instructions of the ROM in each idiom, and the instructions executed
+# within them while the program runs for the given number of cycles, with
+# the speed of the interpreter with and without them, and of the compiled
+# blocks, which fusing doesn't reach. Returns a list of lines.
+def fusionReport(path, maxCycles=1000000):
+    cpu = CPUEmulator(path, fused=True)
+    rom = cpu.rom
+
+    # Each superinstruction is wrapped to count its executions.
+    counts = dict.fromkeys((address for address, name in cpu.fusions), 0)
+    def counter(handler, address):
+        def counted(A, D, ram, pc):
+            counts[address] = counts[address] + 1
+            return handler(A, D, ram, pc)
+        return counted
+    for address, name in cpu.fusions:
+        handler, length = cpu.fusedProgram[address]
+        cpu.fusedProgram[address] = (counter(handler, address), length)
+    executed = cpu.run(maxCycles)
+
+    # The percentage of the instructions executed; none if maxCycles is 0.
+    def share(n):
+        return 100 * n / executed if executed else 0.0
+
+    table = {}
+    for address, name in cpu.fusions:
+        length = cpu.fusedProgram[address][1]
+        sites, static, dynamic = table.get(name, (0, 0, 0))
+        table[name] = (sites + 1, static + length,
+            dynamic + length * counts[address])
+
+    lines = [f'{Path(path).name}: {len(rom)} instructions,'
+        + f' {executed} executed',
+        f'  {"idiom":<10} {"sites":>6} {"in ROM":>8} {"%":>6}'
+        + f' {"executed":>10} {"%":>6}']
+    total = (0, 0, 0)
+    for name, row in table.items():
+        lines.append(f'  {name:<10} {row[0]:6} {row[1]:8}'
+            + f' {100 * row[1] / len(rom):6.2f} {row[2]:10}'
+            + f' {share(row[2]):6.2f}')
+        total = tuple(a + b for a, b in zip(total, row))
+    lines.append(f'  {"total":<10} {total[0]:6} {total[1]:8}'
+        + f' {100 * total[1] / len(rom):6.2f} {total[2]:10}'
+        + f' {share(total[2]):6.2f}')
+    if executed == 0:
+        return lines
+    dispatches = executed - total[2] + sum(counts.values())
+    lines.append(f'  {dispatches / executed:.3f} dispatches per instruction')
+
+    speeds = {}
+    for mode in ('interpreter', 'fused', 'blocks'):
+        cpu = CPUEmulator(path, compiled=mode == 'blocks',
+            fused=mode == 'fused')
+        start = time.perf_counter()
+        cpu.run(maxCycles)
+        elapsed = time.perf_counter() - start
+        speeds[mode] = cpu.cycles / elapsed / 1e6
+        lines.append(f'  {mode:<12} {speeds[mode]:.2f} M instructions/s'
+            + f' ({speeds[mode] / speeds["interpreter"]:.2f}x)')
+    return lines
+
+
+# Description: Runs a Hack program until it halts, or for the given number
+#              of cycles, and reports the speed of the emulator along with
+#              the values of R0..R15.
+#              Basic blocks are compiled as they're entered; with
+#              --interpret, instructions are interpreted one at a time.
+#              With --fused, the idioms of the VM translators are fused into
+#              superinstructions.
+#              With --check, every .hack program under projects/ is run all
+#              three ways and the results are compared instead.
+#              With --fusion, reports how much of the program the fused
+#              idioms cover instead.
+# Input: [--interpret|--fused] [{file}.hack|{file}.bin] [cycles]
+#        | --check [cycles] | --fusion {file}.hack [cycles]
+def main():
+    args = sys.argv[1:]
+    usage = ('Usage: python ' + Path(__file__).name
+        + ' [--interpret|--fused] [{file}.hack|{file}.bin] [cycles]'
+        + ' | --check [cycles] | --fusion {file}.hack [cycles]')
+
+    if args[:1] == ['--fusion']:
+        if len(args) not in (2, 3):
+            print(usage)
+            return
+        maxCycles = int(args[2]) if len(args) == 3 else 1000000
+        for line in fusionReport(args[1], maxCycles):
+            print(line)
+        return
+
+    if args[:1] == ['--check']:
+        if len(args) > 2:
+            print(usage)
+            return
+        maxCycles = int(args[1]) if len(args) == 2 else 1000000
+        paths = sorted(Path(__file__).resolve().parent.parent.glob('*/**/*.hack'))
+        mismatches = selfCheck(paths, maxCycles)
+        for path in mismatches:
+            print(f'MISMATCH: {path}')
+        print(f'{len(paths) - len(mismatches)}/{len(paths)} programs match')
+        return
+
+    compiled = '--interpret' not in args
+    if not compiled:
+        args.remove('--interpret')
+    fused = '--fused' in args
+    if fused:
+        args.remove('--fused')
+
+    # Invalid number of arguments given.
+    if len(args) not in (1, 2):
+        print(usage)
+        return
+
+    maxCycles = int(args[1]) if len(args) == 2 else None
+
+    cpu = CPUEmulator(args[0], compiled, fused)
+    start = time.perf_counter()
+    executed = cpu.run(maxCycles)
+    elapsed = time.perf_counter() - start
+
+    print(f'{executed} instructions in {elapsed:.3f} s'
+        + f' ({executed / elapsed / 1e6:.2f} M instructions/s)'
+        + (', halted' if cpu.halted else ''))
+    for i in range(16):
+        print(f'R{i} = {cpu.ram[i]}')
+
+
+if __name__ == '__main__':
+    main()
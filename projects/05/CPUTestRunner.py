@@ -0,0 +1,92 @@
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / '06'))
+
+from CPUEmulator import CPUEmulator, loadROM
+from TestScript import runnerMain
+from assembler import assemble
+
+
+# Runs the commands of CPU emulator test scripts on a CPUEmulator with
+# compiled blocks. Programs are loaded from .asm files, assembled on the fly,
+# or from .hack files.
+# Variables: A, D, PC, RAM[address], ROM[address], and time, the number of
+# instructions executed so far.
+# Every tick-tock executes a single instruction; a repeated ticktock runs the
+# emulator for that many instructions in one go. Once the program halts, the
+# remaining ticks do nothing, as if it kept looping, until PC is set again.
+class CPUSimulator:
+    def __init__(self, directory):
+        self.directory = Path(directory)
+        self.cpu = CPUEmulator(compiled=True)
+
+    def load(self, name):
+        path = self.directory / name
+        if path.suffix == '.asm':
+            rom = [int(instruction, 2) for instruction in assemble(str(path))]
+        else:
+            rom = loadROM(path)
+        self.cpu.load(rom)
+
+    def get(self, variable):
+        cpu = self.cpu
+        if variable.startswith('RAM['):
+            return cpu.ram[int(variable[4:-1])]
+        elif variable.startswith('ROM['):
+            address = int(variable[4:-1])
+            return cpu.rom[address] if address < len(cpu.rom) else 0
+        elif variable == 'A':
+            return cpu.A
+        elif variable == 'D':
+            return cpu.D
+        elif variable == 'PC':
+            return cpu.PC
+        elif variable == 'time':
+            return cpu.cycles
+        raise Exception(f'Unknown variable: {variable}')
+
+    def set(self, variable, value):
+        cpu = self.cpu
+        value = ((value + 32768) & 0xFFFF) - 32768
+        if variable.startswith('RAM['):
+            cpu.ram[int(variable[4:-1])] = value
+        elif variable == 'A':
+            cpu.A = value
+        elif variable == 'D':
+            cpu.D = value
+        elif variable == 'PC':
+            cpu.PC = value & 0x7FFF
+            cpu.halted = False
+        else:
+            raise Exception(f'Cannot set variable: {variable}')
+
+    def command(self, words, times):
+        if words[0] != 'ticktock':
+            raise Exception(f'Unknown command: {words[0]}')
+        cpu = self.cpu
+        if not cpu.halted:
+            cpu.run(times)
+
+
+# Creates the simulator for a test script: see TestScript.runScript().
+def makeSimulator(path):
+    return CPUSimulator(Path(path).parent)
+
+
+# Description: Runs the CPU emulator test scripts (those that load an .asm or
+#              .hack program) found in the given files and directories, all
+#              of projects/ by default, across a pool of worker processes.
+#              Prints each result as it comes, then a summary with timings.
+#              The output is compared in memory. With --write-out, each
+#              script's output file is also written, like the CPU emulator
+#              does.
+# Input: [--workers n] [--write-out] [{file}.tst|{directory} ...]
+# Output: {file}.out for each script, with --write-out
+def main():
+    runnerMain(sys.argv[1:], Path(__file__).name, makeSimulator,
+        [Path(__file__).resolve().parent.parent], ('.asm', '.hack'))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,343 @@
+import sys
+import time
+from pathlib import Path
+
+from HDLSimulator import (FALSE, NATIVE_HDL, PROJECTS, SEARCH_PATH, TRUE,
+    ChipPins, ChipSimulator, Memory, foldNand, loadNetlist, packBits,
+    simulateChip, sortGates)
+from TestScript import ScriptRunner
+
+# The number of DFFs taken as a single source of changes, so that a chip
+# built from many DFFs isn't cut into too many blocks: see EventSimulator.
+DFF_GROUP = 16
+
+
+# Cuts the gates of a netlist, sorted by sortGates(), into blocks of gates
+# that the same sources of changes reach: input pins, groups of DFF_GROUP
+# DFFs, in the order they were built, and memories, whose words change when
+# written. Returns the blocks, with their gates in the same order.
+# If a block drives another, the sources reaching it reach the other too, so
+# the other has more sources: sorting the blocks by their number of sources
+# keeps each one after the blocks driving it.
+def coneBlocks(gates, netlist):
+    sources = {}
+    bit = 0
+    for pin, width in netlist.chip.inputs:
+        for net in netlist.pins[pin]:
+            sources[net] = 1 << bit
+        bit = bit + 1
+    for i, (out, input) in enumerate(netlist.dffs):
+        sources[out] = 1 << (bit + i // DFF_GROUP)
+    bit = bit + (len(netlist.dffs) + DFF_GROUP - 1) // DFF_GROUP
+
+    blocks = {}
+    for gate in gates:
+        if isinstance(gate, tuple):
+            cone = sources.get(gate[1], 0) | sources.get(gate[2], 0)
+            outputs = gate[:1]
+        else:
+            cone = 1 << bit
+            bit = bit + 1
+            for net in gate.address:
+                cone = cone | sources.get(net, 0)
+            outputs = gate.output
+        for net in outputs:
+            sources[net] = cone
+        blocks.setdefault(cone, []).append(gate)
+    return [blocks[cone] for cone in sorted(blocks,
+        key=lambda cone: bin(cone).count('1'))]
+
+
+# Returns a function that takes the values of the nets, and returns the
+# number formed by the given nets, least significant first.
+def packer(nets):
+    return eval('lambda v: '
+        + packBits([net if net in (FALSE, TRUE) else f'v[{net}]'
+            for net in nets]))
+
+
+# Simulates a chip event by event: when a net changes, be it an input pin, a
+# DFF output, or a memory's read port, only the gates it drives are evaluated
+# again, and only those whose output changes pass the change on.
+# Evaluating gates one by one in Python costs several times more per gate
+# than the straight-line code of CompiledChip, more than the events save.
+# So the gates are cut into the blocks of coneBlocks(), each compiled into
+# straight-line code like CompiledChip's, and the events are between blocks:
+# a block stores the nets it drives that are read elsewhere, and marks the
+# blocks reading those that changed as dirty. A block only drives blocks
+# after it, so evaluating the dirty blocks in order evaluates each one at
+# most once per step, after all of its inputs.
+# Has the same interface as Simulator, and shares its pins with it.
+# evaluated: the number of gate evaluations so far, memory reads included.
+# perCycle: the number of gate evaluations of each clock cycle so far.
+class EventSimulator(ChipPins):
+    def __init__(self, name, netlist):
+        self.name = name
+        self.inputs = dict((pin, len(netlist.pins[pin]))
+            for pin, width in netlist.chip.inputs)
+        self.widths = dict((pin, len(netlist.pins[pin]))
+            for pin, width in netlist.chip.inputs + netlist.chip.outputs)
+        self.pins = netlist.pins
+        self.dffs = netlist.dffs
+        self.memoryKinds = [(memory.kind, memory.size)
+            for memory in netlist.memories]
+        self.memories = [[0] * size for kind, size in self.memoryKinds]
+        # The memories written by the chip, with the functions packing
+        # their input and address.
+        self.writePorts = [(i, memory, packer(memory.input),
+            packer(memory.address))
+            for i, memory in enumerate(netlist.memories) if memory.load]
+        self.buses = {pin: packer(nets) for pin, nets in self.pins.items()}
+
+        self.gates = sortGates(netlist, name)
+        blocks = coneBlocks(self.gates, netlist)
+
+        # The block driving each net, and the blocks reading each net that
+        # another block drives, or that changes from outside.
+        driver = {}
+        self.readPorts = [None] * len(netlist.memories)
+        for b, block in enumerate(blocks):
+            for gate in block:
+                if isinstance(gate, tuple):
+                    driver[gate[0]] = b
+                else:
+                    i = netlist.memories.index(gate)
+                    self.readPorts[i] = b
+                    for net in gate.output:
+                        driver[net] = b
+        self.fanout = [[] for net in netlist.alias]
+        for b, block in enumerate(blocks):
+            for net in set(net for gate in block
+                for net in (gate[1:] if isinstance(gate, tuple)
+                    else gate.address)
+                if driver.get(net) != b
+            ):
+                self.fanout[net].append(b)
+
+        # The nets read by the clock and the test script.
+        roots = [net for pin, width in netlist.chip.outputs
+            for net in netlist.pins[pin]]
+        roots = roots + [input for out, input in netlist.dffs]
+        for memory in netlist.memories:
+            roots = roots + memory.address + memory.input + memory.load
+            roots = roots + memory.inc + memory.reset
+
+        # The number of gates each block evaluates, once folded.
+        self.sizes = []
+        source = ''.join(self.generate(b, block, netlist, set(roots))
+            for b, block in enumerate(blocks))
+        namespace = {}
+        exec(compile(source, f'<{name} events>', 'exec'), namespace)
+        self.blocks = [namespace[f'b{b}'] for b in range(len(blocks))]
+
+        self.values = [0] * len(netlist.alias)
+        self.values[TRUE] = 1
+        # The blocks to evaluate. At first, every block is.
+        self.dirty = bytearray(b'\x01' * len(blocks))
+
+        self.pending = None
+        self.time = 0
+        self.evaluated = 0
+        self.perCycle = []
+        self.cycleStart = 0
+
+    # Returns the code of the function evaluating a block,
+    #     b{b}(v, d, m): reads the nets driving the block from the values v,
+    #         stores the nets it drives that are read elsewhere, and sets
+    #         d[c] for each block c reading one that changed. m: the
+    #         memories.
+    # roots: the nets read by the clock and the test script, always stored.
+    # Gates are folded by foldNand(), as in CompiledChip. Adds the number of
+    # gates evaluated to sizes.
+    def generate(self, b, block, netlist, roots):
+        value = {FALSE: 0, TRUE: 1}
+        negation = {}
+        lines = [f'def b{b}(v, d, m):']
+        gates = 0
+
+        def read(net):
+            if net not in value:
+                value[net] = f'n{net}'
+                lines.append(f'    n{net} = v[{net}]')
+            return value[net]
+
+        driven = []
+        for gate in block:
+            if isinstance(gate, Memory):
+                i = netlist.memories.index(gate)
+                address = packBits([read(net) for net in gate.address])
+                lines.append(f'    w = m[{i}][{address}]')
+                gates = gates + 1
+                for bit, net in enumerate(gate.output):
+                    value[net] = f'n{net}'
+                    lines.append(f'    n{net} = w >> {bit} & 1')
+                    driven.append(net)
+                continue
+
+            out, a, b2 = gate
+            a = read(a)
+            b2 = read(b2)
+            driven.append(out)
+            line = foldNand(out, a, b2, value, negation, '1')
+            if line is not None:
+                lines.append(line)
+                gates = gates + 1
+
+        for net in driven:
+            if self.fanout[net]:
+                lines.append(f'    if v[{net}] != {value[net]}:')
+                lines.append(f'        v[{net}] = {value[net]}')
+                for c in self.fanout[net]:
+                    lines.append(f'        d[{c}] = 1')
+            elif net in roots:
+                lines.append(f'    v[{net}] = {value[net]}')
+        if len(lines) == 1:
+            lines.append('    pass')
+        self.sizes.append(gates)
+        return '\n'.join(lines) + '\n'
+
+    # Changes a net, and marks the blocks it drives as dirty.
+    def change(self, net, value):
+        if self.values[net] != value:
+            self.values[net] = value
+            for b in self.fanout[net]:
+                self.dirty[b] = 1
+
+    # Evaluates the dirty blocks, in order.
+    def propagate(self):
+        dirty = self.dirty
+        blocks = self.blocks
+        sizes = self.sizes
+        values = self.values
+        memories = self.memories
+        evaluated = self.evaluated
+        b = dirty.find(1)
+        while b >= 0:
+            dirty[b] = 0
+            blocks[b](values, dirty, memories)
+            evaluated = evaluated + sizes[b]
+            b = dirty.find(1, b + 1)
+        self.evaluated = evaluated
+
+    # Changes a word of a memory, and marks its read port as dirty.
+    def write(self, i, address, value):
+        memory = self.memories[i]
+        if memory[address] != value:
+            memory[address] = value
+            self.written(i)
+
+    def written(self, i):
+        if self.readPorts[i] is not None:
+            self.dirty[self.readPorts[i]] = 1
+
+    def setPin(self, pin, value):
+        for bit, net in enumerate(self.pins[pin]):
+            self.change(net, (value >> bit) & 1)
+
+    def getPin(self, pin):
+        return self.buses[pin](self.values)
+
+    def eval(self):
+        self.propagate()
+
+    def tick(self):
+        self.propagate()
+        values = self.values
+        self.pending = [values[input] for out, input in self.dffs]
+        # Memories are written on the tick: see Simulator. Their read ports
+        # are evaluated again on the tock.
+        for i, memory, input, address in self.writePorts:
+            if memory.kind == 'PC':
+                # Reset, load, inc, or the current value: see CompiledChip.
+                current = self.memories[i][0]
+                if values[memory.reset[0]]:
+                    word = 0
+                elif values[memory.load[0]]:
+                    word = input(values)
+                elif values[memory.inc[0]]:
+                    word = (current + 1) & 0xFFFF
+                else:
+                    word = current
+                self.write(i, 0, word)
+            elif values[memory.load[0]]:
+                self.write(i, address(values), input(values))
+
+    def tock(self):
+        if self.pending is not None:
+            for (out, input), value in zip(self.dffs, self.pending):
+                self.change(out, value)
+            self.pending = None
+        self.propagate()
+        self.time = self.time + 1
+        self.perCycle.append(self.evaluated - self.cycleStart)
+        self.cycleStart = self.evaluated
+
+
+# Loads a chip and returns an EventSimulator for it: see
+# HDLSimulator.loadNetlist().
+def simulateEvents(chip, searchPath=SEARCH_PATH, builtins=()):
+    return EventSimulator(*loadNetlist(chip, searchPath, builtins))
+
+
+# Runs a test script with the given way of simulating chips, and compares its
+# output with the compare file. Returns the simulator, the seconds spent
+# loading the chip, and the seconds spent running the script otherwise.
+def runScript(script, simulate, builtins):
+    loading = 0
+    def timedSimulate(*args, **kwargs):
+        nonlocal loading
+        start = time.perf_counter()
+        simulator = simulate(*args, **kwargs)
+        loading = loading + time.perf_counter() - start
+        return simulator
+
+    start = time.perf_counter()
+    chipSimulator = ChipSimulator(Path(script).parent, builtins,
+        timedSimulate)
+    ScriptRunner(script, chipSimulator, writeOutput=False).run()
+    elapsed = time.perf_counter() - start
+    return chipSimulator.simulator, loading, elapsed - loading
+
+
+# Description: Runs hardware simulator test scripts, ComputerMax.tst and
+#              ComputerRect.tst by default, once evaluating every gate of the
+#              chip at each step, and once event-driven, evaluating only the
+#              gates whose inputs changed. Reports the time each one took to
+#              load the chip and to run the script, and the gates evaluated
+#              per clock cycle. The full evaluation loads the chip compiled
+#              from the cache (see HDLSimulator.compileChip()), while the
+#              event-driven one builds it from its netlist each time, so
+#              only the run times compare the simulations themselves.
+#              The memory chips (Bit, Register, PC, RAMs) are native, since
+#              the scripts read the registers, so the CPU's registers change
+#              as memory writes and the rest of it is simulated gate by gate.
+# Input: [{file}.tst ...]
+def main():
+    args = sys.argv[1:]
+    builtins = NATIVE_HDL
+    if any(arg.startswith('--') for arg in args):
+        print('Usage: python ' + Path(__file__).name + ' [{file}.tst ...]')
+        return
+
+    scripts = args or [PROJECTS / '05' / 'ComputerMax.tst',
+        PROJECTS / '05' / 'ComputerRect.tst']
+    for script in scripts:
+        full, fullLoad, fullTime = runScript(script, simulateChip, builtins)
+        events, eventLoad, eventTime = runScript(script, simulateEvents,
+            builtins)
+        cycles = max(events.time, 1)
+        gates = full.compiled.gates
+        print(f'{Path(script).name}: {events.time} cycles,'
+            + f' {len(events.gates)} gates')
+        print(f'  full:   {fullTime:8.3f} s to run, {fullLoad:.3f} s to load,'
+            + f' {gates} gates per evaluation,'
+            + f' {full.evaluations * gates / cycles:.0f} gates per cycle')
+        print(f'  events: {eventTime:8.3f} s to run, {eventLoad:.3f} s to load,'
+            + f' {events.evaluated / cycles:.0f} gates per cycle'
+            + f' (at most {max(events.perCycle, default=0)},'
+            + f' at least {min(events.perCycle[1:], default=0)}'
+            + ' after the first)')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,359 @@
+import bisect
+import re
+import sys
+import time
+from array import array
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / '06'))
+
+from CPUEmulator import HALT, ROM_SIZE, CPUEmulator, compileBlock
+from Profiler import loadLabels
+from assembler import LUT, assemble
+
+# The labels the VM translator numbers itself (see Translator.count), such
+# as TRUE3 or ret_add12.
+GENERATED_LABEL = re.compile(r'(TRUE|END|ret_add)\d+')
+
+# The default number of records kept. Must be a power of 2.
+DEFAULT_SIZE = 4096
+
+# The bounds of the VM's stack: SP may point anywhere from its base to just
+# past its last word.
+STACK_BOUNDS = (256, 2048)
+
+# The assembly fields of C-instructions, keyed by their binary fields.
+DEST = {int(bits, 2): dest for dest, bits in LUT.dest.items()}
+JUMP = {int(bits, 2): jump for jump, bits in LUT.jump.items()}
+COMP = {int(bits, 2): comp for comp, bits in LUT.comp.items()}
+
+
+# Returns the assembly of an instruction word.
+def disassemble(word):
+    if word & 0x8000 == 0:
+        return f'@{word}'
+    dest = DEST[(word >> 3) & 0x07]
+    jump = JUMP[word & 0x07]
+    comp = COMP.get((word >> 6) & 0x7F, '?')
+    return (dest + '=' if dest else '') + comp + (';' + jump if jump else '')
+
+
+# Sorts labels for locate(): returns a list of (ROM address, rank, label).
+# Where several labels share an address, the one with the highest rank is
+# shown: a function before the labels declared in it, and these before the
+# labels the VM translator generates, such as the return address of a call
+# just before a function.
+# labels: label -> ROM address.
+def sortLabels(labels):
+    def rank(label):
+        if GENERATED_LABEL.fullmatch(label):
+            return 0
+        return 1 if '$' in label else 2
+    return sorted((address, rank(label), label)
+        for label, address in labels.items())
+
+
+# Returns a ROM address relative to the last label declared at or before
+# it, such as Main.main+12, or '' if there's none.
+# labels: the labels, as sorted by sortLabels().
+def locate(pc, labels):
+    j = bisect.bisect_right(labels, (pc, 3)) - 1
+    if j < 0:
+        return ''
+    address, rank, label = labels[j]
+    return label + (f'+{pc - address}' if pc > address else '')
+
+
+# Keeps the last records of the instructions a Hack program executes, in a
+# ring buffer, so that a program that goes wrong after millions of cycles
+# can be looked at where it went wrong, without tracing it all.
+# Each record: the address of the instruction, A and D after it, and the
+# address it read M from with the value at that address after it, which is
+# the value it wrote if it wrote M. The records are kept in preallocated
+# arrays, one per field, so that recording allocates nothing.
+# Recording every instruction as it runs would slow the emulator down by
+# more than half, so the program runs as compiled basic blocks (see
+# CPUEmulator.runBlocks), and only a checkpoint of the machine is taken
+# every size instructions: its registers and a copy of its RAM. When a run
+# returns, the instructions since the last but one checkpoint, at least the
+# last size of them, are executed again from it one at a time, and
+# recorded. The ring buffer thus holds the last size instructions between
+# runs. The RAM must not be changed between runs, apart from memory the
+# program doesn't read.
+# A run stops at:
+# - the program's halting loop, or the end of the ROM.
+# - a breakpoint: the instruction at a breakpoint isn't executed yet. Blocks
+#   are compiled to start at every breakpoint.
+# - SP (RAM[0]) being set out of stackBounds, if given, a (low, high) pair.
+#   SP is checked after each block, and the instruction that set it is found
+#   when the instructions are executed again. Programs that don't use the
+#   VM's memory layout leave it out.
+# size: the number of records kept, a power of 2.
+# stop: why the last run stopped: 'halt', 'breakpoint', 'stack', or None if
+#       it ran out of cycles.
+class ExecutionTrace:
+    def __init__(self, cpu, size=DEFAULT_SIZE, breakpoints=(),
+        stackBounds=None
+    ):
+        if size <= 0 or size & (size - 1):
+            raise Exception('The size of the trace must be a power of 2!')
+        for address in breakpoints:
+            if not 0 <= address < len(cpu.rom):
+                raise Exception(f'Breakpoint {address} is out of the program!')
+        self.cpu = cpu
+        self.size = size
+        self.breakpoints = set(breakpoints)
+        self.stackBounds = stackBounds
+        self.pcs = array('i', bytes(4 * size))
+        self.As = array('h', bytes(2 * size))
+        self.Ds = array('h', bytes(2 * size))
+        self.addresses = array('h', bytes(2 * size))
+        self.values = array('h', bytes(2 * size))
+        # The number of records written so far; the next one goes at
+        # written % size.
+        self.written = 0
+        self.stop = None
+
+        # The program with HALT at every breakpoint, and the blocks compiled
+        # from it, apart from the CPU's own.
+        self.program = list(cpu.program)
+        self.leaders = bytearray(cpu.leaders)
+        for address in self.breakpoints:
+            self.program[address] = HALT
+            self.leaders[address] = 1
+        self.blocks = [None] * (ROM_SIZE + 1)
+
+    # The state of the machine after count instructions of a run.
+    def checkpoint(self, count):
+        cpu = self.cpu
+        return (count, cpu.A, cpu.D, cpu.PC, cpu.ram.tobytes())
+
+    # Runs the program like CPUEmulator.run(), until it stops (see stop) or
+    # runs out of cycles, then records its last instructions. Returns the
+    # number of instructions executed.
+    def run(self, maxCycles=None):
+        cpu = self.cpu
+        low, high = self.stackBounds or (-32768, 32767)
+        older = newer = self.checkpoint(0)
+        n = -1 if maxCycles is None else maxCycles
+        start = n
+
+        # The breakpoint the last run stopped at is stepped over first.
+        if self.stop == 'breakpoint' and cpu.PC in self.breakpoints and n:
+            cpu.interpret(1)
+            n = n - 1
+
+        blocks = self.blocks
+        program = self.program
+        ram = cpu.ram
+        size = self.size
+        A = cpu.A
+        D = cpu.D
+        pc = cpu.PC
+        blockStart = n
+        checkpointAt = n - size
+        stop = None
+        while n:
+            block = blocks[pc]
+            if block is None:
+                if program[pc] is HALT:
+                    stop = 'breakpoint' if pc in self.breakpoints else 'halt'
+                    break
+                block = compileBlock(cpu.rom, program, self.leaders, pc)
+                blocks[pc] = block
+
+            function, length = block
+            if 0 < n < length:
+                break
+            A, D, pc = function(A, D, ram)
+            n = n - length
+            if not low <= ram[0] <= high:
+                stop = 'stack'
+                break
+            if n <= checkpointAt:
+                cpu.A = A
+                cpu.D = D
+                cpu.PC = pc
+                older = newer
+                newer = self.checkpoint(start - n)
+                checkpointAt = n - size
+
+        cpu.A = A
+        cpu.D = D
+        cpu.PC = pc
+        cpu.cycles = cpu.cycles + blockStart - n
+
+        # The rest of the budget, one instruction at a time.
+        while n > 0 and stop is None:
+            if program[cpu.PC] is HALT:
+                stop = 'breakpoint' if cpu.PC in self.breakpoints else 'halt'
+                break
+            cpu.interpret(1)
+            n = n - 1
+            if not low <= ram[0] <= high:
+                stop = 'stack'
+
+        self.stop = stop
+        cpu.halted = stop == 'halt'
+        executed = start - n
+        return executed - self.record(older, executed, stop == 'stack')
+
+    # Executes the instructions of the run again from a checkpoint, up to
+    # count instructions into the run, and records them. If stack is True,
+    # stops at the first instruction that set SP out of bounds, and leaves
+    # the machine there instead. Returns the number of instructions that
+    # were left out then.
+    def record(self, checkpoint, count, stack):
+        cpu = self.cpu
+        first, A, D, pc, saved = checkpoint
+        ram = array('h', saved)
+        program = cpu.program
+        pcs = self.pcs
+        As = self.As
+        Ds = self.Ds
+        addresses = self.addresses
+        values = self.values
+        mask = self.size - 1
+        i = self.written & mask
+        low, high = self.stackBounds or (-32768, 32767)
+        sp = 0 if stack else -1
+
+        n = count - first
+        address = -1
+        while n:
+            instruction = program[pc]
+            pcs[i] = pc
+            if instruction.__class__ is int: # A-instruction
+                A = instruction
+                pc = pc + 1
+            else: # C-instruction
+                address = A & 0x7FFF
+                A, D, pc = instruction(A, D, ram, pc)
+                addresses[i] = address
+                values[i] = ram[address]
+            As[i] = A
+            Ds[i] = D
+            i = (i + 1) & mask
+            n = n - 1
+            if address == sp and not low <= ram[0] <= high:
+                break
+
+        self.written = self.written + (count - first - n)
+        if stack:
+            cpu.A = A
+            cpu.D = D
+            cpu.PC = pc
+            cpu.ram[:] = ram
+            cpu.cycles = cpu.cycles - n
+        return n
+
+    # Returns the records kept, from the oldest to the most recent, as
+    # tuples (cycle, pc, A, D, write), where write is (address, value) if
+    # the instruction wrote M, or else None.
+    def records(self):
+        cpu = self.cpu
+        count = min(self.written, self.size)
+        first = cpu.cycles - count
+        records = []
+        for k in range(count):
+            i = (self.written - count + k) & (self.size - 1)
+            pc = self.pcs[i]
+            word = cpu.rom[pc] if pc < len(cpu.rom) else 0
+            write = None
+            if word & 0x8008 == 0x8008: # C-instruction with dest M
+                write = (self.addresses[i], self.values[i])
+            records.append((first + k + 1, pc, self.As[i], self.Ds[i], write))
+        return records
+
+    # Returns the records kept as lines of text, with the address of each
+    # instruction given relative to the last label declared before it (see
+    # locate()), and the instruction disassembled.
+    # labels: label -> ROM address.
+    def dump(self, labels=None):
+        labels = sortLabels(labels or {})
+        rom = self.cpu.rom
+        lines = [f'{"cycle":>12} {"pc":>6}  {"location":<32}'
+            + f' {"instruction":<12} {"A":>6} {"D":>6}  write']
+        for cycle, pc, A, D, write in self.records():
+            location = locate(pc, labels)
+            instruction = disassemble(rom[pc]) if pc < len(rom) else '(end)'
+            line = (f'{cycle:12} {pc:6}  {location:<32} {instruction:<12}'
+                + f' {A:6} {D:6}')
+            if write is not None:
+                line = line + f'  RAM[{write[0]}] = {write[1]}'
+            lines.append(line)
+        return lines
+
+
+# Description: Runs a Hack program, assembled from the given assembly file,
+#              for the given number of cycles or until it halts, keeping the
+#              last instructions executed in a ring buffer. When it halts,
+#              reaches a breakpoint, or sets SP out of the VM's stack (with
+#              --stack), prints them with their labels. At a breakpoint,
+#              --continue runs on to the next stop.
+#              --size: the number of instructions kept (4096 by default).
+#              --break: a label or a ROM address to stop at, repeatable.
+# Input: {file}.asm [cycles] [--size n] [--break {label}|address ...]
+#        [--stack] [--continue]
+def main():
+    args = sys.argv[1:]
+    size = DEFAULT_SIZE
+    if '--size' in args:
+        i = args.index('--size')
+        size = int(args[i + 1])
+        del args[i:i + 2]
+    breaks = []
+    while '--break' in args:
+        i = args.index('--break')
+        breaks.append(args[i + 1])
+        del args[i:i + 2]
+    stackBounds = STACK_BOUNDS if '--stack' in args else None
+    if stackBounds is not None:
+        args.remove('--stack')
+    resume = '--continue' in args
+    if resume:
+        args.remove('--continue')
+
+    # Invalid number of arguments given.
+    if len(args) not in (1, 2):
+        print('Usage: python ' + Path(__file__).name
+            + ' {file}.asm [cycles] [--size n]'
+            + ' [--break {label}|address ...] [--stack] [--continue]')
+        return
+
+    maxCycles = int(args[1]) if len(args) == 2 else None
+
+    labels = loadLabels(args[0])
+    breakpoints = []
+    for name in breaks:
+        if name.isdigit():
+            breakpoints.append(int(name))
+        elif name in labels:
+            breakpoints.append(labels[name])
+        else:
+            raise Exception(f'Unknown label: {name}!')
+
+    rom = [int(instruction, 2) for instruction in assemble(args[0])]
+    trace = ExecutionTrace(CPUEmulator(rom), size, breakpoints, stackBounds)
+    remaining = maxCycles
+    while True:
+        start = time.perf_counter()
+        executed = trace.run(remaining)
+        elapsed = time.perf_counter() - start
+        stop = ''
+        if trace.stop is not None:
+            pc = trace.cpu.PC
+            where = locate(pc, sortLabels(labels))
+            stop = f', stopped at {trace.stop}: {pc} {where}'
+        print(f'{executed} instructions in {elapsed:.3f} s' + stop)
+        if trace.stop is not None:
+            for line in trace.dump(labels):
+                print(line)
+        if remaining is not None:
+            remaining = remaining - executed
+        if trace.stop != 'breakpoint' or not resume or remaining == 0:
+            break
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,989 @@
+import hashlib
+import marshal
+import os
+import pickle
+import re
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+from CPUEmulator import loadROM
+from TestScript import ScriptRunner
+
+# The project directories searched for chips, after the chip's own directory,
+# so that chips can use the ones built in earlier projects.
+PROJECTS = Path(__file__).resolve().parent.parent
+SEARCH_PATH = [PROJECTS / d for d in ('01', '02', '03/a', '03/b', '05')]
+
+# The chips that aren't built from other chips: their behavior is implemented
+# by the simulator (see Netlist.addBuiltin).
+BUILTIN_HDL = {
+    'Nand': 'CHIP Nand { IN a, b; OUT out; BUILTIN Nand; }',
+    'DFF': 'CHIP DFF { IN in; OUT out; BUILTIN DFF; CLOCKED in; }',
+    'ROM32K': 'CHIP ROM32K { IN address[15]; OUT out[16]; BUILTIN ROM32K; }',
+    'Screen': 'CHIP Screen { IN in[16], load, address[13]; OUT out[16];'
+        + ' BUILTIN Screen; CLOCKED in, load; }',
+    'Keyboard': 'CHIP Keyboard { OUT out[16]; BUILTIN Keyboard; }',
+}
+
+# Chips the HDL simulator provides as other chips: the A and D registers of
+# the CPU are plain registers.
+ALIASES = {'ARegister': 'Register', 'DRegister': 'Register'}
+
+# Native implementations of memory chips, used instead of their HDL when
+# asked to: see ChipLoader. Each is an array of words, with no gates at all.
+NATIVE_HDL = {
+    'Bit': 'CHIP Bit { IN in, load; OUT out; BUILTIN Bit; CLOCKED in, load; }',
+    'PC': 'CHIP PC { IN in[16], load, inc, reset; OUT out[16]; BUILTIN PC;'
+        + ' CLOCKED in, load, inc, reset; }',
+}
+for name in ('Register', 'ARegister', 'DRegister'):
+    NATIVE_HDL[name] = (f'CHIP {name} {{ IN in[16], load; OUT out[16];'
+        + f' BUILTIN {name}; CLOCKED in, load; }}')
+for name, bits in (('RAM8', 3), ('RAM64', 6), ('RAM512', 9), ('RAM4K', 12),
+    ('RAM16K', 14)
+):
+    NATIVE_HDL[name] = (f'CHIP {name} {{ IN in[16], load, address[{bits}];'
+        + f' OUT out[16]; BUILTIN {name}; CLOCKED in, load; }}')
+
+# Where compiled chips are saved, so that they're only compiled again when
+# their HDL or the HDL of one of their parts changes: see compileChip().
+CACHE_DIRECTORY = PROJECTS / '.hdlcache'
+
+# A hash of this file, which generates the code of compiled chips and
+# defines what they hold: cached chips compiled by another version of it
+# are compiled again.
+COMPILER_HASH = hashlib.sha256(Path(__file__).read_bytes()).hexdigest()
+
+# Nets 0 and 1 are the constants false and true.
+FALSE = 0
+TRUE = 1
+
+TOKEN = re.compile(r'\.\.|[A-Za-z_][\w.]*|\d+|[{}()\[\];:,=]')
+COMMENT = re.compile(r'//[^\n]*|/\*.*?\*/', re.DOTALL)
+
+
+# A chip, as defined by its HDL file.
+# inputs, outputs: lists of (pin name, width).
+# parts: list of (chip name, connections), where each connection is
+#        (pin, pin's first bit, pin's last bit, bus, bus's first bit, bus's
+#        last bit). The bits are None when the whole pin or bus is connected.
+# builtin: the name of the builtin implementation, or None if the chip is
+#          made of parts.
+class ChipDef:
+    def __init__(self, name):
+        self.name = name
+        self.inputs = []
+        self.outputs = []
+        self.parts = []
+        self.builtin = None
+        self.clocked = []
+        self.path = None
+
+    def outputWidths(self):
+        return dict(self.outputs)
+
+
+# Parses HDL source code into a ChipDef.
+class HDLParser:
+    def __init__(self, text, path=None):
+        self.tokens = TOKEN.findall(COMMENT.sub('', text))
+        self.i = 0
+        self.path = path
+
+    def error(self, message):
+        raise Exception(f'{self.path or "HDL"}: {message}!')
+
+    def peek(self):
+        return self.tokens[self.i] if self.i < len(self.tokens) else None
+
+    def next(self):
+        token = self.peek()
+        if token is None:
+            self.error('Unexpected end of file')
+        self.i = self.i + 1
+        return token
+
+    def expect(self, expected):
+        token = self.next()
+        if token != expected:
+            self.error(f"Expected '{expected}' but found '{token}'")
+
+    def parse(self):
+        self.expect('CHIP')
+        chip = ChipDef(self.next())
+        chip.path = self.path
+        self.expect('{')
+        while self.peek() != '}':
+            keyword = self.next()
+            if keyword == 'IN':
+                chip.inputs = self.pinList()
+            elif keyword == 'OUT':
+                chip.outputs = self.pinList()
+            elif keyword == 'PARTS':
+                self.expect(':')
+                while self.peek() not in ('}', None):
+                    chip.parts.append(self.part())
+            elif keyword == 'BUILTIN':
+                chip.builtin = self.next()
+                self.expect(';')
+            elif keyword == 'CLOCKED':
+                chip.clocked = [name for name, width in self.pinList()]
+            else:
+                self.error(f"Unexpected '{keyword}'")
+        self.expect('}')
+        return chip
+
+    # pin[, pin]*; where pin is name or name[width].
+    def pinList(self):
+        pins = []
+        while True:
+            name = self.next()
+            width = 1
+            if self.peek() == '[':
+                self.next()
+                width = int(self.next())
+                self.expect(']')
+            pins.append((name, width))
+            if self.next() == ';':
+                return pins
+
+    # Part(pin=bus, ...); where both sides may be sub-buses: [i] or [i..j].
+    def part(self):
+        name = self.next()
+        self.expect('(')
+        connections = []
+        while True:
+            pin, pinFirst, pinLast = self.subBus()
+            self.expect('=')
+            bus, busFirst, busLast = self.subBus()
+            connections.append((pin, pinFirst, pinLast, bus, busFirst, busLast))
+            if self.next() == ')':
+                break
+        self.expect(';')
+        return (name, connections)
+
+    def subBus(self):
+        name = self.next()
+        first = last = None
+        if self.peek() == '[':
+            self.next()
+            first = last = int(self.next())
+            if self.peek() == '..':
+                self.next()
+                last = int(self.next())
+            self.expect(']')
+        return name, first, last
+
+
+# Finds and parses chip definitions: in the given directories, in order, then
+# among the builtin chips. Each chip is parsed only once.
+# builtins: the chips of NATIVE_HDL to use instead of their HDL files.
+class ChipLoader:
+    def __init__(self, searchPath=SEARCH_PATH, builtins=()):
+        self.searchPath = [Path(d) for d in searchPath]
+        self.builtins = set(builtins)
+        self.chips = {}
+
+    def find(self, name):
+        for directory in self.searchPath:
+            path = directory / f'{name}.hdl'
+            if path.exists():
+                return path
+        return None
+
+    # Returns where a chip is defined, and its HDL: its file, or its name for
+    # native and builtin chips. Aliases have no HDL: they're defined by the
+    # chip they stand for.
+    def source(self, name):
+        path = self.find(name)
+        if name in self.builtins and name in NATIVE_HDL:
+            return name, NATIVE_HDL[name]
+        elif path is not None:
+            return path, path.read_text()
+        elif name in ALIASES:
+            return ALIASES[name], None
+        elif name in BUILTIN_HDL:
+            return name, BUILTIN_HDL[name]
+        raise Exception(f'Chip {name} is not found!')
+
+    def load(self, name):
+        if name in self.chips:
+            return self.chips[name]
+
+        origin, text = self.source(name)
+        if text is None:
+            chip = self.load(origin)
+        else:
+            chip = HDLParser(text, origin).parse()
+        if chip.name != name and name not in ALIASES:
+            raise Exception(f'{origin} defines chip {chip.name}, not {name}!')
+
+        self.chips[name] = chip
+        return chip
+
+
+# A memory implemented by the simulator, with a combinational read port and
+# a write port clocked like a DFF. The nets are lists of bit nets, least
+# significant bit first; the input nets are empty for memories that aren't
+# written by the chip (ROM32K and Keyboard), and the address is empty for
+# registers, memories of a single word.
+# kind: the builtin chip's name. size: the number of words.
+# inc, reset: the PC's other control bits.
+class Memory:
+    def __init__(self, kind, size, address, input, load, output, inc=(),
+        reset=()
+    ):
+        self.kind = kind
+        self.size = size
+        self.address = address
+        self.input = input
+        self.load = load
+        self.output = output
+        self.inc = list(inc)
+        self.reset = list(reset)
+
+
+# A chip flattened into Nand gates, DFFs, and memories, connected by nets
+# numbered from 2 (0 and 1 are the constants).
+# nands: list of (output net, input net, input net).
+# dffs: list of (output net, input net).
+# pins: the top chip's pins: name -> list of nets, least significant bit
+#       first.
+class Netlist:
+    def __init__(self, chip, loader):
+        self.loader = loader
+        self.chip = chip
+        # Each part's outputs get placeholder nets before the part is built,
+        # since the parts can be listed in any order. Building the part makes
+        # each placeholder an alias of the net that actually drives it.
+        self.alias = [FALSE, TRUE]
+        self.nands = []
+        self.dffs = []
+        self.memories = []
+
+        self.pins = {}
+        inputs = {}
+        for name, width in chip.inputs:
+            inputs[name] = [self.newNet() for i in range(width)]
+            self.pins[name] = inputs[name]
+        outputs = self.build(chip, inputs)
+        for name, width in chip.outputs:
+            self.pins[name] = outputs[name]
+        self.resolve()
+
+    def newNet(self):
+        self.alias.append(len(self.alias))
+        return len(self.alias) - 1
+
+    # Returns the net that a net stands for.
+    def find(self, net):
+        alias = self.alias
+        root = net
+        while alias[root] != root:
+            root = alias[root]
+        while alias[net] != root:
+            alias[net], net = root, alias[net]
+        return root
+
+    # Replaces every net in the netlist by the one it stands for.
+    def resolve(self):
+        find = self.find
+        self.nands = [(find(out), find(a), find(b))
+            for out, a, b in self.nands]
+        self.dffs = [(find(out), find(input)) for out, input in self.dffs]
+        for memory in self.memories:
+            for name in ('address', 'input', 'load', 'output', 'inc',
+                'reset'
+            ):
+                setattr(memory, name, [find(net)
+                    for net in getattr(memory, name)])
+        self.pins = {name: [find(net) for net in nets]
+            for name, nets in self.pins.items()}
+
+    # Builds a chip out of its parts, given the nets of its inputs. Returns
+    # the nets of its outputs.
+    def build(self, chip, inputs):
+        if chip.builtin is not None:
+            return self.addBuiltin(chip, inputs)
+
+        outputWidths = chip.outputWidths()
+        outputs = {name: [None] * width for name, width in chip.outputs}
+        internal = dict(inputs)
+
+        # The outputs of every part, as placeholders.
+        parts = []
+        for partName, connections in chip.parts:
+            part = self.loader.load(partName)
+            partOutputs = part.outputWidths()
+            placeholders = {name: [self.newNet() for i in range(width)]
+                for name, width in part.outputs}
+            for pin, pinFirst, pinLast, bus, busFirst, busLast in connections:
+                if pin not in partOutputs:
+                    continue
+                nets = placeholders[pin]
+                if pinFirst is not None:
+                    nets = nets[pinFirst:pinLast + 1]
+                if bus in outputWidths:
+                    if busFirst is None:
+                        busFirst, busLast = 0, outputWidths[bus] - 1
+                    if busLast - busFirst + 1 != len(nets):
+                        raise Exception(f'{chip.name}: {partName}.{pin}'
+                            + f' and {bus} have different widths!')
+                    outputs[bus][busFirst:busLast + 1] = nets
+                elif bus in internal or bus in ('true', 'false'):
+                    raise Exception(
+                        f'{chip.name}: {bus} has more than one source!')
+                elif busFirst is not None:
+                    raise Exception(
+                        f'{chip.name}: internal pin {bus} has sub-buses!')
+                else:
+                    internal[bus] = nets
+            parts.append((part, connections, placeholders))
+
+        # Every part, now that all of its inputs have nets.
+        for part, connections, placeholders in parts:
+            partInputs = {name: [FALSE] * width
+                for name, width in part.inputs}
+            for pin, pinFirst, pinLast, bus, busFirst, busLast in connections:
+                if pin not in partInputs:
+                    if pin not in placeholders:
+                        raise Exception(
+                            f'{chip.name}: {part.name} has no pin {pin}!')
+                    continue
+                if pinFirst is None:
+                    pinFirst, pinLast = 0, len(partInputs[pin]) - 1
+                width = pinLast - pinFirst + 1
+                if bus in ('true', 'false'):
+                    nets = [TRUE if bus == 'true' else FALSE] * width
+                elif bus in internal:
+                    nets = internal[bus]
+                    if busFirst is not None:
+                        nets = nets[busFirst:busLast + 1]
+                else:
+                    raise Exception(f'{chip.name}: {bus} has no source!')
+                if len(nets) != width:
+                    raise Exception(f'{chip.name}: {part.name}.{pin}'
+                        + f' and {bus} have different widths!')
+                partInputs[pin][pinFirst:pinLast + 1] = nets
+
+            partOutputs = self.build(part, partInputs)
+            for name, nets in placeholders.items():
+                for placeholder, net in zip(nets, partOutputs[name]):
+                    self.alias[placeholder] = net
+
+        # Output bits that nothing drives are false.
+        return {name: [FALSE if net is None else net for net in nets]
+            for name, nets in outputs.items()}
+
+    # Adds a builtin chip. Returns the nets of its outputs.
+    def addBuiltin(self, chip, inputs):
+        kind = chip.builtin
+        if kind == 'Nand':
+            out = self.newNet()
+            self.nands.append((out, inputs['a'][0], inputs['b'][0]))
+            return {'out': [out]}
+        elif kind == 'DFF':
+            out = self.newNet()
+            self.dffs.append((out, inputs['in'][0]))
+            return {'out': [out]}
+
+        output = [self.newNet() for i in range(chip.outputWidths()['out'])]
+        if kind == 'ROM32K':
+            memory = Memory(kind, 32768, inputs['address'], [], [], output)
+        elif kind == 'Keyboard':
+            memory = Memory(kind, 1, [], [], [], output)
+        elif kind == 'PC':
+            memory = Memory(kind, 1, [], inputs['in'], inputs['load'], output,
+                inputs['inc'], inputs['reset'])
+        else: # RAM, or a register without an address.
+            address = inputs.get('address', [])
+            memory = Memory(kind, 1 << len(address), address, inputs['in'],
+                inputs['load'], output)
+        self.memories.append(memory)
+        return {'out': output}
+
+
+# Returns the gates of a netlist that matter, Nand gates and memories, sorted
+# so that each one comes after the gates driving its inputs. The gates that
+# matter are those that reach an output, a DFF, or a memory; Nand gates that
+# drive none of them are dropped.
+def sortGates(netlist, name):
+    drivers = {}
+    for gate in netlist.nands:
+        drivers[gate[0]] = gate
+    for memory in netlist.memories:
+        for net in memory.output:
+            drivers[net] = memory
+    roots = [net for pin, width in netlist.chip.outputs
+        for net in netlist.pins[pin]]
+    roots = roots + [input for out, input in netlist.dffs]
+    for memory in netlist.memories:
+        roots = roots + memory.address + memory.input + memory.load
+        roots = roots + memory.inc + memory.reset
+
+    # A depth-first search from the roots, without recursion. The gates
+    # being visited are the ancestors of the one on top of the stack, so
+    # reaching one of them again means there's a loop.
+    order = []
+    done = set()
+    visiting = set()
+    for root in roots:
+        stack = [drivers[root]] if root in drivers else []
+        while stack:
+            gate = stack[-1]
+            if gate in done:
+                stack.pop()
+                continue
+            inputs = gate[1:] if isinstance(gate, tuple) else gate.address
+            pending = [drivers[net] for net in inputs
+                if net in drivers and drivers[net] not in done]
+            if not pending:
+                done.add(gate)
+                visiting.discard(gate)
+                order.append(gate)
+                stack.pop()
+            elif any(input in visiting for input in pending):
+                raise Exception(f'{name}: the chip has a combinational loop!')
+            else:
+                visiting.add(gate)
+                stack.extend(pending)
+    return order
+
+
+# Returns Python source code for an expression whose value is the number
+# formed by the given bits, least significant first, where each bit is either
+# the name of a variable holding 0 or 1, or the constant 0 or 1.
+def packBits(bits):
+    constant = sum(1 << i for i, bit in enumerate(bits) if bit == 1)
+    terms = [bit if i == 0 else f'{bit} << {i}'
+        for i, bit in enumerate(bits) if bit not in (0, 1)]
+    if constant or not terms:
+        terms.append(str(constant))
+    return ' | '.join(terms)
+
+
+# Returns the code of a Nand gate computing out from the values a and b,
+# each a constant 0 or 1 or the name of a variable, or None if it's folded:
+# a gate with a constant input is a constant or a negation, and the negation
+# of a negation is the net negated twice. Sets value[out].
+# negation: variable name -> the value it's the negation of.
+# ones: the expression of the word with every bit set, such as 1 or ONES.
+def foldNand(out, a, b, value, negation, ones):
+    if a == 0 or b == 0:
+        value[out] = 1
+    elif a == 1 and b == 1:
+        value[out] = 0
+    elif a == 1 or b == 1 or a == b:
+        x = b if a == 1 else a
+        if x in negation:
+            value[out] = negation[x]
+        else:
+            value[out] = f'n{out}'
+            negation[value[out]] = x
+            return f'    n{out} = {ones} ^ {x}'
+    else:
+        value[out] = f'n{out}'
+        return f'    n{out} = {ones} ^ ({a} & {b})'
+    return None
+
+
+# A netlist compiled into Python. It's plain data, so it can be saved and
+# shared between simulators of the same chip.
+# source: the code of the function
+#     evaluate(s, memories, ONES=1): computes every net from the state s, a
+#         list: the top chip's input bits, and the DFF outputs, and stores
+#         the top chip's output bits, the DFF inputs, and the memories' write
+#         ports back into s.
+#     The memories are passed in the order of memoryKinds. Each bit can also
+#     hold many bits, one per test vector, so that the chip is evaluated for
+#     all of them at once: ONES then has every one of these bits set (see
+#     BitParallel.py). Memories only work with single bits.
+# code: the source compiled into Python bytecode, marshaled, once it's
+#       needed.
+# pins: pin name -> list of the slots of its bits in the state.
+# slots: the size of the state.
+# dffOutputs, dffInputs: the ranges of slots holding the DFF outputs, and
+#     what the DFFs will take on the next clock.
+# writePorts: for each memory written by the chip, its index and the slots of
+#     its load bit, address, and input.
+# memoryKinds: list of (kind, size) of every memory.
+class CompiledChip:
+    def __init__(self, name, netlist):
+        self.name = name
+        self.inputs = [(pin, len(netlist.pins[pin]))
+            for pin, width in netlist.chip.inputs]
+        self.outputs = [(pin, len(netlist.pins[pin]))
+            for pin, width in netlist.chip.outputs]
+        self.memoryKinds = [(memory.kind, memory.size)
+            for memory in netlist.memories]
+        self.gates = 0
+        self.source = self.generate(netlist)
+        self.code = None
+        self.function = None
+
+    # The function isn't saved, only its bytecode.
+    def __getstate__(self):
+        state = dict(self.__dict__)
+        state['function'] = None
+        return state
+
+    # Allocates the slots of the state, then generates the code.
+    def generate(self, netlist):
+        self.pins = {}
+        slot = 0
+        for pin, width in self.inputs + self.outputs:
+            self.pins[pin] = list(range(slot, slot + width))
+            slot = slot + width
+        dffs = netlist.dffs
+        self.dffOutputs = (slot, slot + len(dffs))
+        self.dffInputs = (slot + len(dffs), slot + 2 * len(dffs))
+        slot = slot + 2 * len(dffs)
+        self.writePorts = []
+        for i, memory in enumerate(netlist.memories):
+            if memory.load:
+                self.writePorts.append((i, slot, slot + 1, slot + 2))
+                slot = slot + 3
+        self.slots = slot
+
+        order = sortGates(netlist, self.name)
+
+        def constant(term):
+            return 'ONES' if term == 1 else term
+
+        # What each net is in the generated code: a constant 0 or 1, or the
+        # name of a variable. Nets that are just the negation of another are
+        # remembered, so that a double negation costs nothing.
+        value = {FALSE: 0, TRUE: 1}
+        negation = {}
+        lines = ['def evaluate(s, memories, ONES=1):']
+        for i in range(len(netlist.memories)):
+            lines.append(f'    m{i} = memories[{i}]')
+        for pin, width in self.inputs:
+            for net, slot in zip(netlist.pins[pin], self.pins[pin]):
+                value[net] = f'n{net}'
+                lines.append(f'    n{net} = s[{slot}]')
+        for i, (out, input) in enumerate(dffs):
+            value[out] = f'n{out}'
+            lines.append(f'    n{out} = s[{self.dffOutputs[0] + i}]')
+
+        for gate in order:
+            if isinstance(gate, Memory):
+                i = netlist.memories.index(gate)
+                if gate.address:
+                    address = packBits([value[net] for net in gate.address])
+                    lines.append(f'    w = m{i}[{address}]')
+                else:
+                    lines.append(f'    w = m{i}[0]')
+                for bit, net in enumerate(gate.output):
+                    value[net] = f'n{net}'
+                    lines.append(f'    n{net} = w >> {bit} & 1')
+                continue
+
+            out, a, b = gate
+            line = foldNand(out, value[a], value[b], value, negation, 'ONES')
+            if line is not None:
+                lines.append(line)
+                self.gates = self.gates + 1
+
+        for pin, width in self.outputs:
+            for net, slot in zip(netlist.pins[pin], self.pins[pin]):
+                lines.append(f'    s[{slot}] = {constant(value[net])}')
+        for i, (out, input) in enumerate(dffs):
+            lines.append(f'    s[{self.dffInputs[0] + i}] = '
+                + constant(value[input]))
+        for i, loadSlot, addressSlot, inputSlot in self.writePorts:
+            memory = netlist.memories[i]
+            input = packBits([value[net] for net in memory.input])
+            if memory.kind == 'PC':
+                # The next value is always written: reset, load, inc, or
+                # the current value, in that order of priority.
+                lines.append(f'    s[{loadSlot}] = 1')
+                input = (f'0 if {value[memory.reset[0]]} else'
+                    + f' ({input}) if {value[memory.load[0]]} else'
+                    + f' (m{i}[0] + 1) & 0xFFFF if {value[memory.inc[0]]}'
+                    + f' else m{i}[0]')
+            else:
+                lines.append(f'    s[{loadSlot}] = {value[memory.load[0]]}')
+            lines.append(f'    s[{addressSlot}] = '
+                + packBits([value[net] for net in memory.address]))
+            lines.append(f'    s[{inputSlot}] = {input}')
+
+        if len(lines) == 1:
+            lines.append('    pass')
+        return '\n'.join(lines) + '\n'
+
+    # The evaluation function, compiled from the source the first time.
+    def evaluator(self):
+        if self.function is None:
+            if self.code is None:
+                self.code = marshal.dumps(compile(self.source,
+                    f'<{self.name}>', 'exec'))
+            namespace = {}
+            exec(marshal.loads(self.code), namespace)
+            self.function = namespace['evaluate']
+        return self.function
+
+
+# Returns the name of a chip, given either as a name or as the path of its
+# HDL file, and where to search for it and its parts: in the directory of the
+# HDL file first, if a path is given, then in the project directories.
+def locateChip(chip, searchPath=SEARCH_PATH):
+    path = Path(chip)
+    if path.suffix == '.hdl':
+        return path.stem, [path.parent] + list(searchPath)
+    return chip, list(searchPath)
+
+
+# Loads a chip and flattens it: see locateChip(). Returns the chip's name and
+# its netlist.
+# builtins: see ChipLoader.
+def loadNetlist(chip, searchPath=SEARCH_PATH, builtins=()):
+    chip, searchPath = locateChip(chip, searchPath)
+    loader = ChipLoader(searchPath, builtins)
+    return chip, Netlist(loader.load(chip), loader)
+
+
+# Returns a hash of the HDL of the given chips, and of where each one is
+# defined.
+def sourceHash(loader, names):
+    digest = hashlib.sha256()
+    for name in sorted(names):
+        origin, text = loader.source(name)
+        digest.update(f'{name}\0{origin}\0{text}\0'.encode())
+    return digest.hexdigest()
+
+
+# Loads a chip and compiles it: see loadNetlist().
+# Compiled chips are saved in the cache directory, unless it's None, along
+# with the names of all the chips they're made of, down to Nand: the next
+# time, the chip is only compiled again if the hash of these chips' HDL
+# changed. There's one entry per chip, search path, set of builtins,
+# version of Python, since entries hold the chip's bytecode, and version of
+# this file (see COMPILER_HASH).
+def compileChip(chip, searchPath=SEARCH_PATH, builtins=(),
+    cache=CACHE_DIRECTORY
+):
+    chip, searchPath = locateChip(chip, searchPath)
+    loader = ChipLoader(searchPath, builtins)
+    if cache is None:
+        return CompiledChip(chip, Netlist(loader.load(chip), loader))
+
+    setting = repr(([str(Path(d).resolve()) for d in searchPath],
+        sorted(builtins), sys.implementation.cache_tag, COMPILER_HASH))
+    entry = Path(cache) / (chip + '-'
+        + hashlib.sha256(setting.encode()).hexdigest()[:16] + '.pickle')
+    try:
+        with entry.open('rb') as f:
+            names, key, compiled = pickle.load(f)
+        if sourceHash(loader, names) == key:
+            return compiled
+    except Exception: # No entry, an unreadable one, or a missing chip.
+        pass
+
+    compiled = CompiledChip(chip, Netlist(loader.load(chip), loader))
+    compiled.evaluator()
+    names = list(loader.chips)
+    # Written to a temporary file first, so that simulators running at the
+    # same time never read a partial entry.
+    try:
+        entry.parent.mkdir(parents=True, exist_ok=True)
+        with tempfile.NamedTemporaryFile('wb', dir=entry.parent,
+            delete=False
+        ) as f:
+            pickle.dump((names, sourceHash(loader, names), compiled), f)
+        os.replace(f.name, entry)
+    except OSError:
+        pass
+    return compiled
+
+
+# Loads a chip and returns a Simulator for it: see loadNetlist().
+def simulateChip(chip, searchPath=SEARCH_PATH, builtins=()):
+    return Simulator(compileChip(chip, searchPath, builtins))
+
+
+# The pins and memory words of a simulated chip, as test scripts set and get
+# them: see Simulator and EventSimulator.EventSimulator. Subclasses have
+# name, inputs and widths, pin -> width, memoryKinds and memories (see
+# Simulator), and define
+#     setPin(pin, value): sets the bits of an input pin.
+#     getPin(pin): returns the unsigned value of a pin.
+#     written(i): tells that memory i was written from outside.
+class ChipPins:
+    # Returns the index of the first memory of the given kind, such as
+    # RAM16K or ARegister.
+    def memoryIndex(self, kind):
+        for i, (memoryKind, size) in enumerate(self.memoryKinds):
+            if memoryKind == kind:
+                return i
+        raise Exception(f'{self.name} has no builtin {kind}!')
+
+    # Returns the index of the memory and the address that a name such as
+    # RAM16K[3] or PC[] refers to.
+    def memoryWord(self, name):
+        kind, address = name[:-1].split('[')
+        return self.memoryIndex(kind), int(address) if address else 0
+
+    # Loads words into the first memory of the given kind, from address 0.
+    def load(self, kind, words):
+        i = self.memoryIndex(kind)
+        self.memories[i][:len(words)] = words
+        self.written(i)
+
+    # Sets an input pin, or a word of a memory such as RAM16K[3]. Values are
+    # cut to the pin's width.
+    def set(self, pin, value):
+        if pin.endswith(']'):
+            i, address = self.memoryWord(pin)
+            self.memories[i][address] = value & 0xFFFF
+            self.written(i)
+            return
+        if pin not in self.inputs:
+            raise Exception(f'{self.name} has no input pin {pin}!')
+        self.setPin(pin, value)
+
+    # Returns the value of a pin, or of a word of a memory such as RAM16K[3].
+    # 16-bit values are signed.
+    def get(self, pin):
+        if pin.endswith(']'):
+            i, address = self.memoryWord(pin)
+            value = self.memories[i][address]
+            return value - 0x10000 if value & 0x8000 else value
+        if pin not in self.widths:
+            raise Exception(f'{self.name} has no pin {pin}!')
+        value = self.getPin(pin)
+        if self.widths[pin] == 16 and value & 0x8000:
+            value = value - 0x10000
+        return value
+
+
+# Simulates a compiled chip: its inputs are set, then it's evaluated or
+# clocked, and its outputs are read.
+# Like in the hardware simulator, tick() is the first half of a clock cycle,
+# where the DFFs and memories sample their inputs, and tock() the second
+# half, where their outputs change. Memories store the written word on the
+# tick already, like its builtin chips, so that RAM16K[3] or DRegister[] show
+# it in between.
+# memories: the contents of the memories, lists of unsigned 16-bit words, in
+#           the order of the compiled chip's memoryKinds.
+# evaluations: the number of times the whole chip was evaluated so far.
+class Simulator(ChipPins):
+    def __init__(self, compiled):
+        self.compiled = compiled
+        self.name = compiled.name
+        self.evaluate = compiled.evaluator()
+        self.state = [0] * compiled.slots
+        self.memoryKinds = compiled.memoryKinds
+        self.memories = [[0] * size for kind, size in compiled.memoryKinds]
+        self.inputs = dict(compiled.inputs)
+        self.widths = dict(compiled.inputs + compiled.outputs)
+        self.pending = None
+        self.time = 0
+        self.evaluations = 0
+
+    def setPin(self, pin, value):
+        state = self.state
+        for bit, slot in enumerate(self.compiled.pins[pin]):
+            state[slot] = (value >> bit) & 1
+
+    def getPin(self, pin):
+        state = self.state
+        value = 0
+        for bit, slot in enumerate(self.compiled.pins[pin]):
+            value = value | state[slot] << bit
+        return value
+
+    # The memories are read on every evaluation.
+    def written(self, i):
+        pass
+
+    def eval(self):
+        self.evaluate(self.state, self.memories)
+        self.evaluations = self.evaluations + 1
+
+    def tick(self):
+        state = self.state
+        self.evaluate(state, self.memories)
+        self.evaluations = self.evaluations + 1
+        start, end = self.compiled.dffInputs
+        self.pending = state[start:end]
+        for i, load, address, input in self.compiled.writePorts:
+            if state[load]:
+                self.memories[i][state[address]] = state[input]
+
+    def tock(self):
+        if self.pending is not None:
+            start, end = self.compiled.dffOutputs
+            self.state[start:end] = self.pending
+            self.pending = None
+        self.evaluate(self.state, self.memories)
+        self.evaluations = self.evaluations + 1
+        self.time = self.time + 1
+
+
+# Runs the commands of hardware simulator test scripts on a Simulator (see
+# TestScript.ScriptRunner). Chips are loaded from the script's directory,
+# then from the project directories.
+# Variables: the chip's pins, the words of its builtin memories such as
+# RAM16K[3] or PC[], and time, the number of clock cycles so far, with a '+'
+# between a tick and its tock.
+# builtins: see ChipLoader.
+# simulate: the function that loads a chip into a simulator, with the same
+#           arguments and methods as simulateChip() and Simulator.
+class ChipSimulator:
+    def __init__(self, directory, builtins=(), simulate=simulateChip):
+        self.directory = Path(directory)
+        self.builtins = builtins
+        self.simulate = simulate
+        self.simulator = None
+        self.ticked = False
+
+    def load(self, name):
+        self.simulator = self.simulate(self.directory / name,
+            builtins=self.builtins)
+
+    def get(self, variable):
+        if variable == 'time':
+            return f'{self.simulator.time}{"+" if self.ticked else ""}'
+        return self.simulator.get(variable)
+
+    def set(self, variable, value):
+        self.simulator.set(variable, value)
+
+    def command(self, words, times):
+        simulator = self.simulator
+        if words[0] == 'ROM32K' and words[1] == 'load':
+            simulator.load('ROM32K', loadROM(self.directory / words[2]))
+            return
+        for i in range(times):
+            if words[0] == 'tick':
+                simulator.tick()
+                self.ticked = True
+            elif words[0] == 'tock':
+                simulator.tock()
+                self.ticked = False
+            elif words[0] == 'eval':
+                simulator.eval()
+            else:
+                raise Exception(f'Unknown command: {words[0]}')
+
+
+# Runs a test script on two simulators at once: the chip's own HDL, built
+# from native parts, and the chip's native implementation. Every value the
+# script reads is compared between them.
+class CrossCheck:
+    def __init__(self, directory, builtins):
+        self.directory = Path(directory)
+        self.builtins = builtins
+        self.hdl = None
+        self.native = None
+
+    def load(self, name):
+        chip = Path(name).stem
+        self.chip = chip
+        self.hdl = ChipSimulator(self.directory,
+            [builtin for builtin in self.builtins if builtin != chip])
+        self.native = ChipSimulator(self.directory, self.builtins)
+        self.hdl.load(name)
+        self.native.load(name)
+
+    def get(self, variable):
+        value = self.hdl.get(variable)
+        native = self.native.get(variable)
+        if value != native:
+            raise Exception(f'{self.chip}.hdl differs from the native'
+                + f' {self.chip} at time {self.hdl.get("time")}:'
+                + f' {variable} is {value} instead of {native}')
+        return value
+
+    def set(self, variable, value):
+        self.hdl.set(variable, value)
+        self.native.set(variable, value)
+
+    def command(self, words, times):
+        # One step at a time, so that no difference goes unnoticed.
+        for i in range(times):
+            self.hdl.command(words, 1)
+            self.native.command(words, 1)
+            for pin, width in self.hdl.simulator.compiled.outputs:
+                self.get(pin)
+
+
+# Cross-checks the native implementation of each chip against its HDL, with
+# the chip's test script. Returns a list of (script, error or None).
+def verify(scripts):
+    results = []
+    for script in scripts:
+        try:
+            runner = ScriptRunner(script, CrossCheck(Path(script).parent,
+                NATIVE_HDL), writeOutput=False)
+            runner.run()
+            results.append((script, None))
+        except Exception as e:
+            results.append((script, str(e)))
+    return results
+
+
+# Description: Compiles a chip from its HDL file, down to Nand gates and DFFs,
+#              and reports its size and how long it took. If input values are
+#              given, evaluates the chip with them and prints its outputs.
+#              With --builtins, memory chips (Bit, Register, RAM8..RAM16K,
+#              PC) are native instead of being built from their HDL.
+#              Compiled chips are cached in projects/.hdlcache, unless
+#              --no-cache is given.
+#              With --verify, runs the test scripts of the memory chips (all
+#              of projects/03 by default) on both their HDL and their native
+#              implementation, and compares them.
+# Input: [--builtins] [--no-cache] {chip}.hdl [pin=value ...]
+#        | --verify [{file}.tst ...]
+def main():
+    args = sys.argv[1:]
+    if args[:1] == ['--verify']:
+        scripts = args[1:] or sorted((PROJECTS / '03').rglob('*.tst'))
+        failed = 0
+        for script, error in verify(scripts):
+            print(f'{"PASS" if error is None else "FAIL"} {script}')
+            if error is not None:
+                failed = failed + 1
+                print(f'  {error}')
+        print(f'{len(scripts) - failed}/{len(scripts)} chips match')
+        return
+
+    builtins = ()
+    if '--builtins' in args:
+        args.remove('--builtins')
+        builtins = NATIVE_HDL
+    cache = CACHE_DIRECTORY
+    if '--no-cache' in args:
+        args.remove('--no-cache')
+        cache = None
+
+    # Invalid number of arguments given.
+    if len(args) < 1:
+        print('Usage: python ' + Path(__file__).name
+            + ' [--builtins] [--no-cache] {chip}.hdl [pin=value ...]'
+            + ' | --verify [{file}.tst ...]')
+        return
+
+    start = time.perf_counter()
+    compiled = compileChip(args[0], builtins=builtins, cache=cache)
+    simulator = Simulator(compiled)
+    elapsed = time.perf_counter() - start
+    print(f'{compiled.name}: {compiled.gates} gates,'
+        + f' {compiled.dffOutputs[1] - compiled.dffOutputs[0]} DFFs,'
+        + f' {len(compiled.memoryKinds)} memories'
+        + f' (loaded in {elapsed:.3f} s)')
+
+    if len(args) > 1:
+        for assignment in args[1:]:
+            pin, value = assignment.split('=')
+            simulator.set(pin, int(value, 0))
+        simulator.eval()
+        for pin, width in compiled.outputs:
+            print(f'{pin} = {simulator.get(pin)}')
+
+
+if __name__ == '__main__':
+    main()
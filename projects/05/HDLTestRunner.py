@@ -0,0 +1,35 @@
+import sys
+from pathlib import Path
+
+from HDLSimulator import NATIVE_HDL, PROJECTS, ChipSimulator
+from TestScript import loadTarget, runnerMain
+
+
+# Creates the simulator for a test script: see TestScript.runScript().
+# Like in the hardware simulator, every memory chip but the one under test is
+# native (see HDLSimulator.NATIVE_HDL), so that RAM16K.tst tests RAM16K.hdl
+# over native RAM4Ks, and CPU.tst the CPU's logic over native registers.
+def makeSimulator(path):
+    chip = Path(loadTarget(path)).stem
+    return ChipSimulator(Path(path).parent,
+        [builtin for builtin in NATIVE_HDL if builtin != chip])
+
+
+# Description: Runs the hardware simulator test scripts (those that load an
+#              .hdl chip) found in the given files and directories, projects
+#              01, 02, 03, and 05 by default, across a pool of worker
+#              processes, and compares their output with their compare files,
+#              line by line. Prints each result as it comes, with the time it
+#              took, then a summary.
+#              Scripts that wait for a key press are skipped.
+#              With --write-out, each script's output file is also written,
+#              like the hardware simulator does.
+# Input: [--workers n] [--write-out] [{file}.tst|{directory} ...]
+# Output: {file}.out for each script, with --write-out
+def main():
+    runnerMain(sys.argv[1:], Path(__file__).name, makeSimulator,
+        [PROJECTS / d for d in ('01', '02', '03', '05')], ('.hdl',))
+
+
+if __name__ == '__main__':
+    main()
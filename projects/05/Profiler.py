@@ -0,0 +1,266 @@
+import bisect
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / '06'))
+
+from CPUEmulator import HALT, ROM_SIZE, CPUEmulator, compileBlock
+from assembler import assemble, readLabels
+
+
+# Reads the labels of an assembly file: label -> ROM address. If the VM
+# translator left a source map next to it ({file}.map, written in compact
+# mode), the short labels are replaced by their verbose names.
+def loadLabels(asmFilename):
+    labels = readLabels(asmFilename)
+
+    sourceMap = Path(asmFilename).with_suffix('.map')
+    if sourceMap.exists():
+        verbose = {}
+        with sourceMap.open() as f:
+            for line in f:
+                short, name = line.split()
+                verbose[short] = name
+        labels = {verbose.get(label, label): address
+            for label, address in labels.items()}
+
+    return labels
+
+
+# Counts every instruction a Hack program executes, without sampling, and
+# attributes them to the program's labels and to its VM functions.
+# The program runs as compiled basic blocks (see CPUEmulator.runBlocks), and
+# only the blocks are counted; the counts per address are worked out from
+# them afterwards.
+# Calls and returns are followed through LCL, as laid out by the VM: a call
+# sets LCL above its current value, and a return restores it. A new frame is
+# named after the first label execution reaches once LCL has been raised,
+# which is the entry label of the function called. Programs that don't follow
+# the VM's layout should be profiled with trackCalls=False.
+# labels: label -> ROM address.
+# stacks: call stack, as a tuple of function names -> instructions executed
+#         with that call stack.
+class Profiler:
+    def __init__(self, cpu, labels=None, trackCalls=True):
+        self.cpu = cpu
+        self.labels = labels if labels is not None else {}
+        self.trackCalls = trackCalls
+
+        # ROM address -> the label declared there. If there are several, the
+        # last one wins, like the label whose code follows it.
+        self.labelAt = {}
+        for label, address in sorted(self.labels.items(), key=lambda x: x[1]):
+            self.labelAt[address] = label
+
+        # Number of times each block, by its start address, was executed,
+        # and each block's length. Instructions executed one by one at the
+        # end of a budget are counted in instructionCounts directly.
+        self.blockCounts = [0] * (ROM_SIZE + 1)
+        self.blockLengths = [0] * (ROM_SIZE + 1)
+        self.instructionCounts = [0] * (ROM_SIZE + 1)
+
+        # The call frames: a list of [LCL, function name or None while the
+        # function isn't known yet], and the named ones as a tuple.
+        self.frames = [[cpu.ram[1], '(bootstrap)']]
+        self.stack = ('(bootstrap)',)
+        self.stacks = {}
+
+    # Updates the call frames after executing code, now that LCL is lcl.
+    def followCalls(self, lcl):
+        frames = self.frames
+        if lcl > frames[-1][0]: # Call
+            frames.append([lcl, None])
+        else: # Return(s)
+            while len(frames) > 1 and frames[-1][0] > lcl:
+                if frames.pop()[1] is not None:
+                    self.stack = self.stack[:-1]
+            frames[-1][0] = lcl
+
+    # Names the frame that was just called, now that execution has reached
+    # the label at pc.
+    def nameFrame(self, pc):
+        self.frames[-1][1] = self.labelAt[pc]
+        self.stack = self.stack + (self.labelAt[pc],)
+
+    # Runs the program like CPUEmulator.run(), counting every instruction.
+    # Returns the number of instructions executed.
+    def run(self, maxCycles=None):
+        cpu = self.cpu
+        rom = cpu.rom
+        program = cpu.program
+        leaders = cpu.leaders
+        blocks = cpu.blocks
+        ram = cpu.ram
+        blockCounts = self.blockCounts
+        blockLengths = self.blockLengths
+        stacks = self.stacks
+        labelAt = self.labelAt
+        trackCalls = self.trackCalls
+        A = cpu.A
+        D = cpu.D
+        pc = cpu.PC
+
+        for address, block in enumerate(blocks):
+            if block is not None:
+                blockLengths[address] = block[1]
+
+        lcl = self.frames[-1][0]
+        pending = self.frames[-1][1] is None
+        stack = self.stack
+
+        n = -1 if maxCycles is None else maxCycles
+        start = n
+        halted = False
+        while n:
+            block = blocks[pc]
+            if block is None:
+                if program[pc] is HALT:
+                    halted = True
+                    break
+                block = compileBlock(rom, program, leaders, pc)
+                blocks[pc] = block
+                blockLengths[pc] = block[1]
+
+            function, length = block
+            if 0 < n < length:
+                break
+            blockCounts[pc] = blockCounts[pc] + 1
+            stacks[stack] = stacks.get(stack, 0) + length
+            A, D, pc = function(A, D, ram)
+            n = n - length
+
+            if trackCalls:
+                if ram[1] != lcl:
+                    lcl = ram[1]
+                    self.followCalls(lcl)
+                    pending = self.frames[-1][1] is None
+                    stack = self.stack
+                if pending and pc in labelAt:
+                    self.nameFrame(pc)
+                    pending = False
+                    stack = self.stack
+
+        cpu.A = A
+        cpu.D = D
+        cpu.PC = pc
+        cpu.halted = halted
+        executed = start - n
+        cpu.cycles = cpu.cycles + executed
+
+        # The rest of the budget, one instruction at a time.
+        while n > 0 and not cpu.halted:
+            address = cpu.PC
+            if cpu.step() == 0:
+                break
+            self.instructionCounts[address] = (
+                self.instructionCounts[address] + 1)
+            stacks[self.stack] = stacks.get(self.stack, 0) + 1
+            executed = executed + 1
+            n = n - 1
+            if trackCalls:
+                if ram[1] != self.frames[-1][0]:
+                    self.followCalls(ram[1])
+                if self.frames[-1][1] is None and cpu.PC in labelAt:
+                    self.nameFrame(cpu.PC)
+
+        return executed
+
+    # Returns the number of times each ROM address was executed.
+    def addressCounts(self):
+        counts = list(self.instructionCounts)
+        for start, count in enumerate(self.blockCounts):
+            if count:
+                for address in range(start, start + self.blockLengths[start]):
+                    counts[address] = counts[address] + count
+        return counts
+
+    # Flat profile per label: every address is attributed to the last label
+    # declared before it. Returns a list of (label, instructions), from the
+    # most executed label to the least.
+    def labelProfile(self):
+        addresses = sorted(self.labelAt)
+        names = [self.labelAt[address] for address in addresses]
+        profile = {}
+        for address, count in enumerate(self.addressCounts()):
+            if count:
+                i = bisect.bisect_right(addresses, address) - 1
+                name = names[i] if i >= 0 else '(start)'
+                profile[name] = profile.get(name, 0) + count
+        return sorted(profile.items(), key=lambda x: -x[1])
+
+    # Flat profile per function, from the call stacks. Returns a list of
+    # (function, self instructions, inclusive instructions), from the most
+    # expensive function to the least, inclusively.
+    def functionProfile(self):
+        own = {}
+        inclusive = {}
+        for stack, count in self.stacks.items():
+            own[stack[-1]] = own.get(stack[-1], 0) + count
+            for name in set(stack):
+                inclusive[name] = inclusive.get(name, 0) + count
+        return sorted(((name, own.get(name, 0), total)
+            for name, total in inclusive.items()), key=lambda x: -x[2])
+
+    # The call stacks in the collapsed format of flame graph tools: one line
+    # per stack, with the function names separated by ';', then the count.
+    def collapsedStacks(self):
+        return ''.join(f'{";".join(stack)} {count}\n'
+            for stack, count in sorted(self.stacks.items()))
+
+
+# Description: Profiles a Hack program, assembled from the given assembly
+#              file, for the given number of cycles or until it halts, and
+#              prints its flat profile: per VM function by default, or per
+#              label with --labels. --collapsed writes the call stacks for
+#              flame graph tools. --flat doesn't follow calls, for programs
+#              that don't use the VM's memory layout.
+# Input: {file}.asm [cycles] [--labels] [--flat] [--collapsed {file}]
+def main():
+    args = sys.argv[1:]
+    byLabel = '--labels' in args
+    if byLabel:
+        args.remove('--labels')
+    trackCalls = '--flat' not in args
+    if not trackCalls:
+        args.remove('--flat')
+    collapsed = None
+    if '--collapsed' in args:
+        i = args.index('--collapsed')
+        collapsed = args[i + 1]
+        del args[i:i + 2]
+
+    # Invalid number of arguments given.
+    if len(args) not in (1, 2):
+        print('Usage: python ' + Path(__file__).name
+            + ' {file}.asm [cycles] [--labels] [--flat]'
+            + ' [--collapsed {file}]')
+        return
+
+    maxCycles = int(args[1]) if len(args) == 2 else None
+
+    rom = [int(instruction, 2) for instruction in assemble(args[0])]
+    cpu = CPUEmulator(rom, compiled=True)
+    profiler = Profiler(cpu, loadLabels(args[0]), trackCalls)
+    start = time.perf_counter()
+    executed = profiler.run(maxCycles)
+    elapsed = time.perf_counter() - start
+    print(f'{executed} instructions in {elapsed:.3f} s'
+        + (', halted' if cpu.halted else ''))
+
+    if byLabel or not trackCalls:
+        print(f'{"self":>12} {"%":>6}  label')
+        for name, count in profiler.labelProfile()[:40]:
+            print(f'{count:12} {100 * count / executed:6.2f}  {name}')
+    else:
+        print(f'{"self":>12} {"%":>6} {"inclusive":>12} {"%":>6}  function')
+        for name, own, total in profiler.functionProfile()[:40]:
+            print(f'{own:12} {100 * own / executed:6.2f}'
+                + f' {total:12} {100 * total / executed:6.2f}  {name}')
+
+    if collapsed is not None:
+        Path(collapsed).write_text(profiler.collapsedStacks())
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,178 @@
+import struct
+import sys
+import zlib
+from pathlib import Path
+
+import numpy as np
+
+from CPUEmulator import KBD, SCREEN, CPUEmulator
+
+# Size of the screen, in pixels.
+WIDTH = 512
+HEIGHT = 256
+
+
+# Gives access to the memory-mapped screen and keyboard of a CPUEmulator,
+# and renders the screen into PBM or PNG images.
+# The screen is read straight from the emulator's RAM, through a NumPy view
+# that shares its buffer, so the emulator runs at full speed: nothing happens
+# on each instruction. When a frame is rendered, only the rows that changed
+# since the previous frame are converted into pixels again.
+# rowsRendered: the number of rows converted into pixels so far.
+class Screen:
+    def __init__(self, cpu):
+        self.cpu = cpu
+        self.buffer = None
+        # The screen's words as they were when last rendered, and the
+        # rendered rows, packed 8 pixels per byte, leftmost pixel first.
+        self.last = np.zeros((HEIGHT, WIDTH // 16), dtype=np.uint16)
+        self.packed = np.zeros((HEIGHT, WIDTH // 8), dtype=np.uint8)
+        self.rowsRendered = 0
+
+    # The screen memory as a (256, 32) array of 16-bit words, without any
+    # copy: writing to it writes to the emulator's RAM.
+    def words(self):
+        # The view is rebuilt if the emulator's RAM has been replaced.
+        if self.buffer is not self.cpu.ram:
+            self.buffer = self.cpu.ram
+            self.view = np.frombuffer(self.buffer, dtype=np.uint16,
+                count=HEIGHT * WIDTH // 16, offset=SCREEN * 2
+            ).reshape(HEIGHT, WIDTH // 16)
+        return self.view
+
+    # The screen as a (256, 512) array of booleans, True for black pixels.
+    # In each word, the least significant bit is the leftmost pixel.
+    def pixels(self):
+        data = self.words().astype('<u2').view(np.uint8)
+        return np.unpackbits(data, axis=1, bitorder='little').astype(bool)
+
+    # Returns the indices of the rows that changed since the last render().
+    def dirtyRows(self):
+        return np.flatnonzero((self.words() != self.last).any(axis=1))
+
+    # Converts the rows that changed since the last call into pixels.
+    # Returns the screen, packed 8 pixels per byte, leftmost pixel first.
+    def render(self):
+        words = self.words()
+        rows = self.dirtyRows()
+        if len(rows) > 0:
+            changed = words[rows]
+            data = changed.astype('<u2').view(np.uint8)
+            pixels = np.unpackbits(data, axis=1, bitorder='little')
+            self.packed[rows] = np.packbits(pixels, axis=1)
+            self.last[rows] = changed
+            self.rowsRendered = self.rowsRendered + len(rows)
+        return self.packed
+
+    # Renders the screen into a binary PBM (P4) image.
+    def toPBM(self):
+        header = f'P4\n{WIDTH} {HEIGHT}\n'.encode()
+        return header + self.render().tobytes()
+
+    # Renders the screen into a 1-bit grayscale PNG image.
+    def toPNG(self):
+        # In PNG, 0 is black.
+        rows = ~self.render()
+        raw = b''.join(b'\x00' + row.tobytes() for row in rows)
+
+        def chunk(tag, data):
+            return (struct.pack('>I', len(data)) + tag + data
+                + struct.pack('>I', zlib.crc32(tag + data)))
+
+        return (b'\x89PNG\r\n\x1a\n'
+            + chunk(b'IHDR', struct.pack('>IIBBBBB', WIDTH, HEIGHT, 1, 0, 0,
+                0, 0))
+            + chunk(b'IDAT', zlib.compress(raw))
+            + chunk(b'IEND', b''))
+
+    # Sets the key currently pressed: its Hack character code, or 0 if none.
+    def press(self, key):
+        self.cpu.ram[KBD] = key
+
+    # Runs the emulator for the given number of cycles, saving a frame every
+    # frameInterval cycles into the output directory, as frame{n}.pbm or
+    # frame{n}.png. Stops early if the program halts.
+    # keys: scripted key presses, a list of (cycle, key) pairs. Each key is
+    #       written to KBD exactly when the emulator reaches that cycle,
+    #       counted from the start of this run. Key 0 releases the key.
+    # Returns the list of frame files written.
+    def record(self, cycles, frameInterval, output, format='pbm', keys=()):
+        if frameInterval < 1:
+            raise Exception('The frame interval must be at least 1 cycle!')
+        output = Path(output)
+        output.mkdir(parents=True, exist_ok=True)
+        render = self.toPNG if format == 'png' else self.toPBM
+
+        events = sorted(keys)
+        nextKey = 0
+        nextFrame = frameInterval
+        elapsed = 0
+        frames = []
+        while elapsed < cycles and not self.cpu.halted:
+            while nextKey < len(events) and events[nextKey][0] <= elapsed:
+                self.press(events[nextKey][1])
+                nextKey = nextKey + 1
+
+            # Runs up to the next frame or key press, whichever is first.
+            stop = min(nextFrame, cycles)
+            if nextKey < len(events):
+                stop = min(stop, events[nextKey][0])
+            elapsed = elapsed + self.cpu.run(stop - elapsed)
+
+            if elapsed == nextFrame or self.cpu.halted:
+                path = output / f'frame{len(frames):05}.{format}'
+                path.write_bytes(render())
+                frames.append(path)
+                nextFrame = nextFrame + frameInterval
+
+        return frames
+
+
+# Parses scripted key presses given as cycle:key,cycle:key,...
+def parseKeys(string):
+    keys = []
+    for press in string.split(','):
+        cycle, key = press.split(':')
+        keys.append((int(cycle), int(key)))
+    return keys
+
+
+# Description: Runs a Hack program headless for the given number of cycles
+#              and saves its screen every frameInterval cycles.
+#              --png saves PNG images instead of PBM ones.
+#              --keys injects key presses into KBD at the given cycles.
+# Input: {file}.hack cycles frameInterval {directory} [--png]
+#        [--keys cycle:key,...]
+# Output: {directory}/frame{n}.[pbm|png]
+def main():
+    args = sys.argv[1:]
+    format = 'pbm'
+    if '--png' in args:
+        args.remove('--png')
+        format = 'png'
+    keys = []
+    if '--keys' in args:
+        i = args.index('--keys')
+        keys = parseKeys(args[i + 1])
+        del args[i:i + 2]
+
+    # Invalid number of arguments given.
+    if len(args) != 4:
+        print('Usage: python ' + Path(__file__).name
+            + ' {file}.hack cycles frameInterval {directory} [--png]'
+            + ' [--keys cycle:key,...]')
+        return
+
+    # A frame is saved every frameInterval cycles, so it must be at least 1.
+    if int(args[2]) < 1:
+        print('The frame interval must be at least 1 cycle!')
+        return
+
+    cpu = CPUEmulator(args[0], compiled=True)
+    screen = Screen(cpu)
+    frames = screen.record(int(args[1]), int(args[2]), args[3], format, keys)
+    print(f'{len(frames)} frames, {screen.rowsRendered} rows rendered')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,360 @@
+import os
+import re
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from pathlib import Path
+
+
+# Splits a test script into tokens: braces, command separators (',' and ';'),
+# quoted strings, and words. Comments are dropped.
+TOKEN = re.compile(r'"[^"]*"|[{},;]|[^\s{},;]+')
+COMMENT = re.compile(r'//[^\n]*|/\*.*?\*/', re.DOTALL)
+
+# A while loop that runs this many times is taken to wait for something that
+# only a user can do, such as pressing a key.
+MAX_ITERATIONS = 100000
+
+
+# Parses a test script of the nand2tetris simulators into a list of commands.
+# Each command is a list of words, except loops:
+#     ['repeat', count, body]   count is None for 'repeat { ... }'
+#     ['while', condition, body]   condition is [variable, operator, value]
+# where body is itself a list of commands.
+def parseScript(text):
+    tokens = TOKEN.findall(COMMENT.sub('', text))
+    commands, end = parseCommands(tokens, 0)
+    if end != len(tokens):
+        raise Exception("Unexpected '}' in the test script!")
+    return commands
+
+
+# Parses commands starting at tokens[i], until the end of the tokens or a
+# closing brace. Returns the commands and the index where it stopped.
+def parseCommands(tokens, i):
+    commands = []
+    words = []
+    while i < len(tokens) and tokens[i] != '}':
+        token = tokens[i]
+        i = i + 1
+        if token in (',', ';'):
+            if words:
+                commands.append(words)
+            words = []
+        elif token == '{':
+            body, i = parseCommands(tokens, i)
+            if i == len(tokens):
+                raise Exception("Missing '}' in the test script!")
+            i = i + 1
+            if words[0] == 'repeat':
+                count = int(words[1]) if len(words) > 1 else None
+                commands.append(['repeat', count, body])
+            elif words[0] == 'while':
+                commands.append(['while', words[1:], body])
+            else:
+                raise Exception(f'Unexpected block after {words[0]}!')
+            words = []
+        else:
+            words.append(token)
+
+    if words:
+        commands.append(words)
+    return commands, i
+
+
+# Parses a value as written in test scripts: decimal, or %B (binary), %X
+# (hexadecimal), %D (decimal) followed by the digits.
+def parseValue(string):
+    if string.startswith('%B'):
+        return int(string[2:], 2)
+    elif string.startswith('%X'):
+        return int(string[2:], 16)
+    elif string.startswith('%D'):
+        return int(string[2:])
+    return int(string)
+
+
+# Parses an output-list item such as RAM[0]%D2.6.2 into a tuple:
+# (variable, format, left padding, width, right padding).
+def parseOutputItem(item):
+    name, spec = item.split('%')
+    left, width, right = spec[1:].split('.')
+    return (name, spec[0], int(left), int(width), int(right))
+
+
+# Formats the header line of an output list: each variable's name centered in
+# its column, truncated if it doesn't fit.
+def formatHeader(outputList):
+    cells = []
+    for name, format, left, width, right in outputList:
+        space = left + width + right
+        name = name[:space]
+        before = (space - len(name)) // 2
+        cells.append(' ' * before + name + ' ' * (space - before - len(name)))
+    return '|' + '|'.join(cells) + '|'
+
+
+# Formats a value for an output list.
+# D: decimal, right-aligned. B: binary and X: hexadecimal, both with exactly
+# width digits. S: a string, left-aligned.
+def formatValue(value, format, left, width, right):
+    if format == 'D':
+        text = str(value).rjust(width)
+    elif format == 'B':
+        text = f'{value & ((1 << width) - 1):0{width}b}'
+    elif format == 'X':
+        text = f'{value & ((1 << (4 * width)) - 1):0{width}X}'
+    elif format == 'S':
+        text = str(value).ljust(width)[:width]
+    else:
+        raise Exception(f'Invalid output format: %{format}')
+    return ' ' * left + text + ' ' * right
+
+
+# Tells whether an output line matches a line of the compare file, where '*'
+# matches any character.
+def linesMatch(line, expected):
+    if len(line) != len(expected):
+        return False
+    for char, expectedChar in zip(line, expected):
+        if char != expectedChar and expectedChar != '*':
+            return False
+    return True
+
+
+# Evaluates a while condition such as ['out', '<>', '75'].
+def conditionHolds(value, operator, other):
+    if operator == '=':
+        return value == other
+    elif operator == '<>':
+        return value != other
+    elif operator == '<':
+        return value < other
+    elif operator == '>':
+        return value > other
+    elif operator == '<=':
+        return value <= other
+    elif operator == '>=':
+        return value >= other
+    raise Exception(f'Invalid operator: {operator}')
+
+
+# Raised when an output line doesn't match the compare file.
+class ComparisonFailure(Exception):
+    pass
+
+
+# Raised when a script can't be run to its end without a user, such as one
+# that repeats forever or waits for a key.
+class ScriptSkipped(Exception):
+    pass
+
+
+# Runs a test script against a simulator. The commands shared by every
+# simulator (output-file, compare-to, output-list, output, echo, repeat,
+# while) are handled here; the others are passed on to the simulator, which
+# provides:
+#     load(name): loads a program or chip, relative to the script's directory.
+#     get(variable), set(variable, value): read and write its state.
+#     command(words, times): executes a simulation command such as 'ticktock'
+#         or 'eval' the given number of times in a row.
+# A 'repeat' whose body is a single simulation command is handed over as is,
+# so that simulators can run it at full speed.
+# writeOutput: if True, the output file is written next to the script, like
+#              the Java tools do. By default, the output is only compared.
+class ScriptRunner:
+    def __init__(self, path, simulator, writeOutput=False):
+        self.path = Path(path)
+        self.simulator = simulator
+        self.writeOutput = writeOutput
+        self.outputList = []
+        self.outputFile = None
+        self.compareLines = None
+        self.lineNum = 0
+        self.messages = []
+
+    # Runs the whole script. Raises ComparisonFailure at the first output
+    # line that doesn't match the compare file.
+    def run(self):
+        try:
+            self.execute(parseScript(self.path.read_text()))
+        finally:
+            if self.outputFile is not None:
+                self.outputFile.close()
+
+    def execute(self, commands):
+        for words in commands:
+            name = words[0]
+            if name == 'repeat':
+                body = words[2]
+                if words[1] is None:
+                    raise ScriptSkipped('The script repeats forever!')
+                if len(body) == 1 and body[0][0] not in (
+                    'repeat', 'while', 'output', 'set', 'echo'
+                ):
+                    self.simulator.command(body[0], words[1])
+                else:
+                    for i in range(words[1]):
+                        self.execute(body)
+            elif name == 'while':
+                variable, operator, value = words[1]
+                iterations = 0
+                while conditionHolds(self.simulator.get(variable), operator,
+                    parseValue(value)
+                ):
+                    if iterations == MAX_ITERATIONS:
+                        raise ScriptSkipped('The script repeats forever: while'
+                            + f' {variable} {operator} {value}')
+                    self.execute(words[2])
+                    iterations = iterations + 1
+            elif name == 'load':
+                self.simulator.load(words[1] if len(words) > 1 else None)
+            elif name == 'output-file':
+                if self.writeOutput:
+                    self.outputFile = (self.path.parent / words[1]).open('w')
+            elif name == 'compare-to':
+                with (self.path.parent / words[1]).open() as f:
+                    self.compareLines = f.read().splitlines()
+            elif name == 'output-list':
+                self.outputList = [parseOutputItem(item) for item in words[1:]]
+                self.writeLine(formatHeader(self.outputList))
+            elif name == 'output':
+                self.writeLine('|' + '|'.join(
+                    formatValue(self.simulator.get(item[0]), *item[1:])
+                    for item in self.outputList) + '|')
+            elif name == 'set':
+                self.simulator.set(words[1], parseValue(words[2]))
+            elif name == 'echo':
+                self.messages.append(' '.join(words[1:]).strip('"'))
+            elif name in ('clear-echo', 'breakpoint', 'clear-breakpoints'):
+                pass
+            else:
+                self.simulator.command(words, 1)
+
+    # Writes an output line, and compares it with the compare file.
+    def writeLine(self, line):
+        if self.outputFile is not None:
+            self.outputFile.write(line + '\n')
+
+        self.lineNum = self.lineNum + 1
+        if self.compareLines is not None:
+            if self.lineNum > len(self.compareLines):
+                raise ComparisonFailure(
+                    f'Comparison failure at line {self.lineNum}:'
+                    + ' the compare file has no more lines')
+            expected = self.compareLines[self.lineNum - 1]
+            if not linesMatch(line, expected):
+                raise ComparisonFailure(
+                    f'Comparison failure at line {self.lineNum}:\n'
+                    + f'  expected: {expected}\n  got:      {line}')
+
+
+# Runs a single test script with a new simulator from makeSimulator(path).
+# Returns (path, status, message, elapsed seconds), where status is one of
+# PASS, FAIL, ERROR, or SKIP. A script without a compare-to command checks
+# nothing, so it's skipped.
+# writeOutput: see ScriptRunner.
+def runScript(path, makeSimulator, writeOutput=False):
+    start = time.perf_counter()
+    try:
+        runner = ScriptRunner(path, makeSimulator(path), writeOutput)
+        runner.run()
+        if runner.compareLines is None:
+            raise ScriptSkipped('The script has no compare file!')
+        status = 'PASS'
+        message = ''
+    except ComparisonFailure as e:
+        status = 'FAIL'
+        message = str(e)
+    except ScriptSkipped as e:
+        status = 'SKIP'
+        message = str(e)
+    except Exception as e:
+        status = 'ERROR'
+        message = f'{type(e).__name__}: {e}'
+    return (str(path), status, message, time.perf_counter() - start)
+
+
+# Runs the test scripts across a pool of worker processes. Yields each
+# result, as returned by runScript(), as soon as its script is done.
+# makeSimulator must be a module-level function so it can be sent to the
+# workers.
+def runScripts(paths, makeSimulator, workers=None, writeOutput=False):
+    with ProcessPoolExecutor(workers) as pool:
+        futures = [pool.submit(runScript, path, makeSimulator, writeOutput)
+            for path in paths]
+        for future in as_completed(futures):
+            yield future.result()
+
+
+# Returns the target of a script's first load command, or None if it
+# doesn't have any, so that runners can pick the scripts meant for them.
+def loadTarget(path):
+    for words in parseScript(Path(path).read_text()):
+        if words[0] == 'load':
+            return words[1] if len(words) > 1 else ''
+    return None
+
+
+# Finds the test scripts in the given files and directories, and keeps those
+# whose first load command targets a file with one of the given suffixes.
+def findScripts(inputs, suffixes):
+    scripts = []
+    for input in inputs:
+        input = Path(input)
+        candidates = [input] if input.is_file() else sorted(input.rglob('*.tst'))
+        for script in candidates:
+            target = loadTarget(script)
+            if target is not None and Path(target).suffix in suffixes:
+                scripts.append(script)
+    return scripts
+
+
+# Prints each result as it comes, then a summary. Returns True if every
+# script that ran passed.
+def report(results):
+    counts = {'PASS': 0, 'FAIL': 0, 'ERROR': 0, 'SKIP': 0}
+    total = 0
+    for path, status, message, elapsed in results:
+        counts[status] = counts[status] + 1
+        total = total + elapsed
+        print(f'{status:5} {elapsed:8.3f} s  {path}')
+        if message:
+            for line in message.splitlines():
+                print(f'               {line}')
+
+    print(f'{counts["PASS"]} passed, {counts["FAIL"]} failed,'
+        + f' {counts["ERROR"]} errors, {counts["SKIP"]} skipped'
+        + f' ({total:.3f} s of test time)')
+    return counts['FAIL'] == 0 and counts['ERROR'] == 0
+
+
+# The command line of a test script runner: runs the scripts found in the
+# given files and directories, or in defaultInputs if none are given, whose
+# first load command targets a file with one of the given suffixes (see
+# findScripts()), across a pool of worker processes. Reports them (see
+# report()), then exits with status 1 if any failed.
+# name: the runner's file name, for its usage line.
+# makeSimulator: see runScripts().
+# Input: [--workers n] [--write-out] [{file}.tst|{directory} ...]
+def runnerMain(args, name, makeSimulator, defaultInputs, suffixes):
+    workers = os.cpu_count()
+    if '--workers' in args:
+        i = args.index('--workers')
+        workers = int(args[i + 1])
+        del args[i:i + 2]
+    writeOutput = '--write-out' in args
+    if writeOutput:
+        args.remove('--write-out')
+
+    if any(arg.startswith('--') for arg in args):
+        print('Usage: python ' + name
+            + ' [--workers n] [--write-out] [{file}.tst|{directory} ...]')
+        return
+
+    scripts = findScripts(args or defaultInputs, suffixes)
+    start = time.perf_counter()
+    passed = report(runScripts(scripts, makeSimulator, workers, writeOutput))
+    print(f'{len(scripts)} scripts in {time.perf_counter() - start:.3f} s'
+        + f' with {workers} workers')
+    sys.exit(0 if passed else 1)
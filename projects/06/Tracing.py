@@ -0,0 +1,100 @@
+import json
+import os
+import time
+from contextlib import contextmanager, nullcontext
+
+
+# Records timed spans and counters while a tool runs, and exports them as
+# Chrome trace-event JSON, to be opened in chrome://tracing or Perfetto.
+# Spans are phases such as parsing or translating a file; they may nest.
+# Counters are named tables of counts, such as commands by type.
+class Tracer:
+    enabled = True
+
+    def __init__(self):
+        self.origin = time.perf_counter()
+        self.events = []
+        self.counters = {}
+
+    # Microseconds since the tracer was created.
+    def now(self):
+        return (time.perf_counter() - self.origin) * 1e6
+
+    # Times the code run inside a with block as a span. args are shown with
+    # the span.
+    @contextmanager
+    def span(self, name, **args):
+        start = self.now()
+        try:
+            yield
+        finally:
+            self.events.append({'name': name, 'ph': 'X', 'ts': start,
+                'dur': self.now() - start, 'pid': os.getpid(), 'tid': 0,
+                'args': args})
+
+    # Adds n to the count of key in the given counter.
+    def count(self, counter, key, n=1):
+        counts = self.counters.setdefault(counter, {})
+        counts[key] = counts.get(key, 0) + n
+
+    # Writes the spans, and the counters' final counts, to a JSON file.
+    def export(self, path):
+        end = self.now()
+        events = self.events + [{'name': counter, 'ph': 'C', 'ts': end,
+            'pid': os.getpid(), 'tid': 0, 'args': counts}
+            for counter, counts in self.counters.items()]
+        with open(path, 'w') as f:
+            json.dump({'traceEvents': events, 'displayTimeUnit': 'ms'}, f,
+                indent=1)
+
+
+# The tracer used when tracing is off: every span and count does nothing.
+# Code that counts once per command checks enabled first, so that tracing
+# costs nothing in the inner loops when it's off.
+class NullTracer:
+    enabled = False
+
+    def span(self, name, **args):
+        return nullcontext()
+
+    def count(self, counter, key, n=1):
+        pass
+
+
+NULL_TRACER = NullTracer()
+
+
+# Wraps a file being written with Hack assembly, and counts the instructions
+# written to it: the lines that are neither comments nor labels.
+class InstructionCounter:
+    def __init__(self, file):
+        self.file = file
+        self.instructions = 0
+
+    def write(self, text):
+        if text.count('\n') <= 1: # A single line, as most writes are.
+            if text.strip() and text[0] not in '/(':
+                self.instructions = self.instructions + 1
+        else:
+            for line in text.splitlines():
+                if line and not line.startswith(('//', '(')):
+                    self.instructions = self.instructions + 1
+        return self.file.write(text)
+
+    def __getattr__(self, name):
+        return getattr(self.file, name)
+
+
+# Returns a Tracer if --trace {file}.json is in the command line arguments,
+# which it removes from them, or else the NullTracer. Also returns the path
+# of the file to export the trace to, or None. A --trace without a file is
+# left in the arguments, for the caller to print its usage.
+def tracerFromArgs(args):
+    if '--trace' not in args:
+        return NULL_TRACER, None
+    i = args.index('--trace')
+    if i + 1 == len(args) or args[i + 1].startswith('--'):
+        return NULL_TRACER, None
+    path = args[i + 1]
+    del args[i:i + 2]
+    return Tracer(), path
@@ -1,5 +1,8 @@
 import sys
 from enum import Enum
+from pathlib import Path
+
+from Tracing import NULL_TRACER, tracerFromArgs
 
 
 class CommandType(Enum):
@@ -200,42 +203,92 @@ class SymbolTable:
         return self.table[symbol]
 
 
-def main():
-    asmFilename = sys.argv[1]
-    hackFilename = asmFilename.split('.')[0] + '.hack'
-
-    # First iteration through the file. Finds all the label declarations and
-    # adds it to the symbol table.
+# First iteration through the file. Finds all the label declarations and
+# returns them in a dictionary: label -> ROM address.
+def readLabels(asmFilename):
+    labels = {}
     lineNum = 0
-    sTable = SymbolTable()
     p = Parser(asmFilename)
     while p.advance():
         if p.commandType != CommandType.L_COMMAND:
             lineNum = lineNum + 1
         else:
-            sTable.addEntry(p.symbol, lineNum)
+            labels[p.symbol] = lineNum
+    return labels
+
+
+# Translates the assembly file into binary. Yields each instruction in turn,
+# as a string of 16 binary digits.
+# tracer: times the label pass, and counts the commands by type and the
+#         A-instructions by kind of value (see Tracing.Tracer).
+def assemble(asmFilename, tracer=NULL_TRACER):
+    # Adds all the labels to the symbol table.
+    sTable = SymbolTable()
+    with tracer.span('label pass', file=asmFilename):
+        for label, address in readLabels(asmFilename).items():
+            sTable.addEntry(label, address)
 
     # Second iteration through the file. Translates each command into binary
     # and also manages each variable in the assembly program.
+    counting = tracer.enabled
     varCount = 16
     p = Parser(asmFilename)
+    while p.advance():
+        if counting:
+            tracer.count('commands', p.commandType.name)
+        if p.commandType == CommandType.A_COMMAND:
+            symbol = p.symbol
+
+            if symbol[0].isdigit(): # The symbol is a decimal number.
+                kind = 'number'
+                yield Translator.aTranslate(symbol)
+            elif sTable.contains(symbol): # The symbol is a label.
+                kind = 'known symbol'
+                yield Translator.aTranslate(sTable.getAddress(symbol))
+            else: # The symbol is a variable.
+                kind = 'new variable'
+                sTable.addEntry(symbol, varCount)
+                varCount = varCount + 1
+                yield Translator.aTranslate(sTable.getAddress(symbol))
+            if counting:
+                tracer.count('A-instructions', kind)
+        elif p.commandType == CommandType.C_COMMAND:
+            yield Translator.cTranslate(p.comp, p.dest, p.jump)
+
+
+# Description: Translates a Hack assembly file into binary.
+#              With --trace, the time spent in each phase and the number of
+#              commands of each type are written to a Chrome trace-event JSON
+#              file. The instructions are then all encoded before being
+#              written, so that both phases are timed apart.
+# Input: [--trace {trace}.json] {file}.asm
+# Output: {file}.hack
+def main():
+    args = sys.argv[1:]
+    tracer, tracePath = tracerFromArgs(args)
+
+    # Invalid number of arguments given.
+    if len(args) != 1 or args[0].startswith('--'):
+        print('Usage: python ' + Path(__file__).name
+            + ' [--trace {trace}.json] {file}.asm')
+        return
+
+    asmFilename = args[0]
+    hackFilename = asmFilename.split('.')[0] + '.hack'
+
     with open(hackFilename, 'w') as f:
-        while p.advance():
-            if p.commandType == CommandType.A_COMMAND:
-                symbol = p.symbol
-
-                if symbol[0].isdigit(): # The symbol is a decimal number.
-                    f.write(Translator.aTranslate(symbol) + '\n')
-                elif sTable.contains(symbol): # The symbol is a label.
-                    f.write(Translator.aTranslate(
-                        sTable.getAddress(symbol))+ '\n')
-                else: # The symbol is a variable.
-                    sTable.addEntry(symbol, varCount)
-                    varCount = varCount + 1
-                    f.write(Translator.aTranslate(
-                        sTable.getAddress(symbol)) + '\n')
-            elif p.commandType == CommandType.C_COMMAND:
-                f.write(Translator.cTranslate(p.comp, p.dest, p.jump) + '\n')
+        if not tracer.enabled:
+            for instruction in assemble(asmFilename):
+                f.write(instruction + '\n')
+        else:
+            with tracer.span('encode', file=asmFilename):
+                instructions = list(assemble(asmFilename, tracer))
+            with tracer.span('write', file=hackFilename):
+                for instruction in instructions:
+                    f.write(instruction + '\n')
+
+    if tracePath is not None:
+        tracer.export(tracePath)
 
 if __name__ == '__main__':
     main()
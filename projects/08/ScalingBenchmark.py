@@ -0,0 +1,202 @@
+import math
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+from VMGenerator import ProgramGenerator, writeProgram
+
+PROJECTS = Path(__file__).resolve().parent.parent
+
+# Each tool: (name, whether it takes the flat program, its command line given
+# the program's directory, and the file it writes, whose size is measured,
+# or None). They run in this order for each size, so that each run of the
+# assembler gets the output of the VM translator just before it: the compact
+# one, then the verbose one.
+TOOLS = [
+    ('07/VMTranslator.py', True,
+        lambda d: [PROJECTS / '07' / 'VMTranslator.py', d / 'Main.vm'],
+        None),
+    ('08/VMTranslator.py --compact', False,
+        lambda d: [PROJECTS / '08' / 'VMTranslator.py', '--compact', d],
+        lambda d: d / (d.name + '.asm')),
+    ('06/assembler.py (compact)', False,
+        lambda d: [PROJECTS / '06' / 'assembler.py', d / (d.name + '.asm')],
+        None),
+    ('08/VMTranslator.py', False,
+        lambda d: [PROJECTS / '08' / 'VMTranslator.py', d],
+        lambda d: d / (d.name + '.asm')),
+    ('06/assembler.py', False,
+        lambda d: [PROJECTS / '06' / 'assembler.py', d / (d.name + '.asm')],
+        None),
+]
+
+# The tools compared by compareCompact(): the verbose and the compact VM
+# translator, and the assembler on the output of each.
+COMPACT = ('08/VMTranslator.py', '08/VMTranslator.py --compact',
+    '06/assembler.py', '06/assembler.py (compact)')
+
+# The width of the bars of the plots, in characters.
+BAR_WIDTH = 40
+
+# Runs a script as its own process would, if one is given, then prints the
+# peak resident memory of the process, in kB, on the last line of stderr.
+# The peak is read from /proc, since the ru_maxrss of a child process also
+# counts the memory of its parent at the time it forked.
+WRAPPER = '''
+import resource, runpy, sys
+try:
+    if len(sys.argv) > 1:
+        sys.argv = sys.argv[1:]
+        sys.path.insert(0, sys.argv[0].rsplit('/', 1)[0])
+        runpy.run_path(sys.argv[0], run_name='__main__')
+finally:
+    try:
+        with open('/proc/self/status') as f:
+            peak = [line.split()[1] for line in f if line.startswith('VmHWM')][0]
+    except OSError:
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    print(peak, file=sys.stderr)
+'''
+
+
+# Runs a Python script in a new process (the bare interpreter if no
+# arguments are given). Returns the elapsed time in seconds, and the peak
+# resident memory of the process in MB.
+def measure(args):
+    start = time.perf_counter()
+    process = subprocess.run([sys.executable, '-c', WRAPPER]
+        + [str(arg) for arg in args], stdout=subprocess.DEVNULL,
+        stderr=subprocess.PIPE, text=True)
+    elapsed = time.perf_counter() - start
+    if process.returncode != 0:
+        raise Exception(f'{" ".join(map(str, args))} failed!\n'
+            + process.stderr)
+    return elapsed, int(process.stderr.split()[-1]) / 1024
+
+
+# Returns the exponent k of the power law y = c * x^k that best fits the
+# points, by least squares on their logarithms.
+def powerLaw(xs, ys):
+    xs = [math.log(x) for x in xs]
+    ys = [math.log(max(y, 1e-9)) for y in ys]
+    n = len(xs)
+    meanX = sum(xs) / n
+    meanY = sum(ys) / n
+    variance = sum((x - meanX) ** 2 for x in xs)
+    if variance == 0:
+        return float('nan')
+    return sum((x - meanX) * (y - meanY) for x, y in zip(xs, ys)) / variance
+
+
+# Prints a tool's results as a table with a bar for each size: the time per
+# command, so that a tool that scales linearly has bars of the same length
+# once start-up doesn't matter anymore. Followed by the exponents of the
+# power laws that fit the time and the memory above the interpreter's own,
+# over the sizes of at least 10000 commands.
+def plot(name, rows, baseline):
+    print(name)
+    print('  commands   seconds  us/command  peak MB')
+    longest = max(seconds / commands
+        for commands, seconds, memory, size in rows)
+    for commands, seconds, memory, size in rows:
+        perCommand = seconds / commands
+        bar = '#' * max(1, round(BAR_WIDTH * perCommand / longest))
+        print(f'  {commands:8} {seconds:9.3f} {perCommand * 1e6:11.1f}'
+            + f' {memory:8.1f}  {bar}')
+
+    large = [row for row in rows if row[0] >= 10000]
+    if len(large) >= 2:
+        commands = [row[0] for row in large]
+        timeExponent = powerLaw(commands, [row[1] for row in large])
+        memoryExponent = powerLaw(commands,
+            [row[2] - baseline for row in large])
+        print(f'  time ~ n^{timeExponent:.2f},'
+            + f' memory above the interpreter ~ n^{memoryExponent:.2f}')
+    print()
+
+
+# Prints, for each size, the size of the VM translator's output in compact
+# mode against the verbose one, and the time the assembler takes on each.
+def compareCompact(results):
+    verbose, compact, assembler, compactAssembler = (results[name]
+        for name in COMPACT)
+    print('08/VMTranslator.py --compact against verbose')
+    print('              output kB                assembler seconds')
+    print('  commands   verbose   compact  change   verbose   compact  change')
+    for v, c, a, ca in zip(verbose, compact, assembler, compactAssembler):
+        print(f'  {v[0]:8} {v[3] / 1024:9.1f} {c[3] / 1024:9.1f}'
+            + f' {c[3] / v[3] - 1:+7.0%} {a[1]:9.3f} {ca[1]:9.3f}'
+            + f' {ca[1] / a[1] - 1:+7.0%}')
+    print()
+
+
+# Description: Measures how the VM translators and the assembler scale with
+#              the size of their input. For each size, generates a VM program
+#              of that many commands (see VMGenerator.py), and its flat
+#              version for the translator of project 07, then runs each tool
+#              on it in a new process, measuring the time it takes and its
+#              peak memory. Plots both against the size, for each tool.
+#              Then compares the compact output of the VM translator with
+#              the verbose one: its size, and the time the assembler takes.
+#              --sizes: comma-separated numbers of commands.
+#              --depth, --labels, --statics: the shape of the programs.
+#              --csv: also writes every measurement to a CSV file.
+# Input: [--sizes n,n,...] [--depth n] [--labels p] [--statics p]
+#        [--csv {file}.csv]
+def main():
+    args = sys.argv[1:]
+    options = {'--sizes': '1000,3000,10000,30000,100000', '--depth': '4',
+        '--labels': '0.1', '--statics': '0.1', '--csv': None}
+    for option in options:
+        if option in args:
+            i = args.index(option)
+            options[option] = args[i + 1]
+            del args[i:i + 2]
+
+    if args:
+        print('Usage: python ' + Path(__file__).name
+            + ' [--sizes n,n,...] [--depth n] [--labels p] [--statics p]'
+            + ' [--csv {file}.csv]')
+        return
+
+    sizes = [int(size) for size in options['--sizes'].split(',')]
+    baseline = measure([])[1]
+    results = {name: [] for name, flat, command, output in TOOLS}
+    with tempfile.TemporaryDirectory() as directory:
+        for size in sizes:
+            programs = {}
+            for flat in (False, True):
+                program = Path(directory) / f'Program{size}{"Flat" * flat}'
+                generator = ProgramGenerator(size,
+                    depth=int(options['--depth']),
+                    labels=float(options['--labels']),
+                    statics=float(options['--statics']), flat=flat)
+                programs[flat] = (program,
+                    writeProgram(program, generator.generate()))
+
+            for name, flat, command, output in TOOLS:
+                program, commands = programs[flat]
+                seconds, memory = measure(command(program))
+                size = output(program).stat().st_size if output else None
+                results[name].append((commands, seconds, memory, size))
+                print(f'{name}: {commands} commands in {seconds:.3f} s,'
+                    + f' {memory:.1f} MB', file=sys.stderr)
+
+    print(f'\nPeak memory of the bare interpreter: {baseline:.1f} MB\n')
+    for name, rows in results.items():
+        plot(name, rows, baseline)
+    compareCompact(results)
+
+    if options['--csv'] is not None:
+        with open(options['--csv'], 'w') as f:
+            f.write('tool,commands,seconds,peak MB,output bytes\n')
+            for name, rows in results.items():
+                for commands, seconds, memory, size in rows:
+                    f.write(f'{name},{commands},{seconds:.6f},{memory:.1f},'
+                        + f'{"" if size is None else size}\n')
+
+
+if __name__ == '__main__':
+    main()
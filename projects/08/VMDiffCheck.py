@@ -0,0 +1,279 @@
+import os
+import random
+import sys
+import tempfile
+import time
+from array import array
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from pathlib import Path
+
+for project in ('05', '06'):
+    sys.path.insert(0, str(Path(__file__).resolve().parent.parent / project))
+
+from CPUEmulator import CPUEmulator
+from VMEmulator import RAM_SIZE, VMEmulator, vmFiles
+from VMTranslator import CommandType, Parser, Translator, translate
+from assembler import assemble
+
+# The scratch registers of the translated code (R13..R15): they aren't part of
+# the VM's state, so they're never compared.
+SCRATCH = range(13, 16)
+
+# The stack never grows past the heap, so the RAM between the top of the stack
+# and the heap is free: both sides may leave anything there.
+HEAP_BASE = 2048
+
+
+# Translates VM files into Hack machine code. Returns the ROM, and the ROM
+# address of every VM command in the order the VM emulator compiles them,
+# with the address right past the end of the ROM last, where the emulator
+# puts the final halt. Also returns each command's source: (file, line,
+# command).
+def translateProgram(vmfiles):
+    with tempfile.TemporaryDirectory() as directory:
+        asm = Path(directory) / 'Program.asm'
+        t = Translator(asm)
+        functionName = 'boot'
+        for vmfile in vmfiles:
+            p = Parser(vmfile)
+            functionName = translate(p, t, functionName)
+            p.close()
+        callSysinit = 'Sys.init' in t.functions
+        t.writeInit()
+        t.close()
+
+        rom = [int(instruction, 2) for instruction in assemble(str(asm))]
+
+        # Every translated command starts with a comment line. Labels
+        # don't have any code, and aren't commands for the emulator.
+        addresses = []
+        address = 0
+        with asm.open() as f:
+            for line in f:
+                line = line.strip()
+                if line.startswith('//'):
+                    if not line.startswith(('// bootstrap', '// label ')):
+                        addresses.append(address)
+                elif line and not line.startswith('('):
+                    address = address + 1
+    if callSysinit: # The call in the bootstrap code.
+        del addresses[0]
+    addresses.append(len(rom))
+
+    sources = []
+    for vmfile in vmfiles:
+        p = Parser(vmfile)
+        while p.advance():
+            if p.commandType != CommandType.C_LABEL:
+                command = ' '.join(field for field in (p.command, p.arg1,
+                    p.arg2) if field is not None)
+                sources.append((vmfile.name, p.lineNum, command))
+        p.close()
+
+    return rom, addresses, sources
+
+
+# Fills the RAM with a random initial state, and returns the state of the
+# registers: SP, LCL, ARG, THIS, THAT.
+# Every word is random, within [-valueRange, valueRange], except the
+# arguments: programs use them both as counters and as pointers, so they're
+# within [HEAP_BASE, 2 * HEAP_BASE], in the heap. Pointers into RAM[0..15]
+# would clobber the registers the translated code uses. The stack, the
+# argument segment (10 arguments), and the this/that segments don't overlap.
+# The program starts as if its first function had just been called: SP = LCL,
+# and the caller's frame is below LCL, with returnAddress as its return
+# address.
+def randomState(ram, rng, valueRange, returnAddress):
+    ram[5:] = array('h', rng.choices(range(-valueRange, valueRange + 1),
+        k=RAM_SIZE - 5))
+
+    arg = rng.randint(256, 512)
+    numArgs = 10
+    for i in range(arg, arg + numArgs):
+        ram[i] = rng.randint(HEAP_BASE, 2 * HEAP_BASE)
+    lcl = arg + numArgs + 5
+    ram[lcl - 5] = returnAddress
+    registers = [lcl, lcl, arg, rng.randint(HEAP_BASE, 12000),
+        rng.randint(HEAP_BASE, 12000)]
+    for i, value in enumerate(registers):
+        ram[i] = value
+    return registers
+
+
+# Returns the addresses where the RAM of the VM emulator and the CPU differ,
+# besides the scratch registers and the free RAM above the stack.
+def differences(vmRAM, cpuRAM):
+    if vmRAM == cpuRAM:
+        return []
+
+    top = min(max(vmRAM[0], 0), HEAP_BASE)
+    return [address for address in range(RAM_SIZE)
+        if vmRAM[address] != cpuRAM[address]
+        and address not in SCRATCH
+        and not top <= address < HEAP_BASE]
+
+
+# Runs a VM program both in the VM emulator and, translated, on the CPU
+# emulator, from the same random initial states, and compares their final
+# RAM. When they differ, both are run again in lockstep, one VM command at a
+# time, to find the first command after which they differ.
+class DiffCheck:
+    def __init__(self, vmfiles, valueRange=1000, maxSteps=1000000):
+        self.vmfiles = vmfiles
+        self.valueRange = valueRange
+        self.maxSteps = maxSteps
+        self.rom, self.addresses, self.sources = translateProgram(vmfiles)
+        self.vm = VMEmulator(vmfiles)
+        self.vm.returnAddresses = self.addresses
+        self.cpu = CPUEmulator(self.rom, compiled=True)
+        if len(self.addresses) != len(self.vm.program):
+            raise Exception('The translation does not match the VM program!')
+
+        # Total number of VM commands and instructions executed.
+        self.steps = 0
+        self.cycles = 0
+
+    # Sets both emulators to the same random initial state.
+    def start(self, vm, cpu, seed):
+        rng = random.Random(seed)
+        randomState(vm.ram, rng, self.valueRange, len(self.rom))
+        cpu.ram[:] = vm.ram
+        vm.reset()
+        cpu.reset()
+        cpu.PC = self.addresses[vm.ip]
+
+    # Runs a trial from the random initial state given by the seed. Returns
+    # None if both emulators end in the same state, or else a description of
+    # the first divergent command.
+    def trial(self, seed):
+        vm = self.vm
+        cpu = self.cpu
+        self.start(vm, cpu, seed)
+        self.steps = self.steps + vm.run(self.maxSteps)
+        if vm.halted:
+            # The translated code takes far fewer than 1000 instructions
+            # for any command.
+            self.cycles = self.cycles + cpu.run(1000 * vm.steps)
+            # The CPU halts either past the end of the ROM, or in the
+            # middle of the translated 'goto' to itself.
+            if (cpu.halted and cpu.PC - self.addresses[vm.ip] in (0, 1)
+                and not differences(vm.ram, cpu.ram)
+            ):
+                return None
+        return self.locate(seed)
+
+    # Runs the trial again in lockstep, comparing the RAM after each VM
+    # command. Returns a description of the first divergent command.
+    def locate(self, seed):
+        vm = VMEmulator(self.vmfiles)
+        vm.returnAddresses = self.addresses
+        cpu = CPUEmulator(self.rom)
+        self.start(vm, cpu, seed)
+        addresses = self.addresses
+
+        for step in range(self.maxSteps):
+            ip = vm.ip
+            if vm.run(1) == 0:
+                break
+            # Executes the translated command, up to the next one.
+            target = addresses[vm.ip]
+            cycles = 0
+            while cpu.PC != target and cycles < 100000 and cpu.step():
+                cycles = cycles + 1
+
+            diff = differences(vm.ram, cpu.ram)
+            if cpu.PC != target or diff:
+                file, line, command = self.sources[ip]
+                message = (f'{file}:{line}: {command}'
+                    + f' (after {step} commands, seed {seed})')
+                if cpu.PC != target:
+                    message = message + (f'\n  next ROM address:'
+                        + f' VM {target}, CPU {cpu.PC}')
+                for address in diff[:8]:
+                    message = message + (f'\n  RAM[{address}]:'
+                        + f' VM {vm.ram[address]}, CPU {cpu.ram[address]}')
+                return message
+
+        if vm.halted:
+            return ('the final states differ, but no command does'
+                + f' (seed {seed})')
+        return None
+
+
+# Checks the VM program in the given directory or file over the given number
+# of random initial states. Returns (program, divergence or None, trials,
+# VM commands, instructions, elapsed seconds).
+def checkProgram(input, trials, firstSeed=0, valueRange=1000):
+    start = time.perf_counter()
+    check = DiffCheck(vmFiles(input), valueRange)
+    divergence = None
+    trial = 0
+    while trial < trials and divergence is None:
+        divergence = check.trial(firstSeed + trial)
+        trial = trial + 1
+    return (str(input), divergence, trial, check.steps, check.cycles,
+        time.perf_counter() - start)
+
+
+# Returns the VM programs under the given directories: every directory that
+# holds VM files.
+def findPrograms(inputs):
+    programs = []
+    for input in inputs:
+        input = Path(input)
+        if input.is_file() or any(input.glob('*.vm')):
+            programs.append(input)
+        else:
+            programs.extend(sorted({vmfile.parent
+                for vmfile in input.rglob('*.vm')}))
+    return programs
+
+
+# Description: Checks that the VM translator is correct, by running VM
+#              programs both in the VM emulator and, translated and
+#              assembled, on the CPU emulator, from many random initial
+#              states, and comparing the final RAM. Reports the first
+#              divergent command of each program that fails.
+#              By default, every VM program in projects/07 and projects/08 is
+#              checked. Values in RAM are random within [-range, range].
+# Input: [--trials n] [--range r] [--workers n] [{file}.vm|{directory} ...]
+def main():
+    args = sys.argv[1:]
+    options = {'--trials': 50, '--range': 1000, '--workers': os.cpu_count()}
+    for option in options:
+        if option in args:
+            i = args.index(option)
+            options[option] = int(args[i + 1])
+            del args[i:i + 2]
+
+    if any(arg.startswith('--') for arg in args):
+        print('Usage: python ' + Path(__file__).name
+            + ' [--trials n] [--range r] [--workers n]'
+            + ' [{file}.vm|{directory} ...]')
+        return
+
+    projects = Path(__file__).resolve().parent.parent
+    programs = findPrograms(args or [projects / '07', projects / '08'])
+
+    start = time.perf_counter()
+    failures = 0
+    with ProcessPoolExecutor(options['--workers']) as pool:
+        futures = [pool.submit(checkProgram, program, options['--trials'],
+            0, options['--range']) for program in programs]
+        for future in as_completed(futures):
+            (program, divergence, trials, steps, cycles, elapsed
+                ) = future.result()
+            status = 'PASS' if divergence is None else 'FAIL'
+            print(f'{status} {elapsed:8.3f} s  {program}: {trials} trials,'
+                + f' {steps} VM commands, {cycles} instructions')
+            if divergence is not None:
+                failures = failures + 1
+                print('  first divergent command: ' + divergence)
+
+    print(f'{len(programs) - failures}/{len(programs)} programs match'
+        + f' ({time.perf_counter() - start:.3f} s)')
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,371 @@
+import sys
+import time
+from array import array
+from enum import IntEnum, auto
+from pathlib import Path
+
+from VMTranslator import CommandType, Parser
+
+
+# The opcodes of compiled VM commands. Each compiled command is a tuple whose
+# first item is its opcode, followed by its operands (see VMEmulator.compile).
+class Op(IntEnum):
+    PUSH_CONSTANT = auto() # (value)
+    PUSH_SEGMENT  = auto() # (address of the segment's base pointer, index)
+    PUSH_FIXED    = auto() # (address): static, temp, and pointer
+    POP_SEGMENT   = auto() # (address of the segment's base pointer, index)
+    POP_FIXED     = auto() # (address): static, temp, and pointer
+    ADD           = auto() # ADD..LT must stay together, see VMEmulator.run
+    SUB           = auto()
+    EQ            = auto()
+    GT            = auto()
+    LT            = auto()
+    AND           = auto()
+    OR            = auto()
+    NEG           = auto()
+    NOT           = auto()
+    GOTO          = auto() # (target)
+    IF_GOTO       = auto() # (target)
+    FUNCTION      = auto() # (numLocals)
+    CALL          = auto() # (target, numArgs)
+    RETURN        = auto()
+    HALT          = auto() # a 'goto' to itself, the end of a VM program.
+
+
+# Addresses of the segments' base pointers, and of the fixed segments.
+SEGMENT_POINTERS = {'local': 1, 'argument': 2, 'this': 3, 'that': 4}
+FIXED_SEGMENTS = {'pointer': 3, 'temp': 5}
+
+# The first address of the static variables, allocated in the same order as
+# the assembler allocates the variables of the translated program.
+STATIC_BASE = 16
+
+RAM_SIZE = 32768
+
+ARITHMETIC_OPS = {
+    'add': Op.ADD, 'sub': Op.SUB, 'neg': Op.NEG,
+    'eq' : Op.EQ , 'gt' : Op.GT , 'lt' : Op.LT ,
+    'and': Op.AND, 'or' : Op.OR , 'not': Op.NOT,
+}
+
+
+# Runs VM programs directly, without translating them to Hack machine code.
+# All the VM files are compiled up front into one list of commands, with every
+# label and function name resolved into an index of that list. Execution
+# uses the same RAM layout as the translated program: the stack starts at 256,
+# SP/LCL/ARG/THIS/THAT live in RAM[0..4], and call frames are pushed onto the
+# stack. The return addresses themselves are kept on a separate call stack.
+# ram: the data memory, signed 16-bit words.
+# ip: the index of the next command to execute.
+# steps: the number of VM commands executed since the last reset.
+# halted: True once the program has reached a 'goto' to itself or run past
+#         its last command.
+# functions: function name -> (index of its first command, numLocals).
+# statics: static variable name ({file}.{index}) -> RAM address.
+class VMEmulator:
+    def __init__(self, vmfiles):
+        self.ram = array('h', bytes(2 * RAM_SIZE))
+        self.functions = {}
+        self.statics = {}
+        self.program = self.compile(vmfiles)
+        # The value a call pushes as its return address, by the index of the
+        # command it returns to. Returns don't use it (see callStack), so by
+        # default it's the index itself; it can be set to the ROM addresses of
+        # the translated program to get exactly the same RAM.
+        self.returnAddresses = [i & 0x7FFF for i in range(len(self.program))]
+        self.reset()
+
+    # Returns the RAM address of a static variable, allocating it if needed.
+    def staticAddress(self, sourcefile, index):
+        name = f'{sourcefile.stem}.{index}'
+        if name not in self.statics:
+            self.statics[name] = STATIC_BASE + len(self.statics)
+        return self.statics[name]
+
+    # Compiles the VM files into a list of commands.
+    # Jumps and calls are compiled with their label or function name first,
+    # and resolved into indices once every label and function is known.
+    def compile(self, vmfiles):
+        program = []
+        labels = {}
+
+        # Same as in the translator: labels are scoped as f$b where f is the
+        # name of the function they're declared in.
+        functionName = 'boot'
+        for vmfile in vmfiles:
+            p = Parser(Path(vmfile))
+            while p.advance():
+                if p.commandType == CommandType.C_ARITHMETIC:
+                    program.append((ARITHMETIC_OPS[p.command],))
+                elif p.commandType == CommandType.C_PUSH:
+                    index = int(p.arg2)
+                    if p.arg1 == 'constant':
+                        program.append((Op.PUSH_CONSTANT, index))
+                    elif p.arg1 in SEGMENT_POINTERS:
+                        program.append((Op.PUSH_SEGMENT,
+                            SEGMENT_POINTERS[p.arg1], index))
+                    elif p.arg1 in FIXED_SEGMENTS:
+                        program.append((Op.PUSH_FIXED,
+                            FIXED_SEGMENTS[p.arg1] + index))
+                    elif p.arg1 == 'static':
+                        program.append((Op.PUSH_FIXED,
+                            self.staticAddress(p.filepath, index)))
+                    else:
+                        raise Exception(f'Invalid segment: {p.arg1}')
+                elif p.commandType == CommandType.C_POP:
+                    index = int(p.arg2)
+                    if p.arg1 in SEGMENT_POINTERS:
+                        program.append((Op.POP_SEGMENT,
+                            SEGMENT_POINTERS[p.arg1], index))
+                    elif p.arg1 in FIXED_SEGMENTS:
+                        program.append((Op.POP_FIXED,
+                            FIXED_SEGMENTS[p.arg1] + index))
+                    elif p.arg1 == 'static':
+                        program.append((Op.POP_FIXED,
+                            self.staticAddress(p.filepath, index)))
+                    else:
+                        raise Exception(f'Invalid segment: {p.arg1}')
+                elif p.commandType == CommandType.C_LABEL:
+                    labels[f'{functionName}${p.arg1}'] = len(program)
+                elif p.commandType == CommandType.C_GOTO:
+                    program.append((Op.GOTO, f'{functionName}${p.arg1}'))
+                elif p.commandType == CommandType.C_IF:
+                    program.append((Op.IF_GOTO, f'{functionName}${p.arg1}'))
+                elif p.commandType == CommandType.C_FUNCTION:
+                    functionName = p.arg1
+                    self.functions[p.arg1] = (len(program), int(p.arg2))
+                    program.append((Op.FUNCTION, int(p.arg2)))
+                elif p.commandType == CommandType.C_CALL:
+                    program.append((Op.CALL, p.arg1, int(p.arg2)))
+                elif p.commandType == CommandType.C_RETURN:
+                    program.append((Op.RETURN,))
+                else:
+                    raise Exception(
+                        "Invalid command type is given by the parser!")
+            p.close()
+
+        # Resolves the labels and function names.
+        for i, command in enumerate(program):
+            if command[0] in (Op.GOTO, Op.IF_GOTO):
+                if command[1] not in labels:
+                    raise Exception(f'Undefined label: {command[1]}')
+                target = labels[command[1]]
+                if command[0] == Op.GOTO and target == i:
+                    program[i] = (Op.HALT,)
+                else:
+                    program[i] = (command[0], target)
+            elif command[0] == Op.CALL:
+                if command[1] not in self.functions:
+                    raise Exception(f'Undefined function: {command[1]}')
+                program[i] = (Op.CALL, self.functions[command[1]][0],
+                    command[2])
+
+        # Running past the last command halts the program.
+        program.append((Op.HALT,))
+
+        # Plain ints are faster to compare than IntEnum members.
+        return [(int(command[0]),) + command[1:] for command in program]
+
+    # Resets the emulator like the official VM emulator does: execution
+    # restarts from Sys.init if it's defined, or else from the first command.
+    # RAM is left untouched, so the test can set up the segments itself.
+    def reset(self):
+        self.ip = 0
+        if 'Sys.init' in self.functions:
+            self.ip = self.functions['Sys.init'][0]
+        self.callStack = []
+        self.steps = 0
+        self.halted = False
+
+    # Resets the emulator like the translator's bootstrap code does:
+    # SP = 256, and Sys.init is called, if it's defined.
+    def bootstrap(self):
+        self.reset()
+        self.ip = 0
+        self.ram[0] = 256
+        if 'Sys.init' in self.functions:
+            # Same frame as the translator's 'call Sys.init 0'. Returning
+            # from Sys.init ends the program.
+            sp = 256
+            for value in (0, self.ram[1], self.ram[2], self.ram[3],
+                self.ram[4]
+            ):
+                self.ram[sp] = value
+                sp = sp + 1
+            self.ram[0] = sp
+            self.ram[1] = sp
+            self.ram[2] = sp - 5
+            self.ip = self.functions['Sys.init'][0]
+
+    # Executes at most maxSteps VM commands, or runs until the program halts
+    # if maxSteps is None. Returns the number of commands executed.
+    def run(self, maxSteps=None):
+        program = self.program
+        ram = self.ram
+        callStack = self.callStack
+        returnAddresses = self.returnAddresses
+        ip = self.ip
+
+        # The opcodes, as ints in locals for a faster dispatch.
+        (PUSH_CONSTANT, PUSH_SEGMENT, PUSH_FIXED, POP_SEGMENT, POP_FIXED, ADD,
+            SUB, EQ, GT, LT, AND, OR, NEG, NOT, GOTO, IF_GOTO, FUNCTION, CALL,
+            RETURN, HALT) = [int(op) for op in Op]
+
+        # A negative budget never reaches 0, so it runs until halted.
+        n = -1 if maxSteps is None else maxSteps
+        start = n
+        halted = False
+        while n:
+            command = program[ip]
+            op = command[0]
+            ip = ip + 1
+            if op == PUSH_CONSTANT:
+                sp = ram[0]
+                ram[sp] = command[1]
+                ram[0] = sp + 1
+            elif op == PUSH_SEGMENT:
+                sp = ram[0]
+                ram[sp] = ram[(ram[command[1]] + command[2]) & 0x7FFF]
+                ram[0] = sp + 1
+            elif op == PUSH_FIXED:
+                sp = ram[0]
+                ram[sp] = ram[command[1]]
+                ram[0] = sp + 1
+            elif op == POP_SEGMENT:
+                sp = ram[0] - 1
+                ram[(ram[command[1]] + command[2]) & 0x7FFF] = ram[sp]
+                ram[0] = sp
+            elif op == POP_FIXED:
+                sp = ram[0] - 1
+                ram[command[1]] = ram[sp]
+                ram[0] = sp
+            elif op <= LT: # Binary arithmetic and comparisons.
+                sp = ram[0] - 1
+                x = ram[sp - 1]
+                y = ram[sp]
+                if op == ADD:
+                    out = ((x + y + 32768) & 0xFFFF) - 32768
+                elif op == SUB:
+                    out = ((x - y + 32768) & 0xFFFF) - 32768
+                elif op == EQ:
+                    out = -1 if x == y else 0
+                elif op == GT:
+                    out = -1 if x > y else 0
+                else: # Op.LT
+                    out = -1 if x < y else 0
+                ram[sp - 1] = out
+                ram[0] = sp
+            elif op == AND:
+                sp = ram[0] - 1
+                ram[sp - 1] = ram[sp - 1] & ram[sp]
+                ram[0] = sp
+            elif op == OR:
+                sp = ram[0] - 1
+                ram[sp - 1] = ram[sp - 1] | ram[sp]
+                ram[0] = sp
+            elif op == NEG:
+                sp = ram[0] - 1
+                ram[sp] = ((32768 - ram[sp]) & 0xFFFF) - 32768
+            elif op == NOT:
+                sp = ram[0] - 1
+                ram[sp] = ~ram[sp]
+            elif op == GOTO:
+                ip = command[1]
+            elif op == IF_GOTO:
+                sp = ram[0] - 1
+                ram[0] = sp
+                if ram[sp] != 0:
+                    ip = command[1]
+            elif op == FUNCTION:
+                sp = ram[0]
+                for i in range(command[1]):
+                    ram[sp + i] = 0
+                ram[0] = sp + command[1]
+            elif op == CALL:
+                sp = ram[0]
+                ram[sp] = returnAddresses[ip] # Only informative.
+                ram[sp + 1] = ram[1]
+                ram[sp + 2] = ram[2]
+                ram[sp + 3] = ram[3]
+                ram[sp + 4] = ram[4]
+                ram[0] = sp + 5
+                ram[1] = sp + 5
+                ram[2] = sp - command[2]
+                callStack.append(ip)
+                ip = command[1]
+            elif op == RETURN:
+                frame = ram[1]
+                arg = ram[2]
+                ram[arg] = ram[ram[0] - 1]
+                ram[0] = arg + 1
+                ram[4] = ram[frame - 1]
+                ram[3] = ram[frame - 2]
+                ram[2] = ram[frame - 3]
+                ram[1] = ram[frame - 4]
+                # Returning from the function execution started in ends
+                # the program.
+                ip = callStack.pop() if callStack else len(program) - 1
+            else: # Op.HALT
+                ip = ip - 1
+                halted = True
+                break
+
+            n = n - 1
+
+        self.ip = ip
+        self.halted = halted
+        executed = start - n
+        self.steps = self.steps + executed
+        return executed
+
+
+# Returns the VM files of the given file or directory, in the same order as
+# the translator reads them.
+def vmFiles(input):
+    input = Path(input)
+    if input.is_file():
+        return [input]
+    return sorted(input.glob('*.vm'))
+
+
+# Description: Runs the given VM file(s) from the translator's bootstrap,
+#              until the program halts or for the given number of steps,
+#              and reports the speed of the emulator along with the values of
+#              SP, LCL, ARG, THIS, THAT, and the top of the stack.
+# Input: [{file}.vm|{directory}] [steps]
+def main():
+    # Invalid number of arguments given.
+    if len(sys.argv) not in (2, 3):
+        print('Usage: python ' + Path(__file__).name
+            + ' [{file}.vm|{directory}] [steps]')
+        return
+
+    input = Path(sys.argv[1])
+    if not input.exists():
+        print('File or directory does not exist!')
+        return
+
+    vmfiles = vmFiles(input)
+    if len(vmfiles) < 1:
+        print('No VM file exists in the directory!')
+        return
+
+    maxSteps = int(sys.argv[2]) if len(sys.argv) == 3 else None
+
+    vm = VMEmulator(vmfiles)
+    vm.bootstrap()
+    start = time.perf_counter()
+    executed = vm.run(maxSteps)
+    elapsed = time.perf_counter() - start
+
+    print(f'{executed} VM commands in {elapsed:.3f} s'
+        + f' ({executed / elapsed / 1e6:.2f} M commands/s)'
+        + (', halted' if vm.halted else ''))
+    for i, name in enumerate(('SP', 'LCL', 'ARG', 'THIS', 'THAT')):
+        print(f'{name} = {vm.ram[i]}')
+    if vm.ram[0] > 256:
+        print(f'top of the stack = {vm.ram[vm.ram[0] - 1]}')
+
+
+if __name__ == '__main__':
+    main()
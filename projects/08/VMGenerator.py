@@ -0,0 +1,213 @@
+import random
+import sys
+from pathlib import Path
+
+# The arithmetic and logical commands, by number of arguments.
+BINARY = ['add', 'sub', 'and', 'or', 'eq', 'gt', 'lt']
+UNARY = ['neg', 'not']
+
+# Every generated function has this many arguments and local variables.
+NUM_ARGS = 2
+NUM_LOCALS = 4
+
+# The heap addresses that THIS and THAT point to.
+THIS_BASE = 3000
+THAT_BASE = 3500
+
+# The RAM that statics are allocated in holds at most this many of them.
+MAX_STATICS = 240
+
+
+# Generates the commands of a VM program with the given shape. The program
+# is valid and runs to completion: every statement leaves the stack as it
+# found it, jumps only go forward, and every function but those of the last
+# layer calls exactly one function of the next layer, so calls are depth
+# layers deep and each function runs at most once per call of a function of
+# the first layer, which Sys.init calls in turn. Returns a dictionary: file
+# name -> list of command lines.
+# commands: the number of commands to generate, roughly.
+# functions: the number of functions, Sys.init aside.
+# files: the number of files the functions are spread over, besides Sys.vm.
+# depth: the number of layers of calls.
+# labels: the fraction of statements that branch forward.
+# statics: the fraction of pushes and pops that use the static segment.
+# flat: if True, a single file of push, pop, and arithmetic commands only,
+#       with no functions, for translators of project 07. Since it can't
+#       set LCL and ARG, it doesn't use the local and argument segments.
+class ProgramGenerator:
+    def __init__(self, commands, functions=None, files=None, depth=4,
+        labels=0.1, statics=0.1, seed=0, flat=False
+    ):
+        self.rng = random.Random(seed)
+        self.commands = commands
+        self.functions = functions or max(1, commands // 100)
+        self.files = min(files or max(1, self.functions // 10),
+            self.functions)
+        self.depth = max(1, min(depth, self.functions))
+        self.labels = labels
+        self.statics = statics
+        self.flat = flat
+        # Statics of different files are different variables.
+        self.staticsPerFile = min(8, MAX_STATICS // self.files)
+        self.labelCount = 0
+
+    # The function named by its index, and the file it's in.
+    def functionName(self, k):
+        return f'C{k % self.files}.f{k}'
+
+    # The layer of calls a function is in.
+    def layer(self, k):
+        return k * self.depth // self.functions
+
+    # The index of the first function of a layer.
+    def firstOf(self, layer):
+        return -(-layer * self.functions // self.depth)
+
+    # Pushes or pops a random location of a segment. Statics are only used
+    # with the given probability, and only within the file's own statics.
+    def location(self, push):
+        rng = self.rng
+        if rng.random() < self.statics and self.staticsPerFile:
+            return f'static {rng.randrange(self.staticsPerFile)}'
+        segments = ['this', 'that', 'temp']
+        if not self.flat:
+            segments = segments + ['local', 'argument']
+        if push:
+            segments.append('constant')
+        segment = rng.choice(segments)
+        if segment == 'constant':
+            return f'constant {rng.randrange(32768)}'
+        elif segment == 'argument':
+            return f'argument {rng.randrange(NUM_ARGS)}'
+        elif segment == 'local':
+            return f'local {rng.randrange(NUM_LOCALS)}'
+        elif segment == 'temp':
+            return f'temp {rng.randrange(1, 8)}'
+        return f'{segment} {rng.randrange(8)}'
+
+    # A statement that computes a value and stores it.
+    def assignment(self):
+        rng = self.rng
+        lines = [f'push {self.location(True)}']
+        if rng.random() < 0.2:
+            lines.append(rng.choice(UNARY))
+        else:
+            lines.append(f'push {self.location(True)}')
+            lines.append(rng.choice(BINARY))
+        lines.append(f'pop {self.location(False)}')
+        return lines
+
+    # A statement that jumps over another one: conditionally, or always.
+    def branch(self):
+        self.labelCount = self.labelCount + 1
+        label = f'L{self.labelCount}'
+        if self.rng.random() < 0.7:
+            lines = [f'push {self.location(True)}', 'if-goto ' + label]
+        else:
+            lines = ['goto ' + label]
+        return lines + self.assignment() + ['label ' + label]
+
+    # A statement that calls a function and drops its result.
+    def call(self, callee):
+        lines = [f'push {self.location(True)}' for i in range(NUM_ARGS)]
+        return lines + [f'call {callee} {NUM_ARGS}', 'pop temp 0']
+
+    # Statements up to the given number of commands.
+    def statements(self, budget, callee=None):
+        lines = []
+        callAt = self.rng.randrange(max(budget, 1))
+        while len(lines) < budget:
+            if callee is not None and len(lines) >= callAt:
+                lines.extend(self.call(callee))
+                callee = None
+            elif not self.flat and self.rng.random() < self.labels:
+                lines.extend(self.branch())
+            else:
+                lines.extend(self.assignment())
+        return lines
+
+    # The commands that point THIS and THAT into the heap.
+    def pointers(self):
+        return [f'push constant {THIS_BASE}', 'pop pointer 0',
+            f'push constant {THAT_BASE}', 'pop pointer 1']
+
+    def generate(self):
+        if self.flat:
+            return {'Main.vm': self.pointers()
+                + self.statements(self.commands - 4)}
+
+        program = {'Sys.vm': ['function Sys.init 0']}
+        for k in range(self.functions):
+            if self.layer(k) == 0:
+                program['Sys.vm'].extend(self.call(self.functionName(k)))
+        program['Sys.vm'].extend(['label END', 'goto END'])
+
+        rng = self.rng
+        budget = max(0, self.commands - len(program['Sys.vm'])
+            ) // self.functions
+        for k in range(self.functions):
+            name = self.functionName(k)
+            layer = self.layer(k)
+            callee = None
+            if layer + 1 < self.depth:
+                callee = self.functionName(rng.randrange(
+                    self.firstOf(layer + 1), self.firstOf(layer + 2)))
+            lines = [f'function {name} {NUM_LOCALS}'] + self.pointers()
+            lines.extend(self.statements(max(0, budget - 7), callee))
+            lines.extend(['push local 0', 'return'])
+            program.setdefault(name.split('.')[0] + '.vm', []).extend(lines)
+        return program
+
+
+# Writes a generated program into a directory, one file per VM file.
+# Returns the number of commands written.
+def writeProgram(directory, program):
+    directory = Path(directory)
+    directory.mkdir(parents=True, exist_ok=True)
+    for name, lines in program.items():
+        with (directory / name).open('w') as f:
+            for line in lines:
+                f.write(line + '\n')
+    return sum(len(lines) for lines in program.values())
+
+
+# Description: Generates a valid VM program that runs to completion, of the
+#              given size and shape, into a directory: Sys.vm, whose Sys.init
+#              calls the first layer of functions, and C0.vm, C1.vm, ... that
+#              hold the functions. With --flat, generates a single Main.vm of
+#              push, pop, and arithmetic commands only, for the translator of
+#              project 07. See ProgramGenerator for the options.
+# Input: {directory} [--commands n] [--functions n] [--files n] [--depth n]
+#        [--labels p] [--statics p] [--seed n] [--flat]
+# Output: {directory}/*.vm
+def main():
+    args = sys.argv[1:]
+    options = {'--commands': 10000, '--functions': None, '--files': None,
+        '--depth': 4, '--labels': 0.1, '--statics': 0.1, '--seed': 0}
+    for option in options:
+        if option in args:
+            i = args.index(option)
+            convert = float if option in ('--labels', '--statics') else int
+            options[option] = convert(args[i + 1])
+            del args[i:i + 2]
+    flat = '--flat' in args
+    if flat:
+        args.remove('--flat')
+
+    # Invalid number of arguments given.
+    if len(args) != 1 or args[0].startswith('--'):
+        print('Usage: python ' + Path(__file__).name
+            + ' {directory} [--commands n] [--functions n] [--files n]'
+            + ' [--depth n] [--labels p] [--statics p] [--seed n] [--flat]')
+        return
+
+    generator = ProgramGenerator(options['--commands'],
+        options['--functions'], options['--files'], options['--depth'],
+        options['--labels'], options['--statics'], options['--seed'], flat)
+    program = generator.generate()
+    commands = writeProgram(args[0], program)
+    print(f'{args[0]}: {commands} commands in {len(program)} files')
+
+
+if __name__ == '__main__':
+    main()
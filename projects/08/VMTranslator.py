@@ -1,7 +1,39 @@
+import os
+import re
 import sys
+import shutil
+import tempfile
+from contextlib import contextmanager, nullcontext
 from pathlib import Path
 from enum import IntEnum, auto
 
+
+# The labels the translator numbers with its label counter (see
+# Translator.count), as they appear in its output: @TRUE3, (ret_add12)...
+# The whole symbol must match, so that a symbol that only starts like one,
+# such as TRUE1.foo, isn't renumbered.
+COUNTED_LABEL = re.compile(r'^([@(])(TRUE|END|ret_add)(\d+)(?=\)|$)',
+    re.MULTILINE)
+# The names of functions and labels that start like a counted label.
+COUNTED_NAME = re.compile(r'(TRUE|END|ret_add)\d')
+
+
+# The tracer used when tracing is off, like Tracing.NullTracer: every span
+# and count does nothing. Tracing.py, of project 06, is only needed for
+# --trace (see tracerFromArgs()), so that this file also works on its own.
+class NullTracer:
+    enabled = False
+
+    def span(self, name, **args):
+        return nullcontext()
+
+    def count(self, counter, key, n=1):
+        pass
+
+
+NULL_TRACER = NullTracer()
+
+
 class CommandType(IntEnum):
     C_ARITHMETIC = auto() # Arithmetic and Logical commands
     C_PUSH       = auto() # Push commands
@@ -20,9 +52,17 @@ class Parser:
     def __init__(self, file):
         self.filepath = file
         self.file = file.open()
+        # Line number (1-based) of the current VM command in the file.
+        self.lineNum = 0
     
+    # Rewinds the parser to the beginning of the file.
     def reset(self):
-        self.file = self.filepath.open()
+        self.file.seek(0)
+        self.lineNum = 0
+
+    # Closes the underlying file. The parser can't be used afterwards.
+    def close(self):
+        self.file.close()
     
     # Gets the next VM command in the file, sets up variables, and returns
     # True. If no more commands are found, it returns False.
@@ -36,6 +76,7 @@ class Parser:
             line = self.file.readline()
             if line == '': # EOF has been reached.
                 return False
+            self.lineNum = self.lineNum + 1
             
             line = line.strip()
             if line == '': # An empty line.
@@ -85,23 +126,105 @@ class Parser:
                 return True
                     
     def __del__(self):
-        self.file.close()
+        self.close()
 
 
 # Translates each VM command into multiple assembly commands that executes the
 # expected behavior and adds them to the given output file.
 class Translator:
-    def __init__(self, file):
-        self.file = file.open('w')
+    # compact: if True, comment lines are dropped and every generated label
+    #          is replaced by a short base-36 one. The mapping from each short
+    #          label back to its verbose form is written to {file}.map.
+    # tracer: counts the commands translated by type, and the instructions
+    #         emitted for each kind of command (see Tracing.Tracer).
+    def __init__(self, file, compact=False, tracer=NULL_TRACER):
+        self.output = file.open('w')
+        # The translated commands are written to a temporary file first, since
+        # the bootstrap code that precedes them depends on whether Sys.init is
+        # defined anywhere. See writeInit(). It's opened write-only: a
+        # read-write text file resets its decoder on every write, which
+        # triples the cost of writing. It's read back with readBody().
+        self.file = tempfile.TemporaryFile('w')
         # Filename, without extension. Used for 
         self.filename = file.stem
         # Used to generate unique labels throughout the ASM file.
-        self.count = 0
-
-    # Writes the bootstrap code.
-    # It initializes the stack to RAM[256] and calls Sys.init
-    def writeInit(self, callSysinit=True):
-        self.file.write('// bootstrap code\n')
+        # 0 is reserved for the bootstrap's call to Sys.init. If Sys.init
+        # isn't called, the labels are numbered from 0 again: see
+        # writeInit().
+        self.count = 1
+        # False once a function is declared or called with a name that
+        # starts like a counted label, whose symbol mustn't be renumbered.
+        self.renumberable = True
+
+        # Index of every function translated so far, filled in by
+        # writeFunction(): function name -> (VM file, line number, numLocals).
+        self.functions = {}
+
+        self.tracer = tracer
+        self.compact = compact
+        self.sourceMap = None
+        if compact:
+            self.sourceMap = file.with_suffix('.map').open('w')
+            # Verbose label -> short label, for the labels of the current
+            # function only: see writeFunction().
+            self.labels = {}
+            self.labelCount = 0
+
+    # Writes a comment line describing the VM command being translated.
+    # Skipped entirely in compact mode.
+    def writeComment(self, comment):
+        if not self.compact:
+            self.file.write(f'// {comment}\n')
+
+    # Returns the label to emit for the given verbose label. In compact mode,
+    # each distinct verbose label gets the next base-36 number prefixed with
+    # '$'. VM labels and function names never start with '$', so the short
+    # labels can't collide with them or with the predefined symbols.
+    def makeLabel(self, verbose):
+        if not self.compact:
+            return verbose
+
+        label = self.labels.get(verbose)
+        if label is None:
+            label = '$' + toBase36(self.labelCount)
+            self.labelCount = self.labelCount + 1
+            self.labels[verbose] = label
+            self.sourceMap.write(f'{label} {verbose}\n')
+        return label
+
+    # Opens the commands translated so far for reading, from the given
+    # position of the body (as told by self.file.tell()) on, in a with
+    # block. The reader shares the body's file offset, which is put back
+    # where the body ends when the block exits, however much was read, so
+    # that translating can go on afterwards.
+    @contextmanager
+    def readBody(self, position=0):
+        self.file.flush()
+        fd = self.file.fileno()
+        end = os.lseek(fd, 0, os.SEEK_CUR)
+        reader = open(fd, closefd=False)
+        try:
+            reader.seek(position)
+            yield reader
+        finally:
+            reader.close()
+            os.lseek(fd, end, os.SEEK_SET)
+
+    # Writes the bootstrap code, followed by every command translated so far.
+    # Must be called once, after all the VM files have been translated.
+    # It initializes the stack to RAM[256] and calls Sys.init. If callSysinit
+    # isn't given, Sys.init is called only if the function index contains it.
+    # If it isn't called, label number 0 was reserved for nothing, so the
+    # counted labels are numbered from 0 as they're copied, unless a
+    # function's name could be taken for one. In compact mode the labels are
+    # short ones, and the source map keeps the numbers from 1.
+    def writeInit(self, callSysinit=None):
+        if callSysinit is None:
+            callSysinit = 'Sys.init' in self.functions
+
+        body = self.file
+        self.file = self.output
+        self.writeComment('bootstrap code')
 
         # SP = 256
         self.file.write('@256\n')
@@ -111,7 +234,23 @@ class Translator:
 
         # call Sys.init
         if callSysinit:
+            count = self.count
+            self.count = 0
             self.writeCall('Sys.init', '0')
+            self.count = count
+
+        self.file = body
+        with self.readBody() as reader:
+            if (callSysinit or self.compact or self.count == 1
+                or not self.renumberable
+            ):
+                shutil.copyfileobj(reader, self.output)
+            else:
+                for line in reader:
+                    self.output.write(COUNTED_LABEL.sub(
+                        lambda m: f'{m[1]}{m[2]}{int(m[3]) - 1}', line))
+        body.close()
+        self.file = self.output
 
     # Describes each C_ARITHMETIC VM command for use in writeArithmetic().
     # The tuple: (number of arguments, arithmetic/logical, its defining code).
@@ -129,7 +268,7 @@ class Translator:
 
     # Translates arithmetic and logical commands.
     def writeArithmetic(self, command):
-        self.file.write(f'// {command}\n')
+        self.writeComment(command)
 
         # Pop the argument(s) from the stack: R13=arg1 and R14=arg2
         numOfArgs = Translator.C_ARITHMETIC_DESC[command][0]
@@ -162,14 +301,16 @@ class Translator:
             self.file.write('D=M\n')
             self.file.write('@R14\n')
             self.file.write(f'D=D-M\n')
-            self.file.write(f'@TRUE{self.count}\n')
+            trueLabel = self.makeLabel(f'TRUE{self.count}')
+            endLabel = self.makeLabel(f'END{self.count}')
+            self.file.write(f'@{trueLabel}\n')
             self.file.write(f'D;{code}\n')
             self.file.write('D=0\n')
-            self.file.write(f'@END{self.count}\n')
+            self.file.write(f'@{endLabel}\n')
             self.file.write('0;JMP\n')
-            self.file.write(f'(TRUE{self.count})\n')
+            self.file.write(f'({trueLabel})\n')
             self.file.write('D=-1\n')
-            self.file.write(f'(END{self.count})\n')
+            self.file.write(f'({endLabel})\n')
 
             self.count = self.count + 1
         else:
@@ -186,7 +327,7 @@ class Translator:
     
     # Translates push commands.
     def writePush(self, segment, index, sourcefile=None):
-        self.file.write(f'// push {segment} {index}\n')
+        self.writeComment(f'push {segment} {index}')
 
         # D = *(Segment+Index)
         if segment == 'local':
@@ -239,7 +380,7 @@ class Translator:
         
     # Translates pop commands.
     def writePop(self, segment, index, sourcefile=None):
-        self.file.write(f'// pop {segment} {index}\n')
+        self.writeComment(f'pop {segment} {index}')
 
         # R13 = Segment + Index
         if segment == 'local':
@@ -300,20 +441,20 @@ class Translator:
 
     # Translates label declarations.
     def writeLabel(self, label, functionName):
-        self.file.write(f'// label {label}\n')
+        self.writeComment(f'label {label}')
 
-        self.file.write(f'({functionName}${label})\n')
+        self.file.write(f'({self.makeLabel(f"{functionName}${label}")})\n')
 
     # Translates uncoditional jumps.
     def writeGoto(self, label, functionName):
-        self.file.write(f'// goto {label}\n')
+        self.writeComment(f'goto {label}')
 
-        self.file.write(f'@{functionName}${label}\n')
+        self.file.write(f'@{self.makeLabel(f"{functionName}${label}")}\n')
         self.file.write('0;JMP\n')
 
     # Translates conditional jumps.
     def writeIf(self, label, functionName):
-        self.file.write(f'// if-goto {label}\n')
+        self.writeComment(f'if-goto {label}')
 
         # D = *(--SP)
         self.file.write('@SP\n')
@@ -321,12 +462,22 @@ class Translator:
         self.file.write('D=M\n')
 
         # Jump if D != 0, else continue
-        self.file.write(f'@{functionName}${label}\n')
+        self.file.write(f'@{self.makeLabel(f"{functionName}${label}")}\n')
         self.file.write('D;JNE\n')
 
     # Translates function declarations.
-    def writeFunction(self, functionName, numLocals):
-        self.file.write(f'// function {functionName} {numLocals}\n')
+    def writeFunction(self, functionName, numLocals, sourcefile=None,
+        lineNum=None
+    ):
+        self.writeComment(f'function {functionName} {numLocals}')
+        if COUNTED_NAME.match(functionName):
+            self.renumberable = False
+        self.functions[functionName] = (sourcefile, lineNum, int(numLocals))
+        # The labels of the previous function can't be referred to anymore,
+        # and neither can the labels generated for single commands, so only
+        # the current function's are kept.
+        if self.compact:
+            self.labels.clear()
 
         # Function entry label declaration.
         self.file.write(f'({functionName})\n')
@@ -345,10 +496,14 @@ class Translator:
 
     # Translates function calls.
     def writeCall(self, functionName, numArgs):
-        self.file.write(f'// call {functionName} {numArgs}\n')     
+        self.writeComment(f'call {functionName} {numArgs}')
+        if COUNTED_NAME.match(functionName):
+            self.renumberable = False
         
+        retLabel = self.makeLabel(f'ret_add{self.count}')
+
         # Push return_address
-        self.file.write(f'@ret_add{self.count}\n')
+        self.file.write(f'@{retLabel}\n')
         self.file.write('D=A\n')
         self.file.write('@SP\n')
         self.file.write('A=M\n')
@@ -411,13 +566,13 @@ class Translator:
         self.file.write('0;JMP\n')
          
         # (return_address)
-        self.file.write(f'(ret_add{self.count})\n')
+        self.file.write(f'({retLabel})\n')
 
         self.count = self.count + 1
 
     # Translates function returns.
     def writeReturn(self):
-        self.file.write('// return\n')
+        self.writeComment('return')
 
         # FRAME = LCL
         self.file.write('@LCL\n')
@@ -489,23 +644,119 @@ class Translator:
         self.file.write('A=M\n')
         self.file.write('0;JMP\n')
 
-    def __del__(self):
+    # Closes the output file(s). The translator can't be used afterwards.
+    def close(self):
         self.file.close()
+        self.output.close()
+        if self.sourceMap is not None:
+            self.sourceMap.close()
+
+    def __del__(self):
+        self.close()
+
+
+# Returns the base-36 representation of a non-negative integer.
+def toBase36(number):
+    digits = '0123456789abcdefghijklmnopqrstuvwxyz'
+    if number == 0:
+        return '0'
+
+    result = ''
+    while number > 0:
+        number, digit = divmod(number, 36)
+        result = digits[digit] + result
+    return result
+
+
+# Translates every command in the parser's VM file and adds it to the
+# translator. Labels are scoped to functionName until the first function
+# declaration. Returns the name of the last function declared.
+def translate(p, t, functionName='boot'):
+    tracer = t.tracer
+    counting = tracer.enabled
+    if counting:
+        # A tracer that's on comes from Tracing, so it's already loaded.
+        from Tracing import InstructionCounter
+        body = t.file
+        t.file = InstructionCounter(body)
+
+    while p.advance():
+        if counting:
+            tracer.count('commands', p.commandType.name)
+            instructions = t.file.instructions
+
+        if p.commandType == CommandType.C_ARITHMETIC:
+            t.writeArithmetic(p.command)
+        elif p.commandType == CommandType.C_PUSH:
+            t.writePush(p.arg1, p.arg2, p.filepath)
+        elif p.commandType == CommandType.C_POP:
+            t.writePop(p.arg1, p.arg2, p.filepath)
+        elif p.commandType == CommandType.C_LABEL:
+            t.writeLabel(p.arg1, functionName)
+        elif p.commandType == CommandType.C_GOTO:
+            t.writeGoto(p.arg1, functionName)
+        elif p.commandType == CommandType.C_IF:
+            t.writeIf(p.arg1, functionName)
+        elif p.commandType == CommandType.C_FUNCTION:
+            functionName = p.arg1
+            t.writeFunction(p.arg1, p.arg2, p.filepath, p.lineNum)
+        elif p.commandType == CommandType.C_CALL:
+            t.writeCall(p.arg1, p.arg2)
+        elif p.commandType == CommandType.C_RETURN:
+            t.writeReturn()
+        else:
+            raise Exception("Invalid command type is given by the parser!")
+
+        if counting:
+            tracer.count('instructions', p.command,
+                t.file.instructions - instructions)
+
+    if counting:
+        t.file = body
+    return functionName
+
+
+# Returns a tracer and the file to export its trace to, if --trace
+# {trace}.json is in the command line arguments: see
+# Tracing.tracerFromArgs(). Tracing.py is loaded from project 06 only then.
+# Without it, --trace is left in the arguments, for main() to print its
+# usage.
+def tracerFromArgs(args):
+    if '--trace' not in args:
+        return NULL_TRACER, None
+    sys.path.insert(0, str(Path(__file__).resolve().parent.parent / '06'))
+    try:
+        import Tracing
+    except ImportError:
+        return NULL_TRACER, None
+    return Tracing.tracerFromArgs(args)
 
 
 # Description: Translates the given VM file(s) into a Hack assembly file.
 #              If Sys.init is defined, then the VM will call it. Else, no.
-# Input: [{file}.vm|{directory}]
-# Output: [{file}.asm|{directory}.asm]
+#              With --compact, comments are dropped and labels are shortened;
+#              the verbose labels are listed in {file}.map.
+#              With --trace, the time spent translating each file and
+#              writing the output, the number of commands of each type, and
+#              the number of instructions emitted for each kind of command
+#              are written to a Chrome trace-event JSON file.
+# Input: [--compact] [--trace {trace}.json] [{file}.vm|{directory}]
+# Output: [{file}.asm|{directory}.asm] (and [{file}.map|{directory}.map])
 def main():
+    args = sys.argv[1:]
+    tracer, tracePath = tracerFromArgs(args)
+    compact = '--compact' in args
+    if compact:
+        args.remove('--compact')
+
     # Invalid number of arguments given.
-    if len(sys.argv) != 2:
+    if len(args) != 1 or args[0].startswith('--'):
         print('Usage: python ' + Path(__file__).name
-            + ' [{file}.vm|{directory}]')
+            + ' [--compact] [--trace {trace}.json] [{file}.vm|{directory}]')
         return
 
     # Input given, must be a file or a directory.
-    input = Path(sys.argv[1])
+    input = Path(args[0])
     if not input.exists():
         print('File or directory does not exist!')
         return
@@ -516,108 +767,42 @@ def main():
             print('The file is not an VM file!')
             return
 
-        # Initialize Parser for the input file
-        # and Translator for the output file.
-        p = Parser(input)
+        vmfiles = [input]
         output = input.with_suffix('.asm')
-        t = Translator(output)
-
-        # Finds out whether Sys.init is defined or not.
-        sysinitDefined = False
-        while p.advance():
-            if p.commandType == CommandType.C_FUNCTION and p.arg1 == 'Sys.init':
-                sysinitDefined = True
-                break
-        p.reset()
-        
-        # The translation process.
-        t.writeInit(sysinitDefined)
-        while p.advance():
-            if p.commandType == CommandType.C_ARITHMETIC:
-                t.writeArithmetic(p.command)
-            elif p.commandType == CommandType.C_PUSH:
-                t.writePush(p.arg1, p.arg2, p.filepath)
-            elif p.commandType == CommandType.C_POP:
-                t.writePop(p.arg1, p.arg2, p.filepath)
-            elif p.commandType == CommandType.C_LABEL:
-                t.writeLabel(p.arg1, currentFunctionName)
-            elif p.commandType == CommandType.C_GOTO:
-                t.writeGoto(p.arg1, currentFunctionName)
-            elif p.commandType == CommandType.C_IF:
-                t.writeIf(p.arg1, currentFunctionName)
-            elif p.commandType == CommandType.C_FUNCTION:
-                currentFunctionName = p.arg1
-                t.writeFunction(p.arg1, p.arg2)
-            elif p.commandType == CommandType.C_CALL:
-                t.writeCall(p.arg1, p.arg2)
-            elif p.commandType == CommandType.C_RETURN:
-                t.writeReturn()
-            else:
-                raise Exception("Invalid command type is given by the parser!")
-        
-        return
     else: # Input is a directory.
         # At least 1 VM file must exist in the directory.
         vmfiles = sorted(input.glob('*.vm'))
         if len(vmfiles) < 1:
             print('No VM file exists in the directory!')
             return
-        
-        # Initialize Parsers for the input files.
-        parsers = []
-        for vmfile in vmfiles:
-            parsers.append(Parser(vmfile))
-        
-        # Initialize Translator for the output file.
+
         output = input / (input.stem + '.asm')
-        t = Translator(output)
-
-        # The current function name, used to define labels as
-        # f$b where b is the label name and f is the function
-        # name where b resides.
-        currentFunctionName = 'boot'
-
-        # Finds out whether Sys.init is defined or not.
-        sysinitDefined = False
-        for p in parsers:
-            while p.advance():
-                if (p.commandType == CommandType.C_FUNCTION
-                    and p.arg1 == 'Sys.init'
-                ):
-                    sysinitDefined = True
-                    break
-
-            p.reset()
-
-            if sysinitDefined:
-                break
-
-        # The translation process.
-        t.writeInit(sysinitDefined)
-        for p in parsers:
-            while p.advance():
-                if p.commandType == CommandType.C_ARITHMETIC:
-                    t.writeArithmetic(p.command)
-                elif p.commandType == CommandType.C_PUSH:
-                    t.writePush(p.arg1, p.arg2, p.filepath)
-                elif p.commandType == CommandType.C_POP:
-                    t.writePop(p.arg1, p.arg2, p.filepath)
-                elif p.commandType == CommandType.C_LABEL:
-                    t.writeLabel(p.arg1, currentFunctionName)
-                elif p.commandType == CommandType.C_GOTO:
-                    t.writeGoto(p.arg1, currentFunctionName)
-                elif p.commandType == CommandType.C_IF:
-                    t.writeIf(p.arg1, currentFunctionName)
-                elif p.commandType == CommandType.C_FUNCTION:
-                    currentFunctionName = p.arg1
-                    t.writeFunction(p.arg1, p.arg2)
-                elif p.commandType == CommandType.C_CALL:
-                    t.writeCall(p.arg1, p.arg2)
-                elif p.commandType == CommandType.C_RETURN:
-                    t.writeReturn()
-                else:
-                    raise Exception(
-                        "Invalid command type is given by the parser!")
+
+    # The translation process. Each VM file is opened, translated, and
+    # closed in turn, so only one file is open at a time. The translation is
+    # streamed to a temporary file, so that what stays in memory across files
+    # is only the function index (see Translator.functions), and in compact
+    # mode the labels of the current function.
+    t = Translator(output, compact, tracer)
+
+    # The current function name, used to define labels as
+    # f$b where b is the label name and f is the function
+    # name where b resides.
+    currentFunctionName = 'boot'
+    for vmfile in vmfiles:
+        with tracer.span('translate', file=vmfile.name):
+            p = Parser(vmfile)
+            currentFunctionName = translate(p, t, currentFunctionName)
+            p.close()
+
+    # Sys.init is called only if the translation found it, so
+    # the files don't have to be read a second time.
+    with tracer.span('write', file=output.name):
+        t.writeInit()
+        t.close()
+
+    if tracePath is not None:
+        tracer.export(tracePath)
 
 
 if __name__ == '__main__':
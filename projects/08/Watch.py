@@ -0,0 +1,271 @@
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / '06'))
+
+from VMTranslator import (COUNTED_LABEL, COUNTED_NAME, Parser, Translator,
+    translate)
+from assembler import assemble
+
+
+# Tells whether a file changed: its modification time and size.
+def fileStamp(path):
+    stat = path.stat()
+    return (stat.st_mtime_ns, stat.st_size)
+
+
+# A VM file, kept parsed in memory and parsed again only when it changes. It
+# replays its commands like a Parser, so that translate() can read them.
+# commands: list of (commandType, command, arg1, arg2, lineNum).
+# chunk: its translation, reused as long as the translation starts in the
+#        same state, start: the label counter and the current function. When
+#        only the counter moved, its labels are renumbered instead, unless
+#        a function or label of the file starts like one of them.
+#        end is the state it leaves, and functions the functions it declares.
+# error: why the file couldn't be parsed, if it couldn't.
+class VMFile:
+    def __init__(self, path):
+        self.filepath = path
+        self.stamp = None
+        self.commands = []
+        self.error = None
+        self.chunk = None
+        self.start = None
+        self.end = None
+        self.functions = {}
+        self.renumberable = True
+        self.i = 0
+
+    # Parses the file again if it changed. Returns True if it did.
+    def refresh(self):
+        stamp = fileStamp(self.filepath)
+        if stamp == self.stamp:
+            return False
+
+        self.stamp = stamp
+        self.chunk = None
+        self.error = None
+        commands = []
+        p = Parser(self.filepath)
+        try:
+            while p.advance():
+                commands.append((p.commandType, p.command, p.arg1, p.arg2,
+                    p.lineNum))
+        except Exception as e: # Most likely a file being edited.
+            self.error = f'{self.filepath.name}:{p.lineNum}: {e}'
+        p.close()
+        self.commands = commands
+        self.renumberable = not any(COUNTED_NAME.match(command[2])
+            for command in commands if command[1] in ('function', 'call',
+                'label', 'goto', 'if-goto'))
+        return True
+
+    # Shifts the numbers of the counted labels of the translation.
+    def renumber(self, count):
+        shift = count - self.start[0]
+        self.chunk = COUNTED_LABEL.sub(
+            lambda m: f'{m[1]}{m[2]}{int(m[3]) + shift}', self.chunk)
+        self.start = (count, self.start[1])
+        self.end = (self.end[0] + shift, self.end[1])
+
+    # The Parser interface, over the parsed commands.
+    def reset(self):
+        self.i = 0
+
+    def advance(self):
+        if self.i == len(self.commands):
+            return False
+        (self.commandType, self.command, self.arg1, self.arg2, self.lineNum
+            ) = self.commands[self.i]
+        self.i = self.i + 1
+        return True
+
+
+# A VM program, a directory of VM files or a single one, translated into
+# {directory}/{directory}.asm or {file}.asm like VMTranslator.py does.
+class VMProgram:
+    def __init__(self, input):
+        self.input = input
+        if input.is_file():
+            self.output = input.with_suffix('.asm')
+        else:
+            self.output = input / (input.name + '.asm')
+        self.files = {}
+
+    # Translates the program again if any of its files changed, was added,
+    # or was removed. Only the changed files are parsed again, and only the
+    # files whose translation doesn't start in the same state as before are
+    # translated again, or renumbered. Returns None if nothing changed, or
+    # else a summary.
+    def build(self):
+        paths = ([self.input] if self.input.is_file()
+            else sorted(self.input.glob('*.vm')))
+        changed = set(paths) != set(self.files) or not self.output.exists()
+        files = []
+        parsed = 0
+        for path in paths:
+            f = self.files.get(path) or VMFile(path)
+            if f.refresh():
+                parsed = parsed + 1
+            files.append(f)
+        self.files = {f.filepath: f for f in files}
+        if parsed == 0 and not changed:
+            return None
+        for f in files:
+            if f.error is not None:
+                raise Exception(f.error)
+
+        t = Translator(self.output)
+        functionName = 'boot'
+        translated = 0
+        renumbered = 0
+        for f in files:
+            start = (t.count, functionName)
+            if (f.chunk is not None and f.start != start and f.renumberable
+                and f.start[1] == functionName
+            ):
+                f.renumber(t.count)
+                renumbered = renumbered + 1
+            if f.chunk is not None and f.start == start:
+                t.file.write(f.chunk)
+                t.count, functionName = f.end
+                t.functions.update(f.functions)
+                continue
+
+            # The file's translation is read back from the translator's
+            # body, and the functions it declares are indexed apart.
+            position = t.file.tell()
+            functions = t.functions
+            t.functions = {}
+            f.reset()
+            functionName = translate(f, t, functionName)
+            f.functions = t.functions
+            t.functions = functions
+            t.functions.update(f.functions)
+            with t.readBody(position) as reader:
+                f.chunk = reader.read()
+            f.start = start
+            f.end = (t.count, functionName)
+            translated = translated + 1
+        t.writeInit()
+        t.close()
+        return (f'{parsed}/{len(files)} files parsed,'
+            + f' {translated} translated, {renumbered} renumbered')
+
+
+# An assembly file, assembled into {file}.hack like assembler.py does. The
+# whole file is assembled again when it changes, since any new label or
+# instruction moves the addresses of the labels after it.
+class AsmProgram:
+    def __init__(self, input):
+        self.input = input
+        self.output = input.with_suffix('.hack')
+        self.stamp = None
+
+    def build(self):
+        stamp = fileStamp(self.input)
+        if stamp == self.stamp and self.output.exists():
+            return None
+        self.stamp = stamp
+        instructions = list(assemble(str(self.input)))
+        with self.output.open('w') as f:
+            for instruction in instructions:
+                f.write(instruction + '\n')
+        return f'{len(instructions)} instructions'
+
+
+# Finds what to build under the given files and directories: every
+# directory holding VM files is a VM program; the assembly files of the other
+# directories are assembled. Returns a list of (kind, path).
+def findTargets(inputs):
+    targets = []
+    for input in inputs:
+        if input.is_file():
+            targets.append((VMProgram if input.suffix == '.vm' else AsmProgram,
+                input))
+            continue
+        directories = [input] + sorted(path for path in input.rglob('*')
+            if path.is_dir())
+        for directory in directories:
+            if any(directory.glob('*.vm')):
+                targets.append((VMProgram, directory))
+            else:
+                targets.extend((AsmProgram, path)
+                    for path in sorted(directory.glob('*.asm')))
+    return targets
+
+
+# Keeps the outputs of the targets under the given files and directories up
+# to date, with every program kept in memory between builds.
+class Watcher:
+    def __init__(self, inputs):
+        self.inputs = [Path(input) for input in inputs]
+        self.programs = {}
+
+    # Builds whatever changed since the last poll, and reports each build
+    # with its latency. Returns the number of builds.
+    def poll(self):
+        programs = {}
+        for kind, path in findTargets(self.inputs):
+            programs[path] = self.programs.get(path) or kind(path)
+        self.programs = programs
+
+        builds = 0
+        for program in programs.values():
+            start = time.perf_counter()
+            try:
+                summary = program.build()
+            except Exception as e:
+                print(f'{program.input}: {e}', flush=True)
+                continue
+            if summary is not None:
+                builds = builds + 1
+                elapsed = (time.perf_counter() - start) * 1000
+                print(f'{program.output}: rebuilt in {elapsed:.1f} ms'
+                    + f' ({summary})', flush=True)
+        return builds
+
+
+# Description: Watches VM programs and assembly files, and rebuilds their
+#              outputs as soon as they change, reporting each rebuild with
+#              its latency. The given files and directories (the current
+#              directory by default) are polled every interval seconds (0.2
+#              by default). Every directory holding .vm files is translated
+#              like VMTranslator.py does; the .asm files of the other
+#              directories are assembled like assembler.py does.
+#              VM files stay parsed in memory with their translations: a
+#              change only parses that file again, and only translates again
+#              the files whose labels or functions it shifts.
+#              With --once, builds everything once and exits.
+# Input: [--interval s] [--once] [{file}.vm|{file}.asm|{directory} ...]
+# Output: {directory}.asm or {file}.asm for VM programs, {file}.hack for
+#         assembly files
+def main():
+    args = sys.argv[1:]
+    interval = 0.2
+    if '--interval' in args:
+        i = args.index('--interval')
+        interval = float(args[i + 1])
+        del args[i:i + 2]
+    once = '--once' in args
+    if once:
+        args.remove('--once')
+
+    if any(arg.startswith('--') for arg in args):
+        print('Usage: python ' + Path(__file__).name
+            + ' [--interval s] [--once] [{file}.vm|{file}.asm|{directory} ...]')
+        return
+
+    watcher = Watcher(args or ['.'])
+    try:
+        watcher.poll()
+        while not once:
+            time.sleep(interval)
+            watcher.poll()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == '__main__':
+    main()